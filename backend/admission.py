@@ -0,0 +1,197 @@
+"""Admission control: rate limits, per-route concurrency and load shedding.
+
+Every route belongs to a priority class (``CHEAP``, ``STATIC`` for media
+downloads, ``DEFAULT``, ``EXPENSIVE``, or ``EXEMPT`` for streams and
+operational endpoints). Before a
+request reaches its handler, ``AdmissionMiddleware``:
+
+1. takes a token from the caller's bucket for that class (keyed by the JWT
+   subject, else the client address); an empty bucket is a 429 with the
+   ``Retry-After`` until the next token;
+2. sheds it with a 503 if the process already holds more than the class's
+   share (``shed_at``) of ``ADMISSION_MAX_IN_FLIGHT`` requests, so expensive
+   work is turned away first and cheap writes like view counts last;
+3. waits for one of the route's ``concurrency`` slots for at most the class's
+   ``queue_seconds``; a request still waiting at its deadline gets a 503
+   rather than joining an unbounded pile of coroutines.
+
+The slot and the in-flight count are given back as soon as the response
+starts: they bound the work a handler does, not how long a slow client takes
+to read a streamed body.
+
+Rejections are plain JSON ``{"detail": ...}`` like ``HTTPException`` and are
+counted in ``http_requests_shed_total{priority,reason}`` on ``/metrics``.
+"""
+import asyncio
+import math
+import os
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional, Sequence
+
+import orjson
+
+from cache import TTLCache
+from metrics import REGISTRY, route_template
+
+ENABLED = os.environ.get('ADMISSION_ENABLED', '1') != '0'
+MAX_IN_FLIGHT = int(os.environ.get('ADMISSION_MAX_IN_FLIGHT', '512'))
+MAX_CLIENTS = int(os.environ.get('ADMISSION_MAX_CLIENTS', '100000'))
+# Behind a proxy (e.g. Railway) the client address comes from X-Forwarded-For. Only the
+# entries our own TRUSTED_PROXY_HOPS proxies appended can be believed, so the client is
+# the right-most one they didn't add; anything further left is whatever the caller sent.
+TRUST_FORWARDED = os.environ.get('TRUST_PROXY_HEADERS', '0') == '1'
+PROXY_HOPS = max(1, int(os.environ.get('TRUSTED_PROXY_HOPS', '1')))
+
+
+@dataclass(frozen=True)
+class Priority:
+    name: str
+    concurrency: int  # per route
+    queue_seconds: float
+    rate: float  # tokens per second, per client
+    burst: float
+    shed_at: float  # fraction of MAX_IN_FLIGHT above which this class is shed
+
+
+def _priority(name: str, concurrency: int, queue_seconds: float, rate: float, burst: float, shed_at: float) -> Priority:
+    env = f"ADMISSION_{name.upper()}_"
+    return Priority(
+        name,
+        int(os.environ.get(env + 'CONCURRENCY', str(concurrency))),
+        float(os.environ.get(env + 'QUEUE_SECONDS', str(queue_seconds))),
+        float(os.environ.get(env + 'RATE', str(rate))),
+        float(os.environ.get(env + 'BURST', str(burst))),
+        shed_at,
+    )
+
+
+CHEAP = _priority("cheap", concurrency=256, queue_seconds=0.5, rate=20, burst=100, shed_at=1.0)
+DEFAULT = _priority("default", concurrency=64, queue_seconds=2, rate=10, burst=50, shed_at=0.9)
+EXPENSIVE = _priority("expensive", concurrency=8, queue_seconds=1, rate=2, burst=20, shed_at=0.6)
+# A feed page loads a dozen images at once, often for a whole office behind one address
+STATIC = _priority("static", concurrency=256, queue_seconds=0.5, rate=100, burst=400, shed_at=1.0)
+EXEMPT = None
+
+SHED = REGISTRY.counter("http_requests_shed_total", "Requests rejected by admission control", ("priority", "reason"))
+
+
+class TokenBuckets:
+    """One bucket per client; idle buckets are full again after ``burst / rate`` and can be forgotten."""
+
+    def __init__(self, priority: Priority):
+        self.priority = priority
+        self._buckets = TTLCache(MAX_CLIENTS, priority.burst / priority.rate)
+
+    def take(self, client: str) -> float:
+        """Spend a token; returns 0 if admitted, else the seconds until one is available."""
+        now = time.monotonic()
+        tokens, last = self._buckets.get(client) or (self.priority.burst, now)
+        tokens = min(self.priority.burst, tokens + (now - last) * self.priority.rate)
+        if tokens < 1:
+            self._buckets.set(client, (tokens, now))
+            return (1 - tokens) / self.priority.rate
+        self._buckets.set(client, (tokens - 1, now))
+        return 0
+
+
+class AdmissionControl:
+    def __init__(self, routes: Sequence, priorities: Dict[str, Optional[Priority]],
+                 identify: Callable[[str], Optional[str]]):
+        """``priorities`` maps route templates to a class (default ``DEFAULT``); ``identify``
+        turns a bearer token into a user id, or None."""
+        self.routes = routes
+        self.priorities = priorities
+        self.identify = identify
+        self._buckets = {p.name: TokenBuckets(p) for p in (CHEAP, STATIC, DEFAULT, EXPENSIVE)}
+        self._slots: Dict[str, asyncio.Semaphore] = {}
+        self.in_flight = 0
+        self.admitted = 0
+        self.shed = {"rate_limited": 0, "overloaded": 0, "timeout": 0}
+
+    def _client(self, scope) -> str:
+        headers = dict(scope["headers"])
+        auth = headers.get(b"authorization", b"").decode("latin-1")
+        if auth[:7].lower() == "bearer ":
+            user_id = self.identify(auth[7:])
+            if user_id:
+                return "user:" + user_id
+        if TRUST_FORWARDED and b"x-forwarded-for" in headers:
+            hops = headers[b"x-forwarded-for"].decode("latin-1").split(",")
+            return hops[max(0, len(hops) - PROXY_HOPS)].strip()
+        return scope["client"][0] if scope.get("client") else "unknown"
+
+    async def _reject(self, send, priority: Priority, reason: str, status: int, detail: str, retry_after: float):
+        self.shed[reason] += 1
+        SHED.inc(priority.name, reason)
+        body = orjson.dumps({"detail": detail})
+        await send({"type": "http.response.start", "status": status, "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", str(max(1, math.ceil(retry_after))).encode()),
+        ]})
+        await send({"type": "http.response.body", "body": body})
+
+    async def __call__(self, app, scope, receive, send):
+        if scope["type"] != "http" or not ENABLED:
+            return await app(scope, receive, send)
+        route = route_template(self.routes, scope)
+        priority = self.priorities.get(route, DEFAULT)
+        if priority is EXEMPT:
+            return await app(scope, receive, send)
+
+        wait = self._buckets[priority.name].take(self._client(scope))
+        if wait:
+            return await self._reject(send, priority, "rate_limited", 429, "Too many requests", wait)
+        if self.in_flight >= MAX_IN_FLIGHT * priority.shed_at:
+            return await self._reject(send, priority, "overloaded", 503, "Server busy, please retry", 1)
+
+        slots = self._slots.get(route)
+        if slots is None:
+            slots = self._slots[route] = asyncio.Semaphore(priority.concurrency)
+        self.in_flight += 1
+        holding_slot = False
+        active = True
+
+        def release():
+            nonlocal holding_slot, active
+            if holding_slot:
+                slots.release()
+                holding_slot = False
+            if active:
+                self.in_flight -= 1
+                active = False
+
+        async def send_and_release(message):
+            if message["type"] == "http.response.start":
+                release()
+            await send(message)
+
+        try:
+            try:
+                await asyncio.wait_for(slots.acquire(), priority.queue_seconds)
+            except asyncio.TimeoutError:
+                return await self._reject(send, priority, "timeout", 503, "Server busy, please retry", 1)
+            holding_slot = True
+            self.admitted += 1
+            await app(scope, receive, send_and_release)
+        finally:
+            release()
+
+    def stats(self) -> dict:
+        return {
+            "enabled": ENABLED,
+            "in_flight": self.in_flight,
+            "max_in_flight": MAX_IN_FLIGHT,
+            "admitted": self.admitted,
+            **{f"shed_{reason}": n for reason, n in self.shed.items()},
+        }
+
+
+class AdmissionMiddleware:
+    def __init__(self, app, control: AdmissionControl):
+        self.app = app
+        self.control = control
+
+    async def __call__(self, scope, receive, send):
+        await self.control(self.app, scope, receive, send)
@@ -0,0 +1,80 @@
+"""Author profiles resolved at read time.
+
+Posts, comments and notifications store only ``user_id`` / ``actor_id``.
+List endpoints return ``{"items": [...], "authors": {id: profile}}``: an
+``AuthorLoader`` (one per request) collects the distinct ids of a page and
+resolves them together through ``ProfileCache``, which is shared by the
+process, so a page costs at most one ``$in`` query on ``users`` and profile
+edits show up everywhere once the cache entry is invalidated or expires.
+"""
+import asyncio
+from typing import Dict, Iterable, List, Optional
+
+from cache import TTLCache
+
+PROFILE_PROJECTION = {"_id": 0, "id": 1, "name": 1, "headline": 1, "avatar": 1}
+
+
+class ProfileCache:
+    def __init__(self, db, cache: TTLCache):
+        self.db = db
+        self.cache = cache
+
+    def invalidate(self, *user_ids: str):
+        self.cache.invalidate(*user_ids)
+
+    async def get_many(self, user_ids: Iterable[str]) -> Dict[str, dict]:
+        found, missing = {}, []
+        for user_id in set(user_ids):
+            profile = self.cache.get(user_id)
+            if profile is None:
+                missing.append(user_id)
+            else:
+                found[user_id] = profile
+        if missing:
+            async for profile in self.db.users.find({"id": {"$in": missing}}, PROFILE_PROJECTION):
+                self.cache.set(profile['id'], profile)
+                found[profile['id']] = profile
+        return found
+
+
+class AuthorLoader:
+    """DataLoader-style batcher: ``load`` calls made in the same tick share one lookup."""
+
+    def __init__(self, profiles: ProfileCache):
+        self.profiles = profiles
+        self._loaded: Dict[str, Optional[dict]] = {}
+        self._pending: Dict[str, asyncio.Future] = {}
+
+    def load(self, user_id: str) -> "asyncio.Future[Optional[dict]]":
+        loop = asyncio.get_running_loop()
+        if user_id in self._loaded:
+            future = loop.create_future()
+            future.set_result(self._loaded[user_id])
+            return future
+        if user_id not in self._pending:
+            if not self._pending:
+                loop.call_soon(lambda: asyncio.ensure_future(self._dispatch()))
+            self._pending[user_id] = loop.create_future()
+        return self._pending[user_id]
+
+    async def _dispatch(self):
+        pending, self._pending = self._pending, {}
+        try:
+            profiles = await self.profiles.get_many(pending)
+        except Exception as exc:
+            for future in pending.values():
+                future.set_exception(exc)
+            return
+        for user_id, future in pending.items():
+            self._loaded[user_id] = profiles.get(user_id)
+            future.set_result(self._loaded[user_id])
+
+    async def load_many(self, user_ids: Iterable[str]) -> Dict[str, dict]:
+        ids = list(dict.fromkeys(i for i in user_ids if i))
+        profiles = await asyncio.gather(*(self.load(i) for i in ids))
+        return {i: p for i, p in zip(ids, profiles) if p is not None}
+
+    async def page(self, items: List[dict], author_field: str = "user_id") -> dict:
+        """Wrap a page of documents with the profiles of their authors."""
+        return {"items": items, "authors": await self.load_many(item[author_field] for item in items)}
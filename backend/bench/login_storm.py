@@ -0,0 +1,112 @@
+"""Feed latency while a burst of logins hits the API.
+
+Creates ``--accounts`` users (idempotent), measures ``GET /api/posts/all``
+latency on its own, then again while ``--storm`` concurrent clients log in as
+fast as they can, and prints p50/p95/p99 for both phases. Run it against a
+server started with admission control off, otherwise the per-address rate
+limits throttle the sampler and cut the storm down to the login rate limit
+instead of measuring bcrypt contention:
+
+    ADMISSION_ENABLED=0 uvicorn server:app
+    python bench/login_storm.py --base-url http://localhost:8000 --storm 50
+
+Feed requests that are rejected anyway (429/503) are counted and reported
+rather than timed.
+
+With hashing on the event loop, feed p99 during the storm tracks the bcrypt
+cost times the login concurrency; with the worker pool it should stay close to
+the baseline while excess logins get 503s.
+"""
+import argparse
+import asyncio
+import time
+from collections import Counter
+from typing import List
+
+import httpx
+
+from stats import format_stats, percentiles
+
+PASSWORD = "bench-password"
+
+
+def report(label: str, samples: List[float]):
+    print(f"{label:<14} " + format_stats(percentiles([s * 1000 for s in samples])))
+
+
+async def ensure_accounts(client: httpx.AsyncClient, count: int) -> List[str]:
+    emails = [f"bench-login-{i}@example.com" for i in range(count)]
+    for email in emails:
+        r = await client.post("/api/auth/signup", json={"name": "Bench User", "email": email, "password": PASSWORD})
+        if r.status_code not in (200, 400):
+            r.raise_for_status()
+    return emails
+
+
+async def sample_feed(client: httpx.AsyncClient, stop: asyncio.Event, samples: List[float], interval: float,
+                      rejected: Counter):
+    while not stop.is_set():
+        started = time.perf_counter()
+        r = await client.get("/api/posts/all")
+        if r.status_code in (429, 503):
+            rejected[r.status_code] += 1
+        else:
+            r.raise_for_status()
+            samples.append(time.perf_counter() - started)
+        await asyncio.sleep(interval)
+
+
+async def login_loop(client: httpx.AsyncClient, emails: List[str], offset: int, stop: asyncio.Event,
+                     statuses: Counter):
+    i = offset
+    while not stop.is_set():
+        r = await client.post("/api/auth/login", json={"email": emails[i % len(emails)], "password": PASSWORD})
+        statuses[r.status_code] += 1
+        i += 1
+
+
+async def run(args):
+    limits = httpx.Limits(max_connections=args.storm + 10)
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=60, limits=limits) as client:
+        emails = await ensure_accounts(client, args.accounts)
+
+        baseline: List[float] = []
+        baseline_rejected: Counter = Counter()
+        stop = asyncio.Event()
+        sampler = asyncio.create_task(sample_feed(client, stop, baseline, args.interval, baseline_rejected))
+        await asyncio.sleep(args.duration)
+        stop.set()
+        await sampler
+
+        storm: List[float] = []
+        storm_rejected: Counter = Counter()
+        statuses: Counter = Counter()
+        stop = asyncio.Event()
+        tasks = [asyncio.create_task(login_loop(client, emails, i, stop, statuses)) for i in range(args.storm)]
+        sampler = asyncio.create_task(sample_feed(client, stop, storm, args.interval, storm_rejected))
+        await asyncio.sleep(args.duration)
+        stop.set()
+        await asyncio.gather(sampler, *tasks)
+
+    print("feed latency (ms)")
+    report("baseline", baseline)
+    report(f"{args.storm} logins", storm)
+    for label, rejected in (("baseline", baseline_rejected), ("storm", storm_rejected)):
+        if rejected:
+            print(f"feed rejected during {label}: " + ", ".join(f"{code}={n}" for code, n in sorted(rejected.items()))
+                  + " (is ADMISSION_ENABLED=0 set on the server?)")
+    print("login responses: " + ", ".join(f"{code}={n}" for code, n in sorted(statuses.items())))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--accounts", type=int, default=20)
+    parser.add_argument("--storm", type=int, default=50, help="concurrent login clients")
+    parser.add_argument("--duration", type=float, default=10, help="seconds per phase")
+    parser.add_argument("--interval", type=float, default=0.05, help="pause between feed requests")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,14 @@
+"""Latency summaries shared by the benchmark scripts."""
+import statistics
+from typing import List
+
+
+def percentiles(samples: List[float]) -> dict:
+    if len(samples) < 2:
+        return {"n": len(samples)}
+    cuts = statistics.quantiles(samples, n=100, method="inclusive")
+    return {"n": len(samples), "p50": cuts[49], "p95": cuts[94], "p99": cuts[98], "max": max(samples)}
+
+
+def format_stats(stats: dict) -> str:
+    return "  ".join(f"{k}={v:.1f}" if k != "n" else f"n={v}" for k, v in stats.items())
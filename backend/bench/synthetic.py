@@ -0,0 +1,287 @@
+"""Seed a MongoDB database with a reproducible synthetic social network.
+
+Writes documents in the same shapes the API does, then builds the derived
+collections (home timelines, search postings, trending scores) with the
+backend's own code. Everything is driven by one ``random.Random(--seed)``, so
+the same arguments always produce the same data set:
+
+    python bench/synthetic.py --db-name careerpulse_bench --users 2000
+
+* follows: every user follows a Pareto-distributed number of accounts, picked
+  with Zipf weights over a popularity ranking, so in-degree is power-law;
+* posts: authors are picked by Zipf-weighted activity, carry 0-3 hashtags from
+  a Zipf-weighted vocabulary and are spread over ``--days``;
+* reactions and comments favour posts of popular authors; each one also
+  produces the notification the API would have written.
+
+The target database is dropped first, so its name must contain "bench". Every
+account's password is ``PASSWORD``; ``bench/workload.py`` logs in with them.
+"""
+import argparse
+import asyncio
+import bisect
+import itertools
+import logging
+import random
+import sys
+import time
+import uuid
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Dict, List, Sequence, Tuple
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from indexes import ensure_indexes  # noqa: E402
+from passwords import pwd_context  # noqa: E402
+from reactions import REACTION_TYPES  # noqa: E402
+from search import SearchIndex  # noqa: E402
+from timeline import FANOUT_THRESHOLD, _entry  # noqa: E402
+from trending import TrendingEngine  # noqa: E402
+
+logger = logging.getLogger(__name__)
+
+PASSWORD = "bench-password"
+WRITE_BATCH_SIZE = 5000
+
+WORDS = (
+    "shipping release team hiring launch product design engineering data platform growth "
+    "customers roadmap learning conference talk mentoring remote startup funding career "
+    "interview python rust kubernetes cloud security analytics marketing sales leadership"
+).split()
+HASHTAGS = (
+    "#python #ai #ml #hiring #career #startup #remote #devops #cloud #security #design #product "
+    "#data #leadership #opensource #rust #golang #javascript #react #kubernetes #marketing "
+    "#sales #fintech #healthtech #climate #web3 #networking #mentorship #productivity #ux"
+).split()
+
+
+def user_email(i: int) -> str:
+    return f"bench-user-{i}@example.com"
+
+
+def zipf_weights(n: int, alpha: float) -> List[float]:
+    """Cumulative Zipf weights for ranks ``0..n-1`` (for ``random.choices(cum_weights=...)``)."""
+    return list(itertools.accumulate(1 / (rank + 1) ** alpha for rank in range(n)))
+
+
+class Generator:
+    def __init__(self, args):
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.now = datetime.now(timezone.utc).replace(microsecond=0)
+
+    def _id(self) -> str:
+        return str(uuid.UUID(int=self.rng.getrandbits(128), version=4))
+
+    def _when(self, after: datetime) -> datetime:
+        span = max((self.now - after).total_seconds(), 1)
+        return after + timedelta(seconds=self.rng.random() * span)
+
+    def _ranked(self, ids: Sequence[str]) -> Tuple[List[str], List[float]]:
+        """``ids`` in a random popularity order with their cumulative Zipf weights."""
+        ranked = list(ids)
+        self.rng.shuffle(ranked)
+        return ranked, zipf_weights(len(ranked), self.args.alpha)
+
+    def users(self) -> List[dict]:
+        password = pwd_context.hash(PASSWORD)
+        start = self.now - timedelta(days=self.args.days * 2)
+        return [{
+            "id": self._id(),
+            "name": f"Bench User {i}",
+            "email": user_email(i),
+            "password": password,
+            "headline": self.rng.choice(WORDS).capitalize() + " at Example",
+            "bio": "",
+            "avatar": "",
+            "cover_image": "",
+            "location": "",
+            "website": "",
+            "followers_count": 0,
+            "following_count": 0,
+            "unread_notifications": 0,
+            "created_at": self._when(start),
+        } for i in range(self.args.users)]
+
+    def follows(self, users: List[dict]) -> List[dict]:
+        ranked, weights = self._ranked([u['id'] for u in users])
+        edges = []
+        for user in users:
+            want = min(len(users) - 1, int(self.rng.paretovariate(1.5) * self.args.min_follows))
+            targets = dict.fromkeys(self.rng.choices(ranked, cum_weights=weights, k=want * 2))
+            targets.pop(user['id'], None)
+            for followee in list(targets)[:want]:
+                edges.append({"follower_id": user['id'], "followee_id": followee,
+                              "created_at": self._when(user['created_at'])})
+        return edges
+
+    def posts(self, users: List[dict]) -> List[dict]:
+        by_id = {u['id']: u for u in users}
+        ranked, weights = self._ranked(list(by_id))
+        tag_weights = zipf_weights(len(HASHTAGS), self.args.alpha)
+        posts = []
+        for author in self.rng.choices(ranked, cum_weights=weights, k=self.args.users * self.args.posts_per_user):
+            tags = list(dict.fromkeys(self.rng.choices(HASHTAGS, cum_weights=tag_weights, k=self.rng.randint(0, 3))))
+            content = " ".join(self.rng.choices(WORDS, k=self.rng.randint(8, 40)) + tags).capitalize()
+            posts.append({
+                "id": self._id(),
+                "user_id": author,
+                "content": content,
+                "image": None,
+                "hashtags": tags,
+                "reaction_counts": {},
+                "views": 0,
+                "comment_count": 0,
+                "created_at": self._when(max(by_id[author]['created_at'], self.now - timedelta(days=self.args.days))),
+            })
+        return posts
+
+    def _post_picker(self, users: List[dict], posts: List[dict]):
+        """Pick posts weighted by their author's follower count."""
+        followers = {u['id']: u['followers_count'] for u in users}
+        weights = list(itertools.accumulate(1 + followers[p['user_id']] for p in posts))
+        return lambda: posts[bisect.bisect_left(weights, self.rng.random() * weights[-1])]
+
+    def engagement(self, users: List[dict], posts: List[dict]) -> Tuple[List[dict], List[dict], List[dict]]:
+        """Reactions, comments and the notifications they triggered."""
+        names = {u['id']: u['name'] for u in users}
+        ids = list(names)
+        pick = self._post_picker(users, posts)
+        reactions: Dict[Tuple[str, str], dict] = {}
+        comments, notifications = [], []
+
+        def notify(post: dict, actor_id: str, kind: str, verb: str, at: datetime):
+            if actor_id != post['user_id']:
+                notifications.append({
+                    "id": self._id(), "user_id": post['user_id'], "type": kind, "actor_id": actor_id,
+                    "post_id": post['id'], "message": f"{names[actor_id]} {verb}", "actor_count": 1,
+                    "read": at < self.now - timedelta(days=2), "created_at": at,
+                })
+
+        for _ in range(int(len(posts) * self.args.reactions_per_post)):
+            post, user_id = pick(), self.rng.choice(ids)
+            if (post['id'], user_id) in reactions:
+                continue
+            at = self._when(post['created_at'])
+            reaction_type = self.rng.choice(REACTION_TYPES)
+            reactions[(post['id'], user_id)] = {"post_id": post['id'], "user_id": user_id,
+                                                "type": reaction_type, "created_at": at}
+            post['reaction_counts'][reaction_type] = post['reaction_counts'].get(reaction_type, 0) + 1
+            post['views'] += self.rng.randint(3, 20)
+            notify(post, user_id, "reaction", "reacted to your post", at)
+
+        for _ in range(int(len(posts) * self.args.comments_per_post)):
+            post, user_id = pick(), self.rng.choice(ids)
+            at = self._when(post['created_at'])
+            comments.append({"id": self._id(), "post_id": post['id'], "user_id": user_id,
+                             "content": " ".join(self.rng.choices(WORDS, k=self.rng.randint(3, 15))),
+                             "created_at": at})
+            post['comment_count'] += 1
+            notify(post, user_id, "comment", "commented on your post", at)
+        return list(reactions.values()), comments, notifications
+
+
+async def insert(db, collection: str, docs: List[dict]):
+    for i in range(0, len(docs), WRITE_BATCH_SIZE):
+        await db[collection].insert_many(docs[i:i + WRITE_BATCH_SIZE], ordered=False)
+
+
+async def seed(db, args) -> dict:
+    gen = Generator(args)
+    started = time.perf_counter()
+
+    users = gen.users()
+    follows = gen.follows(users)
+    degree = {"followers_count": Counter(e['followee_id'] for e in follows),
+              "following_count": Counter(e['follower_id'] for e in follows)}
+    for user in users:
+        for field, counts in degree.items():
+            user[field] = counts[user['id']]
+    names = {u['id']: u['name'] for u in users}
+    follow_notifications = [{
+        "id": gen._id(), "user_id": e['followee_id'], "type": "follow", "actor_id": e['follower_id'],
+        "post_id": None, "message": f"{names[e['follower_id']]} started following you", "actor_count": 1,
+        "read": e['created_at'] < gen.now - timedelta(days=2), "created_at": e['created_at'],
+    } for e in follows]
+
+    posts = gen.posts(users)
+    reactions, comments, notifications = gen.engagement(users, posts)
+    notifications += follow_notifications
+    for n in notifications:
+        if n['read']:
+            n['read_at'] = gen.now
+    unread = Counter(n['user_id'] for n in notifications if not n['read'])
+
+    # Home timelines the way fan_out writes them, with big authors on the pull path.
+    followers_of = defaultdict(list)
+    for e in follows:
+        followers_of[e['followee_id']].append(e['follower_id'])
+    pull = {u['id'] for u in users if u['followers_count'] > FANOUT_THRESHOLD}
+    timelines = []
+    for post in posts:
+        timelines.append(_entry(post['user_id'], post))
+        if post['user_id'] not in pull:
+            timelines.extend(_entry(f, post) for f in followers_of[post['user_id']])
+
+    for user in users:
+        user['unread_notifications'] = unread[user['id']]
+        if user['id'] in pull:
+            user['timeline_pull'] = True
+
+    await ensure_indexes(db)
+    for collection, docs in (("users", users), ("follows", follows), ("posts", posts), ("reactions", reactions),
+                             ("comments", comments), ("notifications", notifications), ("timelines", timelines)):
+        await insert(db, collection, docs)
+        logger.info("Inserted %d %s", len(docs), collection)
+    await SearchIndex(db).rebuild()
+    await TrendingEngine(db).rebuild()
+
+    manifest = {
+        "seed": args.seed,
+        "users": len(users),
+        "follows": len(follows),
+        "max_followers": max(degree['followers_count'].values(), default=0),
+        "posts": len(posts),
+        "reactions": len(reactions),
+        "comments": len(comments),
+        "notifications": len(notifications),
+        "timeline_entries": len(timelines),
+        "seconds": round(time.perf_counter() - started, 1),
+    }
+    await db.bench_meta.replace_one({"_id": "dataset"}, {**manifest, "args": vars(args)}, upsert=True)
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mongo-url", default="mongodb://localhost:27017")
+    parser.add_argument("--db-name", default="careerpulse_bench")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--min-follows", type=int, default=5, help="scale of the Pareto out-degree")
+    parser.add_argument("--alpha", type=float, default=1.1, help="Zipf exponent for popularity and hashtags")
+    parser.add_argument("--posts-per-user", type=int, default=5)
+    parser.add_argument("--reactions-per-post", type=float, default=4)
+    parser.add_argument("--comments-per-post", type=float, default=1)
+    parser.add_argument("--days", type=int, default=30, help="posts are spread over this many days")
+    args = parser.parse_args()
+    if "bench" not in args.db_name:
+        parser.error("--db-name must contain 'bench'; the database is dropped before seeding")
+    logging.basicConfig(level=logging.INFO)
+
+    async def run():
+        client = AsyncIOMotorClient(args.mongo_url, tz_aware=True)
+        await client.drop_database(args.db_name)
+        manifest = await seed(client[args.db_name], args)
+        client.close()
+        for key, value in manifest.items():
+            print(f"{key:<18} {value}")
+
+    asyncio.run(run())
+
+
+if __name__ == '__main__':
+    main()
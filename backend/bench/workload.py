@@ -0,0 +1,233 @@
+"""Mixed-workload load test against a running API.
+
+Seed a database with ``bench/synthetic.py``, start the API on it
+(``DB_NAME=careerpulse_bench uvicorn server:app``), then:
+
+    python bench/workload.py --clients 20 --duration 60
+    python bench/workload.py --baseline bench/results/<earlier run>.json
+
+Each client logs in as a random seeded user and loops over weighted actions
+(``--mix``): scrolling the home feed through its cursors, browsing all posts,
+posting, reacting, commenting, searching and polling notifications. Latency is
+recorded per route after ``--warmup`` seconds; the run prints throughput and
+p50/p95/p99 per route and writes them, with the configuration and git commit,
+to a JSON file. With ``--baseline`` it also compares against an earlier run
+and exits non-zero if any route's p95 or the overall throughput regressed by
+more than ``--tolerance``.
+"""
+import argparse
+import asyncio
+import json
+import random
+import subprocess
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import httpx
+
+from stats import format_stats, percentiles
+from synthetic import HASHTAGS, PASSWORD, REACTION_TYPES, WORDS, user_email
+
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+DEFAULT_MIX = "feed=40,explore=10,post=5,react=15,comment=5,search=10,notifications=15"
+FEED_PAGES = 3
+
+
+class Recorder:
+    def __init__(self, record_after: float):
+        self.record_after = record_after
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+
+    async def request(self, client: httpx.AsyncClient, route: str, method: str, url: str, **kwargs) -> httpx.Response:
+        started = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+            failed = response.status_code >= 400
+        except httpx.HTTPError:
+            response, failed = None, True
+        if started >= self.record_after:
+            self.latencies[route].append(time.perf_counter() - started)
+            if failed:
+                self.errors[route] += 1
+        return response
+
+
+class Session:
+    """One simulated user: a logged-in client and the post ids it has seen."""
+
+    def __init__(self, client: httpx.AsyncClient, recorder: Recorder, rng: random.Random):
+        self.client = client
+        self.rec = recorder
+        self.rng = rng
+        self.seen: List[str] = []
+
+    def _remember(self, response: Optional[httpx.Response]):
+        if response is not None and response.status_code == 200:
+            self.seen = ([p['id'] for p in response.json()['items']] + self.seen)[:100]
+
+    async def feed(self):
+        cursor = None
+        for _ in range(self.rng.randint(1, FEED_PAGES)):
+            r = await self.rec.request(self.client, "GET /api/posts", "GET", "/api/posts",
+                                       params={"cursor": cursor} if cursor else None)
+            self._remember(r)
+            cursor = r.headers.get("X-Next-Cursor") if r is not None else None
+            if not cursor:
+                break
+
+    async def explore(self):
+        self._remember(await self.rec.request(self.client, "GET /api/posts/all", "GET", "/api/posts/all"))
+
+    async def post(self):
+        content = " ".join(self.rng.choices(WORDS, k=self.rng.randint(8, 30)) + self.rng.sample(HASHTAGS, 2))
+        await self.rec.request(self.client, "POST /api/posts", "POST", "/api/posts", json={"content": content})
+
+    async def react(self):
+        if not self.seen:
+            return await self.explore()
+        await self.rec.request(self.client, "POST /api/posts/{id}/react", "POST",
+                               f"/api/posts/{self.rng.choice(self.seen)}/react",
+                               params={"reaction_type": self.rng.choice(REACTION_TYPES)})
+
+    async def comment(self):
+        if not self.seen:
+            return await self.explore()
+        post_id = self.rng.choice(self.seen)
+        await self.rec.request(self.client, "GET /api/posts/{id}/comments", "GET", f"/api/posts/{post_id}/comments")
+        await self.rec.request(self.client, "POST /api/posts/{id}/comments", "POST", f"/api/posts/{post_id}/comments",
+                               json={"content": " ".join(self.rng.choices(WORDS, k=6))})
+
+    async def search(self):
+        q = self.rng.choice(HASHTAGS)[1:] if self.rng.random() < 0.5 else self.rng.choice(WORDS)[:4]
+        self._remember(await self.rec.request(self.client, "GET /api/posts/search", "GET", "/api/posts/search",
+                                              params={"q": q}))
+
+    async def notifications(self):
+        await self.rec.request(self.client, "GET /api/notifications/unread/count", "GET",
+                               "/api/notifications/unread/count")
+        await self.rec.request(self.client, "GET /api/notifications", "GET", "/api/notifications")
+
+
+def parse_mix(mix: str) -> Dict[str, float]:
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        if not hasattr(Session, name.strip()):
+            raise argparse.ArgumentTypeError(f"unknown action {name!r}")
+        weights[name.strip()] = float(weight)
+    return weights
+
+
+async def login(client: httpx.AsyncClient, rng: random.Random, users: int) -> str:
+    for _ in range(10):
+        r = await client.post("/api/auth/login", json={"email": user_email(rng.randrange(users)), "password": PASSWORD})
+        if r.status_code == 200:
+            return r.json()['token']
+        await asyncio.sleep(0.5)  # 503 while the password pool is saturated
+    r.raise_for_status()
+
+
+async def client_loop(args, index: int, recorder: Recorder, deadline: float, mix: Dict[str, float]):
+    rng = random.Random(args.seed * 1000 + index)
+    actions, weights = list(mix), list(mix.values())
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=30) as client:
+        token = await login(client, rng, args.users)
+        client.headers["Authorization"] = f"Bearer {token}"
+        session = Session(client, recorder, rng)
+        while time.perf_counter() < deadline:
+            await getattr(session, rng.choices(actions, weights)[0])()
+            if args.think:
+                await asyncio.sleep(rng.expovariate(1 / args.think))
+
+
+def summarize(recorder: Recorder, seconds: float) -> dict:
+    routes = {}
+    for route, samples in sorted(recorder.latencies.items()):
+        stats = percentiles([s * 1000 for s in samples])
+        routes[route] = {**stats, "errors": recorder.errors[route], "rps": round(len(samples) / seconds, 2)}
+    total = sum(len(s) for s in recorder.latencies.values())
+    return {
+        "routes": routes,
+        "total": {"requests": total, "errors": sum(recorder.errors.values()), "rps": round(total / seconds, 2)},
+    }
+
+
+def compare(current: dict, baseline: dict, tolerance: float) -> bool:
+    """Print the change against ``baseline``; returns False on a regression beyond ``tolerance``."""
+    ok = True
+    print(f"\nvs baseline {baseline.get('started_at')} ({baseline.get('git_commit') or 'unknown commit'})")
+    for route, now in current['routes'].items():
+        before = baseline['routes'].get(route)
+        if not before or 'p95' not in now or 'p95' not in before:
+            continue
+        change = now['p95'] / before['p95'] - 1
+        regressed = change > tolerance
+        ok = ok and not regressed
+        print(f"{'REGRESSED' if regressed else 'ok':<10} {route:<36} p95 {before['p95']:.1f} -> {now['p95']:.1f} ms "
+              f"({change:+.0%})")
+    change = current['total']['rps'] / max(baseline['total']['rps'], 1e-9) - 1
+    regressed = change < -tolerance
+    ok = ok and not regressed
+    print(f"{'REGRESSED' if regressed else 'ok':<10} {'throughput':<36} {baseline['total']['rps']} -> "
+          f"{current['total']['rps']} req/s ({change:+.0%})")
+    return ok
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=Path(__file__).parent, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run(args) -> bool:
+    started_at = datetime.now(timezone.utc)
+    start = time.perf_counter()
+    recorder = Recorder(start + args.warmup)
+    deadline = start + args.warmup + args.duration
+    await asyncio.gather(*(client_loop(args, i, recorder, deadline, args.mix) for i in range(args.clients)))
+    result = {
+        "started_at": started_at.isoformat(),
+        "git_commit": git_commit(),
+        "config": {**vars(args), "baseline": None, "out": None},
+        **summarize(recorder, args.duration),
+    }
+
+    for route, stats in result['routes'].items():
+        print(f"{route:<36} rps={stats['rps']:<8} errors={stats['errors']:<5} "
+              + format_stats({k: v for k, v in stats.items() if k not in ("rps", "errors")}))
+    print(f"{'total':<36} rps={result['total']['rps']:<8} errors={result['total']['errors']}")
+
+    out = Path(args.out) if args.out else RESULTS_DIR / f"workload-{started_at:%Y%m%dT%H%M%SZ}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(result, indent=2))
+    print(f"\nwrote {out}")
+
+    if args.baseline:
+        return compare(result, json.loads(Path(args.baseline).read_text()), args.tolerance)
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--users", type=int, default=2000, help="seeded accounts to log in as")
+    parser.add_argument("--clients", type=int, default=20, help="concurrent simulated users")
+    parser.add_argument("--duration", type=float, default=60, help="measured seconds")
+    parser.add_argument("--warmup", type=float, default=5, help="unmeasured seconds before the run")
+    parser.add_argument("--think", type=float, default=0, help="mean pause between actions, in seconds")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix(DEFAULT_MIX), help=f"default: {DEFAULT_MIX}")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", help="result file (default: bench/results/workload-<time>.json)")
+    parser.add_argument("--baseline", help="earlier result file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed p95/throughput regression")
+    raise SystemExit(0 if asyncio.run(run(parser.parse_args())) else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""Bookmarks stored as one document per saved post.
+
+``db.bookmarks`` holds ``{user_id, post_id, created_at}`` with a unique index
+on the pair, so a toggle is a single delete-or-insert that can't lose a
+concurrent update, and a user's list is read newest-saved first through
+keyset cursors on ``(created_at, post_id)``. The page is one aggregation that
+joins each bookmark to its post and drops bookmarks whose post is gone.
+"""
+from datetime import datetime, timezone
+from typing import List, Optional, Set
+
+from pymongo.errors import DuplicateKeyError
+
+from pagination import Cursor, keyset_query, keyset_sort
+
+
+class BookmarkStore:
+    def __init__(self, db):
+        self.db = db
+
+    async def add(self, user_id: str, post_id: str) -> bool:
+        """Save ``post_id``; returns False if it already was."""
+        try:
+            await self.db.bookmarks.insert_one({
+                "user_id": user_id,
+                "post_id": post_id,
+                "created_at": datetime.now(timezone.utc),
+            })
+        except DuplicateKeyError:
+            return False
+        return True
+
+    async def remove(self, user_id: str, post_id: str) -> bool:
+        """Unsave ``post_id``; returns False if it wasn't saved."""
+        result = await self.db.bookmarks.delete_one({"user_id": user_id, "post_id": post_id})
+        return result.deleted_count > 0
+
+    async def toggle(self, user_id: str, post_id: str) -> bool:
+        """Flip the bookmark; returns whether the post is now saved."""
+        if await self.remove(user_id, post_id):
+            return False
+        await self.add(user_id, post_id)
+        return True
+
+    async def mine(self, user_id: str, post_ids: List[str]) -> Set[str]:
+        docs = await self.db.bookmarks.find(
+            {"user_id": user_id, "post_id": {"$in": post_ids}}, {"_id": 0, "post_id": 1}
+        ).to_list(len(post_ids))
+        return {d['post_id'] for d in docs}
+
+    async def attach_mine(self, posts: List[dict], user_id: Optional[str]) -> List[dict]:
+        """Set ``bookmarked`` on each post for the requesting user (False when anonymous)."""
+        mine = await self.mine(user_id, [p['id'] for p in posts]) if user_id and posts else set()
+        for post in posts:
+            post['bookmarked'] = post['id'] in mine
+        return posts
+
+    async def page(self, user_id: str, after: Optional[Cursor], limit: int) -> List[dict]:
+        """Up to ``limit + 1`` ``{post_id, created_at, post}`` rows, most recently saved first.
+
+        ``created_at`` is when the bookmark was made, so pass ``id_field="post_id"``
+        to ``finish_page``.
+        """
+        return await self.db.bookmarks.aggregate([
+            {"$match": keyset_query({"user_id": user_id}, after, id_field="post_id")},
+            {"$sort": dict(keyset_sort(id_field="post_id"))},
+            {"$lookup": {"from": "posts", "localField": "post_id", "foreignField": "id", "as": "post"}},
+            {"$unwind": "$post"},  # drops bookmarks of deleted posts
+            {"$limit": limit + 1},
+            {"$project": {"_id": 0, "post_id": 1, "created_at": 1, "post": 1}},
+            {"$project": {"post._id": 0}},
+        ]).to_list(limit + 1)
@@ -0,0 +1,92 @@
+"""Cascades and sweeps that remove documents pointing at deleted posts.
+
+Deleting a post removes only the post itself inside the request and enqueues a
+``delete_post`` job; the runner then clears everything in ``POST_REFERENCES``
+in throttled batches. ``sweep`` runs every ``CLEANUP_SWEEP_SECONDS`` and
+catches references the cascade never saw (posts deleted before it existed, or
+a comment/reaction/bookmark that raced the delete): it walks the distinct
+post ids of each collection and deletes the ones with no post.
+
+Unread notifications are counted per recipient before they are deleted and
+taken off ``users.unread_notifications``, so badges don't stay stuck on
+notifications that no longer exist.
+"""
+import asyncio
+import logging
+import os
+from typing import List
+
+from jobs import BATCH_PAUSE, BATCH_SIZE, JobRunner
+from retention import subtract_unread
+
+logger = logging.getLogger(__name__)
+
+SWEEP_SECONDS = float(os.environ.get('CLEANUP_SWEEP_SECONDS', str(6 * 3600)))
+
+# collection -> (field holding the post id, extra filter)
+POST_REFERENCES = {
+    "comments": ("post_id", {}),
+    "reactions": ("post_id", {}),
+    "bookmarks": ("post_id", {}),
+    "notifications": ("post_id", {}),
+    "timelines": ("post_id", {}),
+    "search_postings": ("doc_id", {"kind": "post"}),
+}
+
+
+async def _delete_references(runner: JobRunner, job: dict, collection: str, post_id: str) -> int:
+    field, extra = POST_REFERENCES[collection]
+    query = {**extra, field: post_id}
+    if collection == "notifications":
+        unread = {row['_id']: row['n'] async for row in runner.db.notifications.aggregate([
+            {"$match": {**query, "read": False}},
+            {"$group": {"_id": "$user_id", "n": {"$sum": 1}}},
+        ])}
+        deleted = await runner.delete_in_batches(job, collection, query)
+        await subtract_unread(runner.db, unread)
+        return deleted
+    return await runner.delete_in_batches(job, collection, query)
+
+
+async def delete_post(runner: JobRunner, job: dict, post_id: str):
+    for collection in POST_REFERENCES:
+        await _delete_references(runner, job, collection, post_id)
+
+
+async def _missing_posts(db, post_ids: List[str]) -> List[str]:
+    found = {p['id'] async for p in db.posts.find({"id": {"$in": post_ids}}, {"_id": 0, "id": 1})}
+    return [i for i in post_ids if i not in found]
+
+
+async def _purge(runner: JobRunner, job: dict, collection: str, post_ids: List[str]) -> int:
+    removed = 0
+    for post_id in await _missing_posts(runner.db, post_ids):
+        removed += await _delete_references(runner, job, collection, post_id)
+    return removed
+
+
+async def sweep(runner: JobRunner, job: dict):
+    for collection, (field, extra) in POST_REFERENCES.items():
+        removed = 0
+        chunk: List[str] = []
+        # Sorting on the indexed field lets MongoDB answer the $group with a distinct scan.
+        async for row in runner.db[collection].aggregate([
+            {"$match": {**extra, field: {"$type": "string"}}},
+            {"$sort": {field: 1}},
+            {"$group": {"_id": f"${field}"}},
+        ]):
+            chunk.append(row['_id'])
+            if len(chunk) >= BATCH_SIZE:
+                removed += await _purge(runner, job, collection, chunk)
+                chunk = []
+                await runner.renew(job)
+                await asyncio.sleep(BATCH_PAUSE)
+        if chunk:
+            removed += await _purge(runner, job, collection, chunk)
+        if removed:
+            logger.info("Sweep removed %d dangling %s", removed, collection)
+
+
+def register(runner: JobRunner):
+    runner.register("delete_post", delete_post)
+    runner.register("sweep", sweep, every=SWEEP_SECONDS)
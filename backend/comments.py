@@ -0,0 +1,63 @@
+"""Comments with a denormalized per-post count.
+
+``posts.comment_count`` is kept in step with ``$inc`` whenever a comment is
+inserted or actually deleted, so feeds show "N comments" without touching
+``db.comments``. Comments are read a page at a time through keyset cursors,
+oldest first for a thread or newest first for the short preview shown on feed
+cards (``latest``), both served by the ``(post_id, created_at, id)`` index.
+The previews for a whole feed page come from one aggregation that keeps the
+newest few comments per post with ``$topN`` (MongoDB 5.2+).
+"""
+from typing import Dict, List, Optional
+
+from pagination import Cursor, fetch_page
+
+MAX_PREVIEW = 3
+
+
+class CommentStore:
+    def __init__(self, db):
+        self.db = db
+
+    async def _inc(self, post_id: str, delta: int) -> bool:
+        result = await self.db.posts.update_one({"id": post_id}, {"$inc": {"comment_count": delta}})
+        return result.matched_count > 0
+
+    async def add(self, comment: dict) -> bool:
+        """Insert ``comment`` and count it; returns False if its post was deleted meanwhile."""
+        await self.db.comments.insert_one(comment)
+        if await self._inc(comment['post_id'], 1):
+            return True
+        await self.db.comments.delete_one({"id": comment['id']})
+        return False
+
+    async def remove(self, comment: dict) -> bool:
+        """Delete ``comment``; returns False if someone else already did."""
+        result = await self.db.comments.delete_one({"id": comment['id']})
+        if not result.deleted_count:
+            return False
+        await self._inc(comment['post_id'], -1)
+        return True
+
+    async def page(self, post_id: str, after: Optional[Cursor], limit: int, latest: bool = False) -> List[dict]:
+        """Up to ``limit + 1`` comments of ``post_id``, oldest first (newest first when ``latest``)."""
+        return await fetch_page(self.db.comments, {"post_id": post_id}, after, limit, ascending=not latest)
+
+    async def attach_latest(self, posts: List[dict], count: int) -> List[dict]:
+        """Set ``latest_comments`` (newest first) on each post; returns every comment attached."""
+        if not count:
+            return []
+        commented = [p['id'] for p in posts if p.get('comment_count')]
+        latest: Dict[str, List[dict]] = {}
+        if commented:
+            async for row in self.db.comments.aggregate([
+                {"$match": {"post_id": {"$in": commented}}},
+                {"$project": {"_id": 0}},
+                {"$group": {"_id": "$post_id", "comments": {"$topN": {
+                    "n": count, "sortBy": {"created_at": -1, "id": -1}, "output": "$$ROOT",
+                }}}},
+            ]):
+                latest[row['_id']] = row['comments']
+        for post in posts:
+            post['latest_comments'] = latest.get(post['id'], [])
+        return [c for comments in latest.values() for c in comments]
@@ -0,0 +1,89 @@
+"""Follow graph stored as one edge document per relationship.
+
+``db.follows`` holds ``{follower_id, followee_id, created_at}`` with a unique
+index on the pair, and ``users.followers_count`` / ``users.following_count``
+are kept in step with ``$inc``. The counters only move when the edge insert or
+delete actually happened, so a repeated or concurrent follow/unfollow is a
+no-op and each call costs the same whatever the size of either account.
+"""
+from datetime import datetime, timezone
+from typing import AsyncIterator, List, Optional
+
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+from pagination import Cursor, fetch_page, keyset_query, keyset_sort
+
+# list -> (field matched on the edge, field holding the listed user)
+DIRECTIONS = {
+    "followers": ("followee_id", "follower_id"),
+    "following": ("follower_id", "followee_id"),
+}
+
+
+async def follower_id_batches(db, user_id: str, size: int) -> AsyncIterator[List[str]]:
+    """Yield ``user_id``'s follower ids ``size`` at a time, walking the followers index with a keyset."""
+    after = None
+    while True:
+        edges = await db.follows.find(
+            keyset_query({"followee_id": user_id}, after, id_field="follower_id"),
+            {"_id": 0, "follower_id": 1, "created_at": 1},
+        ).sort(keyset_sort(id_field="follower_id")).limit(size).to_list(size)
+        if edges:
+            yield [e['follower_id'] for e in edges]
+        if len(edges) < size:
+            return
+        after = (edges[-1]['created_at'], edges[-1]['follower_id'])
+
+
+class FollowGraph:
+    def __init__(self, db):
+        self.db = db
+
+    async def _bump(self, follower_id: str, followee_id: str, delta: int):
+        await self.db.users.bulk_write([
+            UpdateOne({"id": follower_id}, {"$inc": {"following_count": delta}}),
+            UpdateOne({"id": followee_id}, {"$inc": {"followers_count": delta}}),
+        ], ordered=False)
+
+    async def follow(self, follower_id: str, followee_id: str) -> bool:
+        """Create the edge; returns False if it already existed."""
+        try:
+            await self.db.follows.insert_one({
+                "follower_id": follower_id,
+                "followee_id": followee_id,
+                "created_at": datetime.now(timezone.utc),
+            })
+        except DuplicateKeyError:
+            return False
+        await self._bump(follower_id, followee_id, 1)
+        return True
+
+    async def unfollow(self, follower_id: str, followee_id: str) -> bool:
+        """Delete the edge; returns False if there was none."""
+        result = await self.db.follows.delete_one({"follower_id": follower_id, "followee_id": followee_id})
+        if not result.deleted_count:
+            return False
+        await self._bump(follower_id, followee_id, -1)
+        return True
+
+    async def is_following(self, follower_id: str, followee_id: str) -> bool:
+        edge = await self.db.follows.find_one(
+            {"follower_id": follower_id, "followee_id": followee_id}, {"_id": 1}
+        )
+        return edge is not None
+
+    async def following_ids(self, user_id: str, among: Optional[List[str]] = None) -> List[str]:
+        """Ids ``user_id`` follows, optionally restricted to ``among``."""
+        query = {"follower_id": user_id}
+        if among is not None:
+            query["followee_id"] = {"$in": among}
+        return [e['followee_id'] async for e in self.db.follows.find(query, {"_id": 0, "followee_id": 1})]
+
+    async def page(self, direction: str, user_id: str, after: Optional[Cursor], limit: int) -> List[dict]:
+        """Up to ``limit + 1`` edges of ``user_id``'s followers/following list, newest first."""
+        match, listed = DIRECTIONS[direction]
+        return await fetch_page(
+            self.db.follows, {match: user_id}, after, limit,
+            projection={"_id": 0, listed: 1, "created_at": 1}, id_field=listed,
+        )
@@ -0,0 +1,258 @@
+"""Index declarations and a query-plan audit for every Mongo access path.
+
+``ensure_indexes`` runs at startup and creates everything in ``INDEXES``.
+``python indexes.py --audit`` runs ``explain`` on each shape in ``QUERY_SHAPES``
+and exits non-zero if any of them falls back to a COLLSCAN. The shapes are
+kept by hand, one per distinct filter/sort the routers, stores and jobs send,
+with the same value types as the stored documents (dates are ``datetime``), so
+a new query needs a new entry here.
+"""
+import argparse
+import asyncio
+import logging
+import sys
+from datetime import datetime, timezone
+from typing import Dict, List
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+from retention import ensure_ttl_index
+
+logger = logging.getLogger(__name__)
+
+INDEXES: Dict[str, List[IndexModel]] = {
+    "users": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("email", ASCENDING)], unique=True),
+        IndexModel([("timeline_pull", ASCENDING)], sparse=True),
+        IndexModel([("followers_count", DESCENDING)]),
+        IndexModel([("inbox_dirty_at", ASCENDING)], partialFilterExpression={"inbox_dirty_at": {"$exists": True}}),
+    ],
+    "posts": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("created_at", DESCENDING), ("id", DESCENDING)]),
+        IndexModel([("user_id", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)]),
+    ],
+    "follows": [
+        IndexModel([("follower_id", ASCENDING), ("followee_id", ASCENDING)], unique=True),
+        IndexModel([("followee_id", ASCENDING), ("created_at", DESCENDING), ("follower_id", DESCENDING)]),
+        IndexModel([("follower_id", ASCENDING), ("created_at", DESCENDING), ("followee_id", DESCENDING)]),
+    ],
+    "timelines": [
+        IndexModel([("user_id", ASCENDING), ("created_at", DESCENDING), ("post_id", DESCENDING)]),
+        IndexModel([("user_id", ASCENDING), ("post_id", ASCENDING)], unique=True),
+        IndexModel([("user_id", ASCENDING), ("author_id", ASCENDING)]),
+        IndexModel([("post_id", ASCENDING)]),
+    ],
+    "reactions": [
+        IndexModel([("post_id", ASCENDING), ("user_id", ASCENDING)], unique=True),
+        IndexModel([("user_id", ASCENDING), ("post_id", ASCENDING)]),
+    ],
+    "bookmarks": [
+        IndexModel([("user_id", ASCENDING), ("post_id", ASCENDING)], unique=True),
+        IndexModel([("user_id", ASCENDING), ("created_at", DESCENDING), ("post_id", DESCENDING)]),
+        IndexModel([("post_id", ASCENDING)]),
+    ],
+    "comments": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("post_id", ASCENDING), ("created_at", ASCENDING), ("id", ASCENDING)]),
+    ],
+    "notifications": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("user_id", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)]),
+        IndexModel([("user_id", ASCENDING), ("read", ASCENDING), ("created_at", DESCENDING)]),
+        IndexModel([("user_id", ASCENDING), ("post_id", ASCENDING), ("type", ASCENDING), ("read", ASCENDING)]),
+        IndexModel([("post_id", ASCENDING)]),
+        IndexModel([("created_at", ASCENDING)]),
+        # The read_at TTL index is created by retention.ensure_ttl_index
+    ],
+    "search_postings": [
+        IndexModel([("kind", ASCENDING), ("term", ASCENDING), ("created_at", DESCENDING)]),
+        IndexModel([("kind", ASCENDING), ("doc_id", ASCENDING)]),
+    ],
+    "suggestions": [
+        IndexModel([("user_id", ASCENDING)], unique=True),
+        IndexModel([("stale", ASCENDING)], partialFilterExpression={"stale": True}),
+    ],
+    "jobs": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("state", ASCENDING), ("run_at", ASCENDING)]),
+    ],
+    "media": [
+        IndexModel([("id", ASCENDING)], unique=True),
+    ],
+    "trending_scores": [
+        IndexModel([("kind", ASCENDING), ("key", ASCENDING)], unique=True),
+        IndexModel([("kind", ASCENDING), ("log_score", DESCENDING)]),
+    ],
+    # Only used with RESPONSE_CACHE_BACKEND=mongo
+    "response_cache": [
+        IndexModel([("expires_at", ASCENDING)], expireAfterSeconds=0),
+        IndexModel([("tags", ASCENDING)]),
+    ],
+}
+
+_ID = "00000000-0000-0000-0000-000000000000"
+_TS = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+# (name, collection, command) -- representative shapes of what the routers send.
+# Keyset pages add an $or on (created_at, id) on top of the base filter.
+QUERY_SHAPES = [
+    ("get_current_user", "users", {"find": "users", "filter": {"id": _ID}}),
+    ("signup/login email lookup", "users", {"find": "users", "filter": {"email": "a@example.com"}}),
+    ("timeline pull authors", "users", {"find": "users", "filter": {"timeline_pull": True}}),
+    ("post by id", "posts", {"find": "posts", "filter": {"id": _ID}}),
+    ("get_all_posts", "posts", {"find": "posts", "filter": {}, "sort": {"created_at": -1, "id": -1}}),
+    ("get_all_posts next page", "posts", {
+        "find": "posts",
+        "filter": {"$or": [{"created_at": {"$lt": _TS}}, {"created_at": _TS, "id": {"$lt": _ID}}]},
+        "sort": {"created_at": -1, "id": -1},
+    }),
+    ("get_user_posts", "posts", {
+        "find": "posts", "filter": {"user_id": _ID}, "sort": {"created_at": -1, "id": -1},
+    }),
+    ("timeline pull posts", "posts", {
+        "find": "posts", "filter": {"user_id": {"$in": [_ID]}}, "sort": {"created_at": -1, "id": -1},
+    }),
+    ("follow edge", "follows", {"find": "follows", "filter": {"follower_id": _ID, "followee_id": _ID}}),
+    ("followed pull authors", "follows", {
+        "find": "follows", "filter": {"follower_id": _ID, "followee_id": {"$in": [_ID]}},
+    }),
+    ("get_followers", "follows", {
+        "find": "follows", "filter": {"followee_id": _ID}, "sort": {"created_at": -1, "follower_id": -1},
+    }),
+    ("get_following", "follows", {
+        "find": "follows", "filter": {"follower_id": _ID}, "sort": {"created_at": -1, "followee_id": -1},
+    }),
+    ("get_posts timeline", "timelines", {
+        "find": "timelines", "filter": {"user_id": _ID}, "sort": {"created_at": -1, "post_id": -1},
+    }),
+    ("timeline remove post", "timelines", {"find": "timelines", "filter": {"post_id": _ID}}),
+    ("timeline unfollow", "timelines", {"find": "timelines", "filter": {"user_id": _ID, "author_id": _ID}}),
+    ("toggle_bookmark", "bookmarks", {"find": "bookmarks", "filter": {"user_id": _ID, "post_id": _ID}}),
+    ("my bookmarks for a page", "bookmarks", {
+        "find": "bookmarks", "filter": {"user_id": _ID, "post_id": {"$in": [_ID]}},
+    }),
+    # $match/$sort stage of the bookmarked-posts aggregation; the $lookup is "post by id"
+    ("bookmarked posts", "bookmarks", {
+        "find": "bookmarks", "filter": {"user_id": _ID}, "sort": {"created_at": -1, "post_id": -1},
+    }),
+    ("bookmarks of a post", "bookmarks", {"find": "bookmarks", "filter": {"post_id": _ID}}),
+    ("toggle_reaction", "reactions", {"find": "reactions", "filter": {"post_id": _ID, "user_id": _ID}}),
+    ("my reactions for a page", "reactions", {
+        "find": "reactions", "filter": {"user_id": _ID, "post_id": {"$in": [_ID]}},
+    }),
+    ("reactions of a post", "reactions", {"find": "reactions", "filter": {"post_id": _ID}}),
+    ("get_comments", "comments", {
+        "find": "comments", "filter": {"post_id": _ID}, "sort": {"created_at": 1, "id": 1},
+    }),
+    # $match stage of the comment-preview aggregation
+    ("latest comments", "comments", {"find": "comments", "filter": {"post_id": {"$in": [_ID]}}}),
+    ("comment by id", "comments", {"find": "comments", "filter": {"id": _ID}}),
+    ("get_notifications", "notifications", {
+        "find": "notifications", "filter": {"user_id": _ID}, "sort": {"created_at": -1, "id": -1},
+    }),
+    ("mark_notifications_read", "notifications", {
+        "count": "notifications", "query": {"user_id": _ID, "read": False},
+    }),
+    ("coalesce notification", "notifications", {
+        "find": "notifications", "filter": {"user_id": _ID, "type": "reaction", "post_id": _ID, "read": False},
+    }),
+    ("notifications of a post", "notifications", {"find": "notifications", "filter": {"post_id": _ID}}),
+    ("unread notifications of a post", "notifications", {
+        "find": "notifications", "filter": {"post_id": _ID, "read": False},
+    }),
+    ("trim inbox unread", "notifications", {
+        "count": "notifications", "query": {
+            "user_id": _ID, "read": False,
+            "$or": [{"created_at": {"$lt": _TS}}, {"created_at": _TS, "id": {"$lt": _ID}}],
+        },
+    }),
+    ("trim inbox delete batch", "notifications", {
+        "find": "notifications", "filter": {
+            "user_id": _ID, "$or": [{"created_at": {"$lt": _TS}}, {"created_at": _TS, "id": {"$lt": _ID}}],
+        },
+    }),
+    ("retention export", "notifications", {"find": "notifications", "filter": {"created_at": {"$lt": _TS}}}),
+    ("inboxes to trim", "users", {"find": "users", "filter": {"inbox_dirty_at": {"$lte": _TS}}}),
+    ("suggested users", "suggestions", {"find": "suggestions", "filter": {"user_id": _ID}}),
+    ("stale suggestions", "suggestions", {"find": "suggestions", "filter": {"stale": True}}),
+    ("popular users", "users", {"find": "users", "filter": {"id": {"$ne": _ID}}, "sort": {"followers_count": -1}}),
+    ("media by id", "media", {"find": "media", "filter": {"id": "0" * 64}}),
+    ("search term", "search_postings", {
+        "find": "search_postings", "filter": {"kind": "post", "term": "python"}, "sort": {"created_at": -1},
+    }),
+    ("search prefix", "search_postings", {
+        "find": "search_postings",
+        "filter": {"kind": "user", "term": {"$gte": "py", "$lt": "py\uffff"}},
+        "sort": {"created_at": -1},
+    }),
+    ("search remove document", "search_postings", {
+        "find": "search_postings", "filter": {"kind": "post", "doc_id": _ID},
+    }),
+    ("claim job", "jobs", {
+        "find": "jobs", "filter": {"state": {"$in": ["pending", "running"]}, "run_at": {"$lte": _TS}},
+        "sort": {"run_at": 1},
+    }),
+    ("trending leaderboard", "trending_scores", {
+        "find": "trending_scores", "filter": {"kind": "post"}, "sort": {"log_score": -1},
+    }),
+    ("trending score upsert", "trending_scores", {
+        "find": "trending_scores", "filter": {"kind": "hashtag", "key": "#python"},
+    }),
+    ("response cache invalidation", "response_cache", {
+        "find": "response_cache", "filter": {"tags": {"$in": ["post:" + _ID]}},
+    }),
+]
+
+
+async def ensure_indexes(db):
+    for collection, models in INDEXES.items():
+        try:
+            await db[collection].create_indexes(models)
+        except OperationFailure as e:
+            # Don't keep the API from starting (e.g. duplicate emails block the unique index).
+            logger.error("Could not create indexes on %s: %s", collection, e)
+    await ensure_ttl_index(db)
+
+
+def _stages(plan) -> List[str]:
+    if isinstance(plan, dict):
+        found = [plan['stage']] if 'stage' in plan else []
+        for value in plan.values():
+            found.extend(_stages(value))
+        return found
+    if isinstance(plan, list):
+        return [stage for item in plan for stage in _stages(item)]
+    return []
+
+
+async def explain_stages(db, command: dict) -> List[str]:
+    result = await db.command({"explain": command, "verbosity": "queryPlanner"})
+    return _stages(result['queryPlanner']['winningPlan'])
+
+
+async def audit(db) -> bool:
+    ok = True
+    for name, collection, command in QUERY_SHAPES:
+        stages = await explain_stages(db, command)
+        scan = "COLLSCAN" in stages
+        ok = ok and not scan
+        print(f"{'FAIL' if scan else 'ok  '}  {collection:<16} {name:<28} {' > '.join(reversed(stages))}")
+    return ok
+
+
+if __name__ == '__main__':
+    from server import db
+
+    parser = argparse.ArgumentParser(description="Create indexes and audit query plans.")
+    parser.add_argument("--audit", action="store_true", help="explain every query shape and fail on COLLSCAN")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    async def main():
+        await ensure_indexes(db)
+        return await audit(db) if args.audit else True
+
+    sys.exit(0 if asyncio.run(main()) else 1)
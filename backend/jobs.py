@@ -0,0 +1,181 @@
+"""Persistent background jobs.
+
+Handlers enqueue work into ``db.jobs`` and return; ``JobRunner`` workers in
+every API process claim due jobs with one atomic ``find_one_and_update`` and run
+the handler registered for their ``kind``. A claim is a lease: it pushes the
+job's ``run_at`` ``JOB_LEASE_SECONDS`` ahead, so a job whose process died is
+picked up again once the lease runs out. Finished jobs are deleted; failures
+are retried with exponential backoff and kept as ``failed`` after
+``JOB_MAX_ATTEMPTS``.
+
+Bulk deletes go through ``delete_in_batches``, which removes
+``JOB_BATCH_SIZE`` documents at a time, renews the lease and sleeps
+``JOB_BATCH_PAUSE_SECONDS`` between batches so cleanup never saturates MongoDB.
+"""
+import asyncio
+import logging
+import os
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+WORKERS = int(os.environ.get('JOB_WORKERS', '1'))
+POLL_SECONDS = float(os.environ.get('JOB_POLL_SECONDS', '5'))
+LEASE_SECONDS = float(os.environ.get('JOB_LEASE_SECONDS', '60'))
+MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', '5'))
+BATCH_SIZE = int(os.environ.get('JOB_BATCH_SIZE', '500'))
+BATCH_PAUSE = float(os.environ.get('JOB_BATCH_PAUSE_SECONDS', '0.05'))
+
+PENDING = "pending"
+RUNNING = "running"
+FAILED = "failed"
+
+Handler = Callable[..., Awaitable[None]]
+
+
+class JobRunner:
+    def __init__(self, db):
+        self.db = db
+        self._handlers: Dict[str, Handler] = {}
+        self._periodic: List[Tuple[str, float]] = []
+        self._wake = asyncio.Event()
+        self._tasks: List[asyncio.Task] = []
+        self._workers = 0
+        self.completed = 0
+        self.failed = 0
+        self.deleted = 0
+
+    def register(self, kind: str, handler: Handler, every: Optional[float] = None):
+        """Run ``handler(runner, job, **args)`` for jobs of ``kind``; ``every`` also enqueues it periodically."""
+        self._handlers[kind] = handler
+        if every:
+            self._periodic.append((kind, every))
+
+    async def enqueue(self, kind: str, job_id: Optional[str] = None, **args) -> bool:
+        """Persist a job; a fixed ``job_id`` makes the enqueue idempotent (returns False if it exists)."""
+        now = datetime.now(timezone.utc)
+        try:
+            await self.db.jobs.insert_one({
+                "id": job_id or str(uuid.uuid4()),
+                "kind": kind,
+                "args": args,
+                "state": PENDING,
+                "attempts": 0,
+                "run_at": now,
+                "created_at": now,
+            })
+        except DuplicateKeyError:
+            return False
+        self._wake.set()
+        return True
+
+    async def _claim(self) -> Optional[dict]:
+        now = datetime.now(timezone.utc)
+        # Running jobs whose lease expired belong to a worker that died; take them over.
+        job = await self.db.jobs.find_one_and_update(
+            {"state": {"$in": [PENDING, RUNNING]}, "run_at": {"$lte": now}},
+            {"$set": {"state": RUNNING, "run_at": now + timedelta(seconds=LEASE_SECONDS)}, "$inc": {"attempts": 1}},
+            sort=[("run_at", 1)],
+            projection={"_id": 0},
+        )
+        if job is not None:
+            job['attempts'] += 1
+        return job
+
+    async def renew(self, job: dict):
+        """Extend the lease of a long-running job."""
+        await self.db.jobs.update_one(
+            {"id": job['id']},
+            {"$set": {"run_at": datetime.now(timezone.utc) + timedelta(seconds=LEASE_SECONDS)}},
+        )
+
+    async def delete_in_batches(self, job: dict, collection: str, query: dict) -> int:
+        """Delete everything matching ``query`` a batch at a time; returns the number deleted."""
+        deleted = 0
+        while True:
+            ids = [d['_id'] for d in await self.db[collection].find(query, {"_id": 1}).to_list(BATCH_SIZE)]
+            if not ids:
+                return deleted
+            result = await self.db[collection].delete_many({"_id": {"$in": ids}})
+            deleted += result.deleted_count
+            self.deleted += result.deleted_count
+            await self.renew(job)
+            await asyncio.sleep(BATCH_PAUSE)
+
+    async def _run(self, job: dict):
+        handler = self._handlers.get(job['kind'])
+        try:
+            if handler is None:
+                raise LookupError(f"no handler for job kind {job['kind']!r}")
+            await handler(self, job, **job['args'])
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            self.failed += 1
+            logger.exception("Job %s (%s) failed on attempt %d", job['id'], job['kind'], job['attempts'])
+            retry = job['attempts'] < MAX_ATTEMPTS
+            await self.db.jobs.update_one({"id": job['id']}, {"$set": {
+                "state": PENDING if retry else FAILED,
+                "run_at": datetime.now(timezone.utc) + timedelta(seconds=POLL_SECONDS * 2 ** job['attempts']),
+                "error": repr(exc),
+            }})
+            return
+        self.completed += 1
+        await self.db.jobs.delete_one({"id": job['id']})
+
+    async def _worker(self):
+        while True:
+            try:
+                job = await self._claim()
+            except Exception:
+                logger.exception("Could not claim a job")
+                job = None
+            if job is not None:
+                await self._run(job)
+                continue
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _schedule(self, kind: str, every: float):
+        while True:
+            # One job id per period, so only one process enqueues each run.
+            try:
+                await self.enqueue(kind, f"{kind}:{int(time.time() // every)}")
+            except Exception:
+                logger.exception("Could not schedule %s", kind)
+            await asyncio.sleep(every - time.time() % every)
+
+    async def stats(self) -> dict:
+        counts = {row['_id']: row['n'] async for row in self.db.jobs.aggregate([
+            {"$group": {"_id": "$state", "n": {"$sum": 1}}},
+        ])}
+        return {
+            "workers": self._workers,
+            "pending": counts.get(PENDING, 0),
+            "running": counts.get(RUNNING, 0),
+            "failed_jobs": counts.get(FAILED, 0),
+            "completed": self.completed,
+            "failures": self.failed,
+            "documents_deleted": self.deleted,
+        }
+
+    def start(self):
+        self._workers = WORKERS
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(WORKERS)]
+        self._tasks += [asyncio.create_task(self._schedule(kind, every)) for kind, every in self._periodic]
+
+    async def stop(self):
+        # Interrupted jobs stay "running" and are picked up again when their lease expires.
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._workers = 0
@@ -0,0 +1,203 @@
+"""Content-addressed media storage.
+
+Uploads are streamed to disk in chunks while being hashed; the SHA-256 of the
+bytes is the media id, so the same file uploaded twice is stored once. Every
+image also gets resized WebP variants (``thumb`` for avatars, ``medium`` for
+feed images and covers), rendered in a worker thread.
+
+Documents (``posts.image``, ``users.avatar``, ``users.cover_image`` and the
+denormalized ``user_avatar`` / ``actor_avatar`` copies) store only the
+64-character id. ``GET /api/media/{id}`` serves the bytes with a strong ETag,
+Range support and an immutable Cache-Control header.
+
+Files live under ``MEDIA_ROOT`` on local disk (mount a persistent volume there
+when the host's filesystem is ephemeral); metadata lives in ``db.media``.
+``python migrate.py media`` moves existing inline ``data:`` URLs into the store.
+"""
+import asyncio
+import hashlib
+import os
+import re
+import shutil
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import AsyncIterator, Optional, Tuple
+
+from fastapi import HTTPException, UploadFile
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from cache import TTLCache
+
+MEDIA_ROOT = Path(os.environ.get('MEDIA_ROOT', str(Path(__file__).parent / 'media')))
+MAX_BYTES = int(os.environ.get('MEDIA_MAX_BYTES', str(10 * 1024 * 1024)))
+CHUNK_SIZE = 1024 * 1024
+CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+ORIGINAL = "original"
+# variant -> longest edge in pixels (never upscaled)
+VARIANTS = {"thumb": 200, "medium": 1280}
+
+MEDIA_ID_RE = re.compile(r"^[0-9a-f]{64}$")
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+Image.MAX_IMAGE_PIXELS = 50_000_000
+
+
+def is_media_id(value: Optional[str]) -> bool:
+    return bool(value) and MEDIA_ID_RE.match(value) is not None
+
+
+def _render(staging: Path) -> dict:
+    """Validate ``staging/original`` and write its variants next to it; returns the metadata."""
+    try:
+        with Image.open(staging / ORIGINAL) as img:
+            img.load()
+            content_type = Image.MIME.get(img.format)
+            width, height = img.size
+            oriented = ImageOps.exif_transpose(img)
+            if oriented.mode not in ("RGB", "RGBA"):
+                oriented = oriented.convert("RGBA")
+            variants = {}
+            for name, edge in VARIANTS.items():
+                resized = oriented.copy()
+                resized.thumbnail((edge, edge))
+                resized.save(staging / name, "WEBP", quality=82, method=4)
+                variants[name] = {
+                    "content_type": "image/webp",
+                    "size": (staging / name).stat().st_size,
+                    "width": resized.width,
+                    "height": resized.height,
+                }
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError, ValueError):
+        raise HTTPException(status_code=400, detail="Unsupported or corrupt image")
+    if not content_type:
+        raise HTTPException(status_code=400, detail="Unsupported or corrupt image")
+    return {
+        "content_type": content_type,
+        "size": (staging / ORIGINAL).stat().st_size,
+        "width": width,
+        "height": height,
+        "variants": variants,
+    }
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """Parse a single-range ``Range`` header into an inclusive ``(start, end)``; None means the whole file."""
+    if not header:
+        return None
+    match = RANGE_RE.match(header.strip())
+    if not match or match.groups() == ("", ""):
+        return None  # multi-range and malformed headers get the full body
+    first, last = match.groups()
+    if first:
+        start, end = int(first), min(int(last), size - 1) if last else size - 1
+    else:
+        start, end = max(size - int(last), 0), size - 1
+    if start >= size or start > end:
+        raise HTTPException(status_code=416, detail="Range not satisfiable",
+                            headers={"Content-Range": f"bytes */{size}"})
+    return start, end
+
+
+async def iter_file(path: Path, start: int, end: int) -> AsyncIterator[bytes]:
+    """Yield bytes ``start``..``end`` (inclusive) of ``path`` without blocking the loop."""
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = await asyncio.to_thread(f.read, min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+class MediaStore:
+    def __init__(self, db, root: Path = MEDIA_ROOT):
+        self.db = db
+        self.root = root
+        self._meta = TTLCache(10000, 3600)  # metadata never changes once written
+
+    def path(self, media_id: str, variant: str = ORIGINAL) -> Path:
+        return self.root / media_id[:2] / media_id / variant
+
+    def _staging(self) -> Path:
+        staging = self.root / "tmp" / uuid.uuid4().hex
+        staging.mkdir(parents=True)
+        return staging
+
+    async def get(self, media_id: str) -> Optional[dict]:
+        if not is_media_id(media_id):
+            return None
+        meta = self._meta.get(media_id)
+        if meta is None:
+            meta = await self.db.media.find_one({"id": media_id}, {"_id": 0})
+            if meta is not None:
+                self._meta.set(media_id, meta)
+        return meta
+
+    async def check(self, *refs: Optional[str]):
+        """Reject document fields that aren't empty or a stored media id."""
+        for ref in refs:
+            if ref and await self.get(ref) is None:
+                raise HTTPException(status_code=400, detail="Unknown media id; upload the file first")
+
+    async def locate(self, media_id: str, variant: str = ORIGINAL) -> Tuple[Path, dict]:
+        """Path and metadata of one stored file, or 404."""
+        meta = await self.get(media_id)
+        if meta is None:
+            raise HTTPException(status_code=404, detail="Media not found")
+        if variant == ORIGINAL:
+            info = meta
+        elif variant in meta.get('variants', {}):
+            info = meta['variants'][variant]
+        else:
+            raise HTTPException(status_code=404, detail="Unknown variant")
+        path = self.path(media_id, variant)
+        if not path.exists():
+            raise HTTPException(status_code=404, detail="Media not found")
+        return path, info
+
+    async def save_upload(self, upload: UploadFile, owner_id: str) -> dict:
+        """Stream ``upload`` to disk in chunks, hashing as it goes."""
+        staging = await asyncio.to_thread(self._staging)
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            with open(staging / ORIGINAL, "wb") as out:
+                while chunk := await upload.read(CHUNK_SIZE):
+                    size += len(chunk)
+                    if size > MAX_BYTES:
+                        raise HTTPException(status_code=413, detail=f"File larger than {MAX_BYTES} bytes")
+                    digest.update(chunk)
+                    await asyncio.to_thread(out.write, chunk)
+            return await self._commit(staging, digest.hexdigest(), owner_id)
+        finally:
+            await asyncio.to_thread(shutil.rmtree, staging, True)
+
+    async def save_bytes(self, data: bytes, owner_id: Optional[str] = None) -> dict:
+        staging = await asyncio.to_thread(self._staging)
+        try:
+            await asyncio.to_thread((staging / ORIGINAL).write_bytes, data)
+            return await self._commit(staging, hashlib.sha256(data).hexdigest(), owner_id)
+        finally:
+            await asyncio.to_thread(shutil.rmtree, staging, True)
+
+    async def _commit(self, staging: Path, media_id: str, owner_id: Optional[str]) -> dict:
+        existing = await self.get(media_id)
+        if existing is not None and self.path(media_id).exists():
+            return existing
+
+        meta = await asyncio.to_thread(_render, staging)
+
+        def publish():
+            target = self.path(media_id).parent
+            target.mkdir(parents=True, exist_ok=True)
+            for name in (*VARIANTS, ORIGINAL):  # original last: its presence marks a complete set
+                os.replace(staging / name, target / name)
+
+        await asyncio.to_thread(publish)
+        meta = {"id": media_id, **meta, "owner_id": owner_id, "created_at": datetime.now(timezone.utc)}
+        await self.db.media.update_one({"id": media_id}, {"$setOnInsert": meta}, upsert=True)
+        return await self.get(media_id) or meta
@@ -0,0 +1,347 @@
+"""Request and MongoDB instrumentation, exported in Prometheus text format.
+
+``MetricsMiddleware`` times every request under its route template
+(``/api/posts/{post_id}/comments``, never the raw path) and tracks in-flight
+requests. ``CommandMetrics`` is a pymongo ``CommandListener`` passed to the
+Motor client: it records every command's count, duration and documents
+returned per command and collection, and, through a context variable that
+Motor carries into its executor threads, charges them to the request that
+issued them. At the end of a request the same command against the same
+collection repeated ``N_PLUS_ONE_THRESHOLD`` times or more is counted (and
+logged once per route) as a likely N+1 loop.
+
+Requests slower than ``SLOW_REQUEST_MS`` and commands slower than
+``SLOW_QUERY_MS`` are logged with their route, command counts and filter
+shape. ``/metrics`` renders ``REGISTRY``; ``Registry.collect`` adds gauges from
+the ``stats()`` dicts the ``/debug/*`` endpoints already serve.
+"""
+import collections
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from pymongo import monitoring
+from starlette.routing import Match
+
+logger = logging.getLogger(__name__)
+
+SLOW_REQUEST_MS = float(os.environ.get('SLOW_REQUEST_MS', '500'))
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', '100'))
+N_PLUS_ONE_THRESHOLD = int(os.environ.get('N_PLUS_ONE_THRESHOLD', '10'))
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 500)
+UNMATCHED = "<unmatched>"
+
+Labels = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Labels, extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()  # updated from Motor's executor threads too
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}", *self.samples()]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f"{self.name}{_labels(self.label_names, k)} {v}" for k, v in values]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, *labels: str):
+        self.inc(*labels, amount=-1)
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+        # labels -> [per-bucket counts (last one is +Inf), sum]
+        self._values: Dict[Labels, list] = {}
+
+    def observe(self, value: float, *labels: str):
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][bisect_left(self.buckets, value)] += 1
+            entry[1] += value
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = sorted((k, (list(counts), total)) for k, (counts, total) in self._values.items())
+        lines = []
+        for labels, (counts, total) in values:
+            cumulative = 0
+            for bound, n in zip((*self.buckets, "+Inf"), counts):
+                cumulative += n
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_labels(self.label_names, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, labels)} {total}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, labels)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[Metric] = []
+        self._collectors: List[Tuple[str, Callable[[], dict]]] = []
+
+    def add(self, metric: Metric) -> Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+        return self.add(Counter(name, help, labels))
+
+    def gauge(self, name: str, help: str, labels: Sequence[str] = ()) -> Gauge:
+        return self.add(Gauge(name, help, labels))
+
+    def histogram(self, name: str, help: str, labels: Sequence[str] = (), buckets=LATENCY_BUCKETS) -> Histogram:
+        return self.add(Histogram(name, help, labels, buckets))
+
+    def collect(self, prefix: str, stats: Callable[[], dict]):
+        """Export the numeric values of ``stats()`` as ``careerpulse_<prefix>_<key>`` gauges on every scrape."""
+        self._collectors.append((prefix, stats))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines += metric.render()
+        for prefix, stats in self._collectors:
+            for key, value in stats().items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    name = f"careerpulse_{prefix}_{key}"
+                    lines += [f"# TYPE {name} gauge", f"{name} {value}"]
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+REQUESTS = REGISTRY.counter("http_requests_total", "Requests served", ("method", "route", "status"))
+REQUEST_SECONDS = REGISTRY.histogram(
+    "http_request_duration_seconds", "Request latency until the response body is sent", ("method", "route"),
+)
+IN_FLIGHT = REGISTRY.gauge("http_requests_in_flight", "Requests being handled", ("method", "route"))
+REQUEST_COMMANDS = REGISTRY.histogram(
+    "http_request_mongodb_commands", "MongoDB commands issued per request", ("method", "route"), COUNT_BUCKETS,
+)
+REQUEST_DOCUMENTS = REGISTRY.histogram(
+    "http_request_mongodb_documents", "MongoDB documents returned per request", ("method", "route"), COUNT_BUCKETS,
+)
+SLOW_REQUESTS = REGISTRY.counter("http_slow_requests_total", "Requests slower than SLOW_REQUEST_MS", ("method", "route"))
+COMMANDS = REGISTRY.counter("mongodb_commands_total", "MongoDB commands", ("command", "collection", "outcome"))
+COMMAND_SECONDS = REGISTRY.histogram(
+    "mongodb_command_duration_seconds", "MongoDB command latency", ("command", "collection"), QUERY_BUCKETS,
+)
+DOCUMENTS = REGISTRY.counter("mongodb_documents_returned_total", "Documents returned by MongoDB", ("command", "collection"))
+SLOW_COMMANDS = REGISTRY.counter(
+    "mongodb_slow_commands_total", "MongoDB commands slower than SLOW_QUERY_MS", ("command", "collection"),
+)
+N_PLUS_ONE = REGISTRY.counter(
+    "mongodb_n_plus_one_total",
+    "Requests that repeated one command on one collection N_PLUS_ONE_THRESHOLD times or more",
+    ("route", "command", "collection"),
+)
+
+
+@dataclass
+class RequestStats:
+    route: str
+    commands: collections.Counter = field(default_factory=collections.Counter)  # (command, collection) -> count
+    documents: int = 0
+    mongo_seconds: float = 0.0
+
+    def summary(self) -> str:
+        return ", ".join(f"{cmd} {coll} x{n}" for (cmd, coll), n in self.commands.most_common(5))
+
+
+_current: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+
+# Commands that are connection chatter rather than application queries
+IGNORED_COMMANDS = frozenset({
+    "hello", "ismaster", "isMaster", "ping", "buildinfo", "buildInfo", "saslStart", "saslContinue",
+    "endSessions", "killCursors", "getLastError",
+})
+
+
+def _collection(event: monitoring.CommandStartedEvent) -> str:
+    command = event.command
+    if event.command_name == "getMore":
+        return command.get("collection", "")
+    value = command.get(event.command_name)
+    return value if isinstance(value, str) else ""
+
+
+def _shape(command: dict) -> str:
+    """Field names of a command's filter or the stages of its pipeline, without values."""
+    if "pipeline" in command:
+        return "[" + ", ".join(next(iter(stage), "?") for stage in command["pipeline"]) + "]"
+    for key in ("filter", "query", "q"):
+        if isinstance(command.get(key), dict):
+            return "{" + ", ".join(command[key]) + "}"
+    for key in ("updates", "deletes"):
+        if command.get(key):
+            return "{" + ", ".join(command[key][0].get("q", {})) + "}"
+    return ""
+
+
+def _returned(reply: dict) -> int:
+    cursor = reply.get("cursor")
+    if isinstance(cursor, dict):
+        return len(cursor.get("firstBatch") or cursor.get("nextBatch") or ())
+    if "value" in reply:  # findAndModify
+        return int(reply["value"] is not None)
+    return 0
+
+
+class CommandMetrics(monitoring.CommandListener):
+    def __init__(self):
+        # request_id -> (command name, collection, command, issuing request)
+        self._started: Dict[int, Tuple[str, str, dict, Optional[RequestStats]]] = {}
+
+    def started(self, event: monitoring.CommandStartedEvent):
+        if event.command_name in IGNORED_COMMANDS:
+            return
+        self._started[event.request_id] = (event.command_name, _collection(event), event.command, _current.get())
+
+    def _finish(self, event, outcome: str, returned: int):
+        entry = self._started.pop(event.request_id, None)
+        if entry is None:
+            return
+        command, collection, body, request = entry
+        seconds = event.duration_micros / 1e6
+        COMMANDS.inc(command, collection, outcome)
+        COMMAND_SECONDS.observe(seconds, command, collection)
+        if returned:
+            DOCUMENTS.inc(command, collection, amount=returned)
+        if request is not None:
+            request.commands[(command, collection)] += 1
+            request.documents += returned
+            request.mongo_seconds += seconds
+        if seconds * 1000 >= SLOW_QUERY_MS:
+            SLOW_COMMANDS.inc(command, collection)
+            logger.warning(
+                "Slow query: %s %s %s took %.1fms (%d docs) during %s",
+                command, collection, _shape(body), seconds * 1000, returned, request.route if request else "background",
+            )
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent):
+        self._finish(event, "ok", _returned(event.reply))
+
+    def failed(self, event: monitoring.CommandFailedEvent):
+        self._finish(event, "error", 0)
+
+
+def route_template(routes: Sequence, scope) -> str:
+    """The path template of the route ``scope`` will be dispatched to, matched once per request."""
+    if "route_template" not in scope:
+        scope["route_template"] = UNMATCHED
+        for route in routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                scope["route_template"] = route.path
+                break
+    return scope["route_template"]
+
+
+class MetricsMiddleware:
+    """Pure ASGI, so streamed responses are timed without buffering them."""
+
+    def __init__(self, app, routes: Sequence):
+        self.app = app
+        self.routes = routes
+        self._flagged = set()
+
+    def _check_n_plus_one(self, method: str, stats: RequestStats):
+        for (command, collection), n in stats.commands.items():
+            if n >= N_PLUS_ONE_THRESHOLD:
+                N_PLUS_ONE.inc(stats.route, command, collection)
+                key = (method, stats.route, command, collection)
+                if key not in self._flagged:
+                    self._flagged.add(key)
+                    logger.warning("Possible N+1: %s %s ran %s on %s %d times in one request",
+                                   method, stats.route, command, collection, n)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        method = scope["method"]
+        stats = RequestStats(route_template(self.routes, scope))
+        status = {"code": 500, "streaming": False}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                status["streaming"] = any(
+                    k == b"content-type" and v.startswith(b"text/event-stream") for k, v in message.get("headers", ())
+                )
+            await send(message)
+
+        token = _current.set(stats)
+        IN_FLIGHT.inc(method, stats.route)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            IN_FLIGHT.dec(method, stats.route)
+            _current.reset(token)
+            REQUESTS.inc(method, stats.route, str(status["code"]))
+            # A notification stream lasts as long as the tab is open; its duration isn't latency.
+            if not status["streaming"]:
+                REQUEST_SECONDS.observe(elapsed, method, stats.route)
+                REQUEST_COMMANDS.observe(sum(stats.commands.values()), method, stats.route)
+                REQUEST_DOCUMENTS.observe(stats.documents, method, stats.route)
+                self._check_n_plus_one(method, stats)
+                if elapsed * 1000 >= SLOW_REQUEST_MS:
+                    SLOW_REQUESTS.inc(method, stats.route)
+                    logger.warning(
+                        "Slow request: %s %s -> %d in %.1fms (%d mongo commands, %.1fms in mongo, %d docs: %s)",
+                        method, stats.route, status["code"], elapsed * 1000, sum(stats.commands.values()),
+                        stats.mongo_seconds * 1000, stats.documents, stats.summary(),
+                    )
@@ -0,0 +1,264 @@
+"""One-off data migrations.
+
+    python migrate.py --list
+    python migrate.py <name> [<name> ...]
+
+Every migration is idempotent and only touches documents still in the old
+shape, so it is safe to re-run or to run against a live database.
+"""
+import argparse
+import asyncio
+import base64
+import binascii
+import hashlib
+import logging
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+from fastapi import HTTPException
+from pymongo import UpdateOne
+
+from indexes import ensure_indexes
+from media import MediaStore
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 500
+
+
+async def reactions(db):
+    """Move embedded ``posts.reactions`` arrays into ``db.reactions`` plus ``reaction_counts``."""
+    migrated = 0
+    async for post in db.posts.find({"reactions": {"$exists": True}}, {"_id": 0, "id": 1, "reactions": 1}):
+        by_user = {r['user_id']: r['type'] for r in post['reactions'] if r.get('user_id')}
+        if by_user:
+            await db.reactions.bulk_write([
+                UpdateOne(
+                    {"post_id": post['id'], "user_id": user_id},
+                    {"$setOnInsert": {"type": reaction_type}},
+                    upsert=True,
+                )
+                for user_id, reaction_type in by_user.items()
+            ], ordered=False)
+        await db.posts.update_one(
+            {"id": post['id']},
+            {"$set": {"reaction_counts": dict(Counter(by_user.values()))}, "$unset": {"reactions": ""}},
+        )
+        migrated += 1
+    return migrated
+
+
+async def unread_counters(db):
+    """Recompute ``users.unread_notifications`` from the notifications collection."""
+    await db.users.update_many({}, {"$set": {"unread_notifications": 0}})
+    updated = 0
+    async for row in db.notifications.aggregate([
+        {"$match": {"read": False}},
+        {"$group": {"_id": "$user_id", "count": {"$sum": 1}}},
+    ]):
+        await db.users.update_one({"id": row['_id']}, {"$set": {"unread_notifications": row['count']}})
+        updated += 1
+    return updated
+
+
+async def comment_counts(db):
+    """Recompute ``posts.comment_count`` from the comments collection."""
+    await db.posts.update_many({}, {"$set": {"comment_count": 0}})
+    ops = []
+    async for row in db.comments.aggregate([{"$group": {"_id": "$post_id", "count": {"$sum": 1}}}]):
+        ops.append(UpdateOne({"id": row['_id']}, {"$set": {"comment_count": row['count']}}))
+    for i in range(0, len(ops), BATCH_SIZE):
+        await db.posts.bulk_write(ops[i:i + BATCH_SIZE], ordered=False)
+    return len(ops)
+
+
+async def bookmarks(db):
+    """Move ``users.bookmarks`` arrays into the ``bookmarks`` collection, keeping their order."""
+    migrated = 0
+    async for user in db.users.find({"bookmarks": {"$exists": True}}, {"_id": 0, "id": 1, "bookmarks": 1}):
+        post_ids = list(dict.fromkeys(user['bookmarks'] or []))
+        # The array was appended to, so later entries were saved later.
+        start = datetime.now(timezone.utc) - timedelta(milliseconds=len(post_ids))
+        ops = [
+            UpdateOne(
+                {"user_id": user['id'], "post_id": post_id},
+                {"$setOnInsert": {"created_at": start + timedelta(milliseconds=i)}},
+                upsert=True,
+            )
+            for i, post_id in enumerate(post_ids)
+        ]
+        for i in range(0, len(ops), BATCH_SIZE):
+            await db.bookmarks.bulk_write(ops[i:i + BATCH_SIZE], ordered=False)
+        await db.users.update_one({"id": user['id']}, {"$unset": {"bookmarks": ""}})
+        migrated += 1
+    return migrated
+
+
+# collection -> fields that may hold an inline data: URL
+MEDIA_FIELDS = {
+    "users": ("avatar", "cover_image"),
+    "posts": ("image", "user_avatar"),
+    "comments": ("user_avatar",),
+    "notifications": ("actor_avatar",),
+}
+
+
+async def media(db):
+    """Move inline ``data:`` image URLs into the media store and keep only the media id."""
+    store = MediaStore(db)
+    # The same avatar is copied onto many posts; decode and store each distinct URL once.
+    stored = {}
+    migrated = 0
+
+    async def to_media_id(url: str):
+        key = hashlib.sha256(url.encode()).digest()
+        if key not in stored:
+            try:
+                data = base64.b64decode(url.split(",", 1)[1], validate=True)
+                stored[key] = (await store.save_bytes(data))['id']
+            except (IndexError, binascii.Error, HTTPException):
+                logger.warning("Clearing undecodable inline image (%d chars)", len(url))
+                stored[key] = ""
+        return stored[key]
+
+    for collection, fields in MEDIA_FIELDS.items():
+        query = {"$or": [{field: {"$regex": "^data:"}} for field in fields]}
+        async for doc in db[collection].find(query, {"_id": 1, **{field: 1 for field in fields}}):
+            update = {
+                field: await to_media_id(doc[field])
+                for field in fields if isinstance(doc.get(field), str) and doc[field].startswith("data:")
+            }
+            await db[collection].update_one({"_id": doc['_id']}, {"$set": update})
+            migrated += 1
+    return migrated
+
+
+# collection -> author fields that used to be copied onto every document
+AUTHOR_FIELDS = {
+    "posts": ("user_name", "user_headline", "user_avatar"),
+    "comments": ("user_name", "user_headline", "user_avatar"),
+    "notifications": ("actor_name", "actor_avatar"),
+}
+
+
+async def author_fields(db):
+    """Drop author name/headline/avatar copies; profiles are now resolved at read time."""
+    migrated = 0
+    for collection, fields in AUTHOR_FIELDS.items():
+        result = await db[collection].update_many(
+            {"$or": [{field: {"$exists": True}} for field in fields]},
+            {"$unset": {field: "" for field in fields}},
+        )
+        migrated += result.modified_count
+    return migrated
+
+
+async def follow_graph(db):
+    """Move ``users.followers`` / ``users.following`` arrays into ``db.follows`` edges and counters."""
+    migrated = 0
+    query = {"$or": [{"following": {"$exists": True}}, {"followers": {"$exists": True}}]}
+    async for user in db.users.find(query, {"_id": 0, "id": 1, "following": 1, "followers": 1}):
+        # Either side's array may be the only record of an edge; union both.
+        edges = {(user['id'], followee) for followee in user.get('following') or []}
+        edges |= {(follower, user['id']) for follower in user.get('followers') or []}
+        edges = [
+            UpdateOne(
+                {"follower_id": follower, "followee_id": followee},
+                {"$setOnInsert": {"created_at": datetime.now(timezone.utc)}},
+                upsert=True,
+            )
+            for follower, followee in edges if follower != followee
+        ]
+        for i in range(0, len(edges), BATCH_SIZE):
+            await db.follows.bulk_write(edges[i:i + BATCH_SIZE], ordered=False)
+        await db.users.update_one({"id": user['id']}, {"$unset": {"following": "", "followers": ""}})
+        migrated += 1
+
+    # Recount from the edges so the counters are right however often this runs.
+    counts = {}
+    for field, key in (("followers_count", "$followee_id"), ("following_count", "$follower_id")):
+        async for row in db.follows.aggregate([{"$group": {"_id": key, "n": {"$sum": 1}}}]):
+            counts.setdefault(row['_id'], {"followers_count": 0, "following_count": 0})[field] = row['n']
+    zero = {"followers_count": 0, "following_count": 0}
+    ops = []
+    async for user in db.users.find({}, {"_id": 0, "id": 1}):
+        ops.append(UpdateOne({"id": user['id']}, {"$set": counts.get(user['id'], zero)}))
+        if len(ops) >= BATCH_SIZE:
+            await db.users.bulk_write(ops, ordered=False)
+            ops = []
+    if ops:
+        await db.users.bulk_write(ops, ordered=False)
+    return migrated
+
+
+# collections whose created_at used to be written as an ISO string
+DATE_COLLECTIONS = ("users", "posts", "comments", "notifications", "follows", "timelines", "search_postings")
+
+
+async def native_dates(db):
+    """Convert ISO-string ``created_at`` values to BSON dates (required by keyset cursors)."""
+    migrated = 0
+    for collection in DATE_COLLECTIONS:
+        ops = []
+        async for doc in db[collection].find({"created_at": {"$type": "string"}}, {"_id": 1, "created_at": 1}):
+            created_at = datetime.fromisoformat(doc['created_at'])
+            if created_at.tzinfo is None:
+                created_at = created_at.replace(tzinfo=timezone.utc)
+            ops.append(UpdateOne({"_id": doc['_id']}, {"$set": {"created_at": created_at}}))
+            if len(ops) >= BATCH_SIZE:
+                migrated += (await db[collection].bulk_write(ops, ordered=False)).modified_count
+                ops = []
+        if ops:
+            migrated += (await db[collection].bulk_write(ops, ordered=False)).modified_count
+    return migrated
+
+
+async def notification_retention(db):
+    """Start the read-notification TTL for notifications read before ``read_at`` existed, and queue every
+    inbox for trimming to ``NOTIFICATION_INBOX_MAX``. Needs ``native_dates`` first: a TTL index never
+    expires a string ``read_at``."""
+    if await db.notifications.find_one({"created_at": {"$type": "string"}}, {"_id": 1}):
+        raise RuntimeError("notifications still have string created_at values; run native_dates first")
+    result = await db.notifications.update_many(
+        {"read": True, "read_at": {"$exists": False}}, [{"$set": {"read_at": "$created_at"}}]
+    )
+    await db.users.update_many({}, {"$set": {"inbox_dirty_at": datetime.now(timezone.utc)}})
+    return result.modified_count
+
+
+MIGRATIONS = {
+    "reactions": reactions,
+    "unread_counters": unread_counters,
+    "media": media,
+    "author_fields": author_fields,
+    "follow_graph": follow_graph,
+    "native_dates": native_dates,
+    "comment_counts": comment_counts,
+    "bookmarks": bookmarks,
+    "notification_retention": notification_retention,
+}
+
+
+if __name__ == '__main__':
+    from server import db
+
+    parser = argparse.ArgumentParser(description="Run data migrations.")
+    parser.add_argument("names", nargs="*", metavar="name")
+    parser.add_argument("--list", action="store_true", help="list available migrations")
+    args = parser.parse_args()
+    unknown = [name for name in args.names if name not in MIGRATIONS]
+    if unknown:
+        parser.error(f"unknown migration(s): {', '.join(unknown)}")
+    logging.basicConfig(level=logging.INFO)
+
+    if args.list or not args.names:
+        for name, migration in MIGRATIONS.items():
+            print(f"{name:<16} {migration.__doc__}")
+    else:
+        async def main():
+            await ensure_indexes(db)
+            for name in args.names:
+                count = await MIGRATIONS[name](db)
+                logger.info("%s: migrated %d documents", name, count)
+
+        asyncio.run(main())
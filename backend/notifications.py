@@ -0,0 +1,272 @@
+"""Background notification pipeline.
+
+Request handlers enqueue notifications and return immediately; worker tasks
+drain the queue and write each batch with one unordered ``bulk_write``. A post
+fan-out is queued as a single job naming the author; the worker pages through
+the author's followers and inserts one notification each, so the request never
+reads the follower list.
+
+Reaction and comment notifications are coalesced per post into one unread
+notification ("Ana and 12 others reacted to your post").
+
+The queue is bounded (``NOTIFICATION_QUEUE_MAX``); when it is full, producers
+wait up to ``NOTIFICATION_ENQUEUE_TIMEOUT`` seconds and the job is then dropped
+and counted rather than stalling the API.
+
+After each batch the workers bump ``users.unread_notifications`` for every new
+unread notification and push the notification (shaped like a one-item page of
+``GET /api/notifications``, with the actor's profile) and the new count through
+the ``NotificationHub`` to any client connected to the stream endpoint. The hub is
+in-process: a client only receives events written by the worker process it is
+connected to.
+"""
+import asyncio
+import logging
+import os
+import uuid
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+from typing import AsyncIterator, Dict, List, Set, Tuple
+
+import orjson
+from pymongo import InsertOne, UpdateOne
+
+from authors import ProfileCache
+from graph import follower_id_batches
+
+logger = logging.getLogger(__name__)
+
+QUEUE_MAX = int(os.environ.get('NOTIFICATION_QUEUE_MAX', '10000'))
+ENQUEUE_TIMEOUT = float(os.environ.get('NOTIFICATION_ENQUEUE_TIMEOUT', '0.5'))
+WORKERS = int(os.environ.get('NOTIFICATION_WORKERS', '2'))
+BATCH_SIZE = 500
+MAX_COALESCED_ACTORS = 100
+
+# type -> verb used when several actors are folded into one notification
+COALESCED_TYPES = {
+    "reaction": "reacted to your post",
+    "comment": "commented on your post",
+}
+
+
+def _coalesce(doc: dict, actor_name: str) -> UpdateOne:
+    """Fold ``doc`` into the recipient's unread notification of the same type for the same post."""
+    # User-supplied strings are wrapped in $literal so a name like "$foo" isn't read as a field path.
+    lit = {k: {"$literal": v} for k, v in {**doc, "actor_name": actor_name}.items()}
+    actors = {"$ifNull": ["$actor_ids", []]}
+    count = {"$ifNull": ["$actor_count", 0]}
+    new_actor = {"$literal": [doc['actor_id']]}
+    return UpdateOne(
+        {"user_id": doc['user_id'], "type": doc['type'], "post_id": doc['post_id'], "read": False},
+        [
+            {"$set": {
+                "id": {"$ifNull": ["$id", lit['id']]},
+                "actor_count": {"$add": [count, {"$cond": [{"$in": [lit['actor_id'], actors]}, 0, 1]}]},
+                # Oldest first, the new actor moved to the end, so the slice drops the oldest
+                "actor_ids": {"$slice": [{"$concatArrays": [
+                    {"$filter": {"input": actors, "cond": {"$ne": ["$$this", lit['actor_id']]}}}, new_actor,
+                ]}, -MAX_COALESCED_ACTORS]},
+                "actor_id": lit['actor_id'],
+                "created_at": lit['created_at'],
+            }},
+            {"$set": {"message": {"$cond": [
+                {"$gt": ["$actor_count", 1]},
+                {"$concat": [
+                    lit['actor_name'], " and ", {"$toString": {"$subtract": ["$actor_count", 1]}},
+                    {"$cond": [{"$eq": ["$actor_count", 2]}, " other ", " others "]},
+                    COALESCED_TYPES[doc['type']],
+                ]},
+                lit['message'],
+            ]}}},
+        ],
+        upsert=True,
+    )
+
+
+def format_event(event: str, data) -> str:
+    """Encode one Server-Sent Events message."""
+    # Same encoder as the API responses, so dates arrive in the same format.
+    return f"event: {event}\ndata: {orjson.dumps(data, default=str).decode()}\n\n"
+
+
+class NotificationHub:
+    """In-process pub/sub from the pipeline to open notification streams."""
+
+    def __init__(self, max_buffered: int = 100):
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = defaultdict(set)
+        self._max_buffered = max_buffered
+
+    @property
+    def connections(self) -> int:
+        return sum(len(queues) for queues in self._subscribers.values())
+
+    def is_listening(self, user_id: str) -> bool:
+        return user_id in self._subscribers
+
+    def subscribe(self, user_id: str) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self._max_buffered)
+        self._subscribers[user_id].add(queue)
+        return queue
+
+    def unsubscribe(self, user_id: str, queue: asyncio.Queue):
+        queues = self._subscribers.get(user_id)
+        if queues is not None:
+            queues.discard(queue)
+            if not queues:
+                del self._subscribers[user_id]
+
+    def publish(self, user_id: str, event: str, data):
+        for queue in self._subscribers.get(user_id, ()):
+            try:
+                queue.put_nowait((event, data))
+            except asyncio.QueueFull:
+                pass  # slow client; it resyncs from the next unread_count event
+
+
+class NotificationPipeline:
+    def __init__(self, db, hub: NotificationHub, profiles: ProfileCache):
+        self.db = db
+        self.hub = hub
+        self.profiles = profiles
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=QUEUE_MAX)
+        self._workers: List[asyncio.Task] = []
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": self._queue.qsize(),
+            "queue_max": QUEUE_MAX,
+            "enqueue_timeout": ENQUEUE_TIMEOUT,
+            "workers": len(self._workers),
+            "stream_connections": self.hub.connections,
+            "written": self.written,
+            "dropped": self.dropped,
+            "failed": self.failed,
+        }
+
+    async def _put(self, job: tuple):
+        try:
+            await asyncio.wait_for(self._queue.put(job), ENQUEUE_TIMEOUT)
+        except asyncio.TimeoutError:
+            self.dropped += 1
+            logger.warning("Notification queue full (%d jobs); dropping %s job", QUEUE_MAX, job[0])
+
+    async def notify(self, doc: dict, actor_name: str):
+        """Queue one notification; ``actor_name`` is only used to word coalesced messages."""
+        await self._put(("one", doc, actor_name))
+
+    async def fan_out(self, author_id: str, template: dict):
+        """Queue one copy of ``template`` for each of ``author_id``'s followers as a single job."""
+        await self._put(("followers", author_id, template))
+
+    async def _ops(self, jobs: List[tuple]) -> AsyncIterator[Tuple]:
+        """Yield ``(operation, document, coalesced)`` for every notification in ``jobs``."""
+        for job in jobs:
+            if job[0] == "one":
+                _, doc, actor_name = job
+                if doc['type'] in COALESCED_TYPES and doc['post_id']:
+                    yield _coalesce(doc, actor_name), doc, True
+                else:
+                    yield InsertOne(doc), doc, False
+            else:
+                _, author_id, template = job
+                async for follower_ids in follower_id_batches(self.db, author_id, BATCH_SIZE):
+                    for user_id in follower_ids:
+                        doc = {**template, "id": str(uuid.uuid4()), "user_id": user_id}
+                        yield InsertOne(doc), doc, False
+
+    async def _write(self, jobs: List[tuple]):
+        batch = []
+        async for op in self._ops(jobs):
+            batch.append(op)
+            if len(batch) >= BATCH_SIZE:
+                await self._flush(batch)
+                batch = []
+        if batch:
+            await self._flush(batch)
+
+    async def _flush(self, batch: List[Tuple]):
+        try:
+            result = await self.db.notifications.bulk_write([op for op, _, _ in batch], ordered=False)
+        except Exception:
+            self.failed += len(batch)
+            logger.exception("Failed to write %d notifications", len(batch))
+            return
+        self.written += len(batch)
+
+        # Coalesced updates only add to the unread count when they created a new notification.
+        new_unread = Counter(
+            doc['user_id'] for i, (_, doc, coalesced) in enumerate(batch)
+            if not coalesced or i in result.upserted_ids
+        )
+        if new_unread:
+            now = datetime.now(timezone.utc)
+            await self.db.users.bulk_write([
+                # inbox_dirty_at queues the inbox for retention.trim_inboxes
+                UpdateOne({"id": user_id}, {"$inc": {"unread_notifications": n}, "$set": {"inbox_dirty_at": now}})
+                for user_id, n in new_unread.items()
+            ], ordered=False)
+        await self._publish(batch)
+
+    async def _publish(self, batch: List[Tuple]):
+        listening = {doc['user_id'] for _, doc, _ in batch if self.hub.is_listening(doc['user_id'])}
+        if not listening:
+            return
+        authors = await self.profiles.get_many(
+            doc['actor_id'] for _, doc, _ in batch if doc['user_id'] in listening
+        )
+        # The merged state of every coalesced notification, fetched in one query
+        keys = {
+            (doc['user_id'], doc['type'], doc['post_id'])
+            for _, doc, coalesced in batch if coalesced and doc['user_id'] in listening
+        }
+        merged = {}
+        if keys:
+            async for current in self.db.notifications.find(
+                {"$or": [{"user_id": u, "type": t, "post_id": p, "read": False} for u, t, p in keys]},
+                {"_id": 0, "actor_ids": 0},
+            ):
+                merged[(current['user_id'], current['type'], current['post_id'])] = current
+        for _, doc, coalesced in batch:
+            if doc['user_id'] not in listening:
+                continue
+            if coalesced:
+                doc = merged.get((doc['user_id'], doc['type'], doc['post_id']), doc)
+            self.hub.publish(doc['user_id'], "notification", {
+                "items": [{k: v for k, v in doc.items() if k != "_id"}],
+                "authors": {doc['actor_id']: authors[doc['actor_id']]} if doc['actor_id'] in authors else {},
+            })
+        users = await self.db.users.find(
+            {"id": {"$in": list(listening)}}, {"_id": 0, "id": 1, "unread_notifications": 1}
+        ).to_list(len(listening))
+        for user in users:
+            self.hub.publish(user['id'], "unread_count", {"count": user.get('unread_notifications', 0)})
+
+    async def _worker(self):
+        while True:
+            jobs = [await self._queue.get()]
+            while len(jobs) < BATCH_SIZE and not self._queue.empty():
+                jobs.append(self._queue.get_nowait())
+            try:
+                await self._write(jobs)
+            except Exception:
+                # Keep the worker alive; a lost batch beats a pipeline that silently stops.
+                self.failed += len(jobs)
+                logger.exception("Notification worker failed on %d jobs", len(jobs))
+            finally:
+                for _ in jobs:
+                    self._queue.task_done()
+
+    def start(self):
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(WORKERS)]
+
+    async def stop(self, timeout: float = 10):
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Shutting down with %d notification jobs still queued", self._queue.qsize())
+        for task in self._workers:
+            task.cancel()
+        self._workers = []
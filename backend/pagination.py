@@ -0,0 +1,98 @@
+"""Opaque keyset cursors over ``(created_at, id)``.
+
+A page is fetched with ``limit + 1`` documents; if the extra one comes back the
+page is trimmed and the position of its last item is returned to the client in
+the ``X-Next-Cursor`` response header. Passing that value back as ``?cursor=``
+resumes right after it, so page N costs the same index seek as page 1.
+
+``created_at`` is stored as a BSON date, so the cursor's ISO timestamp is
+parsed back into a ``datetime`` before it is compared. ``page_response``
+serializes a finished page straight to JSON with orjson, skipping the
+per-item model validation FastAPI would otherwise run for ``response_model``;
+the documents must therefore already be projected to the public fields.
+"""
+import base64
+import json
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException, Response
+from fastapi.responses import ORJSONResponse
+from pymongo import ASCENDING, DESCENDING
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 50
+
+Cursor = Tuple[Any, str]
+
+
+def clamp_limit(limit: int) -> int:
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+
+def encode_cursor(created_at: Any, item_id: str) -> str:
+    if isinstance(created_at, datetime):
+        created_at = created_at.isoformat()
+    raw = json.dumps([created_at, item_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: Optional[str]) -> Optional[Cursor]:
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, item_id = json.loads(raw)
+        if not isinstance(created_at, str) or not isinstance(item_id, str):
+            raise ValueError
+        return datetime.fromisoformat(created_at), item_id
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def keyset_query(query: dict, after: Optional[Cursor], ascending: bool = False, id_field: str = "id") -> dict:
+    if after is None:
+        return query
+    created_at, item_id = after
+    op = "$gt" if ascending else "$lt"
+    return {
+        **query,
+        "$or": [
+            {"created_at": {op: created_at}},
+            {"created_at": created_at, id_field: {op: item_id}},
+        ],
+    }
+
+
+def keyset_sort(ascending: bool = False, id_field: str = "id") -> List[Tuple[str, int]]:
+    direction = ASCENDING if ascending else DESCENDING
+    return [("created_at", direction), (id_field, direction)]
+
+
+async def fetch_page(collection, query: dict, after: Optional[Cursor], limit: int,
+                     ascending: bool = False, projection: Optional[dict] = None,
+                     id_field: str = "id") -> List[dict]:
+    """Return up to ``limit + 1`` documents after the cursor; pass the result to ``finish_page``."""
+    return await collection.find(
+        keyset_query(query, after, ascending, id_field), projection or {"_id": 0}
+    ).sort(keyset_sort(ascending, id_field)).limit(limit + 1).to_list(limit + 1)
+
+
+def finish_page(response: Response, docs: List[dict], limit: int, id_field: str = "id") -> List[dict]:
+    if len(docs) > limit:
+        docs = docs[:limit]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(docs[-1]['created_at'], docs[-1][id_field])
+    return docs
+
+
+def cursor_headers(response: Optional[Response]) -> Dict[str, str]:
+    """The cursor header ``finish_page`` set on ``response``, if any."""
+    if response is not None and NEXT_CURSOR_HEADER in response.headers:
+        return {NEXT_CURSOR_HEADER: response.headers[NEXT_CURSOR_HEADER]}
+    return {}
+
+
+def page_response(content: dict, response: Optional[Response] = None) -> ORJSONResponse:
+    """Serialize a page with orjson, carrying over the cursor header set by ``finish_page``."""
+    return ORJSONResponse(content, headers=cursor_headers(response))
@@ -0,0 +1,68 @@
+"""Password hashing off the event loop.
+
+bcrypt is deliberately slow (~100-300 ms per call) and would block every other
+request if run inside an ``async def`` handler. ``PasswordHasher`` runs it in a
+dedicated thread pool (bcrypt releases the GIL), lets at most
+``PASSWORD_HASH_CONCURRENCY`` calls run at once and turns callers away with a
+503 when they can't get a slot within ``PASSWORD_HASH_QUEUE_TIMEOUT`` seconds.
+
+Hashes made with older cost parameters are upgraded on the next successful
+login (``verify_and_update``).
+"""
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+
+from fastapi import HTTPException
+from passlib.context import CryptContext
+
+BCRYPT_ROUNDS = int(os.environ.get('BCRYPT_ROUNDS', '12'))
+CONCURRENCY = int(os.environ.get('PASSWORD_HASH_CONCURRENCY', str(os.cpu_count() or 2)))
+QUEUE_TIMEOUT = float(os.environ.get('PASSWORD_HASH_QUEUE_TIMEOUT', '2'))
+
+pwd_context = CryptContext(
+    schemes=["bcrypt"], deprecated="auto", bcrypt__default_rounds=BCRYPT_ROUNDS, bcrypt__min_rounds=BCRYPT_ROUNDS,
+)
+
+
+class PasswordHasher:
+    def __init__(self, concurrency: int = CONCURRENCY, queue_timeout: float = QUEUE_TIMEOUT):
+        self.concurrency = concurrency
+        self.queue_timeout = queue_timeout
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="bcrypt")
+        self._slots = asyncio.Semaphore(concurrency)
+        self.waiting = 0
+        self.rejected = 0
+
+    def stats(self) -> dict:
+        return {
+            "concurrency": self.concurrency,
+            "queue_timeout": self.queue_timeout,
+            "waiting": self.waiting,
+            "rejected": self.rejected,
+        }
+
+    async def _run(self, fn, *args):
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise HTTPException(status_code=503, detail="Server busy, please retry", headers={"Retry-After": "1"})
+        finally:
+            self.waiting -= 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+        finally:
+            self._slots.release()
+
+    async def hash(self, password: str) -> str:
+        return await self._run(pwd_context.hash, password)
+
+    async def verify_and_update(self, password: str, hashed: str) -> Tuple[bool, Optional[str]]:
+        """Check ``password``; also return a new hash if ``hashed`` uses outdated parameters."""
+        return await self._run(pwd_context.verify_and_update, password, hashed)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
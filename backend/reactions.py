@@ -0,0 +1,73 @@
+"""Per-user reaction documents with denormalized per-type counts on the post.
+
+Each reaction is one document in ``db.reactions`` (unique on
+``(post_id, user_id)``), changed with single atomic operations, while
+``posts.reaction_counts.<type>`` is kept in step with ``$inc``. Readers get the
+counts with the post and look up their own reactions for a page of posts in one
+indexed query instead of receiving every reaction.
+"""
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+REACTION_TYPES = ("like", "celebrate", "support", "love", "insightful")
+
+
+class ReactionStore:
+    def __init__(self, db):
+        self.db = db
+
+    async def _inc(self, post_id: str, deltas: Dict[str, int]) -> Dict[str, int]:
+        if not deltas:
+            post = await self.db.posts.find_one({"id": post_id}, {"_id": 0, "reaction_counts": 1})
+            return (post or {}).get('reaction_counts', {})
+        post = await self.db.posts.find_one_and_update(
+            {"id": post_id},
+            {"$inc": {f"reaction_counts.{t}": n for t, n in deltas.items()}},
+            projection={"_id": 0, "reaction_counts": 1},
+            return_document=ReturnDocument.AFTER,
+        )
+        return (post or {}).get('reaction_counts', {})
+
+    async def _set(self, post_id: str, user_id: str, reaction_type: str) -> Optional[dict]:
+        return await self.db.reactions.find_one_and_update(
+            {"post_id": post_id, "user_id": user_id},
+            {"$set": {"type": reaction_type}, "$setOnInsert": {"created_at": datetime.now(timezone.utc)}},
+            upsert=True,
+            return_document=ReturnDocument.BEFORE,
+        )
+
+    async def toggle(self, post_id: str, user_id: str, reaction_type: str) -> Tuple[str, Dict[str, int]]:
+        """Add, switch or remove ``user_id``'s reaction; returns the action and the new counts."""
+        removed = await self.db.reactions.find_one_and_delete(
+            {"post_id": post_id, "user_id": user_id, "type": reaction_type}
+        )
+        if removed:
+            return "removed", await self._inc(post_id, {reaction_type: -1})
+
+        try:
+            previous = await self._set(post_id, user_id, reaction_type)
+        except DuplicateKeyError:
+            # A concurrent request from the same user inserted first; update that document.
+            previous = await self._set(post_id, user_id, reaction_type)
+
+        if previous is None:
+            return "added", await self._inc(post_id, {reaction_type: 1})
+        if previous['type'] == reaction_type:
+            return "unchanged", await self._inc(post_id, {})
+        return "changed", await self._inc(post_id, {previous['type']: -1, reaction_type: 1})
+
+    async def mine(self, user_id: str, post_ids: List[str]) -> Dict[str, str]:
+        docs = await self.db.reactions.find(
+            {"user_id": user_id, "post_id": {"$in": post_ids}}, {"_id": 0, "post_id": 1, "type": 1}
+        ).to_list(len(post_ids))
+        return {d['post_id']: d['type'] for d in docs}
+
+    async def attach_mine(self, posts: List[dict], user_id: Optional[str]) -> List[dict]:
+        """Set ``my_reaction`` on each post for the requesting user (if any)."""
+        mine = await self.mine(user_id, [p['id'] for p in posts]) if user_id and posts else {}
+        for post in posts:
+            post['my_reaction'] = mine.get(post['id'])
+        return posts
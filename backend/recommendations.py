@@ -0,0 +1,208 @@
+"""Offline "people you may know" suggestions.
+
+``python recommendations.py`` loads the follow graph and per-user hashtag use
+into sparse matrices and scores every candidate pair at once:
+
+    score = FOF_WEIGHT * (F @ F) + HASHTAG_WEIGHT * (H @ H.T)
+
+``F`` is the follow adjacency matrix (row follows column), so ``(F @ F)[i, j]``
+counts the people ``i`` follows who follow ``j``. ``H`` holds each user's
+log-scaled hashtag counts with unit-length rows, so ``H @ H.T`` is the cosine
+similarity of their interests. Tags used by more than
+``SUGGESTION_MAX_TAG_USERS`` people are dropped (they say little about anyone and
+would link every pair of their users), and each user keeps only their
+``MAX_USER_TAGS`` most used, so a chunk's ``H @ H.T`` has at most
+``CHUNK_ROWS * MAX_USER_TAGS * SUGGESTION_MAX_TAG_USERS`` nonzeros whatever
+the number of users. Existing follows and the user themself are
+masked out and the best ``SUGGESTION_COUNT`` per row are stored as one document
+in ``db.suggestions``; ``GET /api/users/suggested/me`` is then a single indexed
+read.
+
+Rows are scored in independent chunks, optionally across ``--workers``
+processes. Following or unfollowing marks the follower's document stale, and
+``--incremental`` rescores only those rows (the matrices are still built from
+the whole graph).
+"""
+import argparse
+import asyncio
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from pymongo import UpdateOne
+from scipy import sparse
+
+logger = logging.getLogger(__name__)
+
+SUGGESTION_COUNT = int(os.environ.get('SUGGESTION_COUNT', '20'))
+FOF_WEIGHT = 1.0
+HASHTAG_WEIGHT = 2.0
+MAX_TAG_USERS = int(os.environ.get('SUGGESTION_MAX_TAG_USERS', '500'))
+MAX_USER_TAGS = 20
+CHUNK_ROWS = 1024
+WRITE_BATCH_SIZE = 500
+
+Scored = List[Tuple[np.ndarray, np.ndarray]]
+
+
+class SuggestionStore:
+    """Request-side access to the precomputed suggestions."""
+
+    def __init__(self, db):
+        self.db = db
+
+    async def candidates(self, user_id: str) -> List[str]:
+        doc = await self.db.suggestions.find_one({"user_id": user_id}, {"_id": 0, "candidates.user_id": 1})
+        return [c['user_id'] for c in (doc or {}).get('candidates', [])]
+
+    async def mark_stale(self, *user_ids: str):
+        now = datetime.now(timezone.utc)
+        await self.db.suggestions.bulk_write([
+            UpdateOne({"user_id": user_id}, {"$set": {"stale": True, "stale_at": now}}, upsert=True)
+            for user_id in user_ids
+        ], ordered=False)
+
+
+def _normalize_rows(m: sparse.csr_matrix) -> sparse.csr_matrix:
+    norms = np.sqrt(np.asarray(m.multiply(m).sum(axis=1)).ravel())
+    norms[norms == 0] = 1
+    return sparse.diags(1 / norms) @ m
+
+
+def _bound_tags(rows: np.ndarray, cols: np.ndarray, counts: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Drop tags with more than ``MAX_TAG_USERS`` users, then all but each user's ``MAX_USER_TAGS`` most used."""
+    users_per_tag = np.bincount(cols) if len(cols) else np.zeros(0, dtype=np.int64)
+    keep = users_per_tag[cols] <= MAX_TAG_USERS
+    rows, cols, counts = rows[keep], cols[keep], counts[keep]
+    order = np.lexsort((-counts, rows))  # by user, most used first
+    rows, cols, counts = rows[order], cols[order], counts[order]
+    first = np.searchsorted(rows, rows)  # index of each user's first entry
+    keep = np.arange(len(rows)) - first < MAX_USER_TAGS
+    return rows[keep], cols[keep], counts[keep]
+
+
+async def load_matrices(db) -> Tuple[List[str], sparse.csr_matrix, sparse.csr_matrix]:
+    """User ids plus the follow matrix ``F`` (n x n) and normalized hashtag matrix ``H`` (n x tags)."""
+    ids = [u['id'] async for u in db.users.find({}, {"_id": 0, "id": 1})]
+    index = {user_id: i for i, user_id in enumerate(ids)}
+    n = len(ids)
+
+    src, dst = [], []
+    async for edge in db.follows.find({}, {"_id": 0, "follower_id": 1, "followee_id": 1}):
+        i, j = index.get(edge['follower_id']), index.get(edge['followee_id'])
+        if i is not None and j is not None:
+            src.append(i)
+            dst.append(j)
+    follows = sparse.csr_matrix((np.ones(len(src), dtype=np.float32), (src, dst)), shape=(n, n))
+
+    tags: Dict[str, int] = {}
+    rows, cols, counts = [], [], []
+    async for row in db.posts.aggregate([
+        {"$unwind": "$hashtags"},
+        {"$group": {"_id": {"user_id": "$user_id", "tag": "$hashtags"}, "n": {"$sum": 1}}},
+    ]):
+        i = index.get(row['_id']['user_id'])
+        if i is not None:
+            rows.append(i)
+            cols.append(tags.setdefault(row['_id']['tag'], len(tags)))
+            counts.append(row['n'])
+    rows, cols, counts = _bound_tags(np.array(rows, dtype=np.int64), np.array(cols, dtype=np.int64),
+                                     np.array(counts, dtype=np.float32))
+    hashtags = sparse.csr_matrix((np.log1p(counts), (rows, cols)), shape=(n, max(len(tags), 1)))
+    return ids, follows, _normalize_rows(hashtags).tocsr()
+
+
+def score_rows(follows: sparse.csr_matrix, hashtags: sparse.csr_matrix, rows: np.ndarray,
+               top_n: int = SUGGESTION_COUNT) -> Scored:
+    """Best ``top_n`` ``(columns, scores)`` for each user in ``rows``."""
+    sub = follows[rows]
+    scores = (FOF_WEIGHT * (sub @ follows) + HASHTAG_WEIGHT * (hashtags[rows] @ hashtags.T)).tocsr()
+    self_mask = sparse.csr_matrix(
+        (np.ones(len(rows), dtype=np.float32), (np.arange(len(rows)), rows)), shape=scores.shape
+    )
+    scores = (scores - scores.multiply((sub + self_mask) > 0)).tocsr()
+    scores.eliminate_zeros()
+
+    results = []
+    for i in range(len(rows)):
+        start, end = scores.indptr[i], scores.indptr[i + 1]
+        cols, vals = scores.indices[start:end], scores.data[start:end]
+        if len(vals) > top_n:
+            keep = np.argpartition(-vals, top_n)[:top_n]
+            cols, vals = cols[keep], vals[keep]
+        order = np.argsort(-vals, kind="stable")
+        results.append((cols[order], vals[order]))
+    return results
+
+
+_worker_matrices: Optional[Tuple[sparse.csr_matrix, sparse.csr_matrix]] = None
+
+
+def _init_worker(follows: sparse.csr_matrix, hashtags: sparse.csr_matrix):
+    global _worker_matrices
+    _worker_matrices = (follows, hashtags)
+
+
+def _score_chunk(rows: np.ndarray) -> Scored:
+    return score_rows(*_worker_matrices, rows)
+
+
+async def _write(db, ids: List[str], rows: np.ndarray, scored: Scored, started: datetime):
+    ops = []
+    for row, (cols, vals) in zip(rows, scored):
+        candidates = [{"user_id": ids[c], "score": round(float(v), 4)} for c, v in zip(cols, vals)]
+        ops.append(UpdateOne({"user_id": ids[row]}, [{"$set": {
+            "candidates": {"$literal": candidates},
+            "computed_at": started,
+            # A follow that happened while this job ran keeps the row stale for the next pass.
+            "stale": {"$gt": [{"$ifNull": ["$stale_at", started]}, started]},
+        }}], upsert=True))
+    for i in range(0, len(ops), WRITE_BATCH_SIZE):
+        await db.suggestions.bulk_write(ops[i:i + WRITE_BATCH_SIZE], ordered=False)
+
+
+async def refresh(db, incremental: bool = False, workers: int = 1) -> int:
+    """Recompute suggestions for every user, or only for stale ones; returns the number of users scored."""
+    started = datetime.now(timezone.utc)
+    ids, follows, hashtags = await load_matrices(db)
+    if incremental:
+        index = {user_id: i for i, user_id in enumerate(ids)}
+        stale = [d['user_id'] async for d in db.suggestions.find({"stale": True}, {"_id": 0, "user_id": 1})]
+        rows = np.array(sorted(index[u] for u in stale if u in index), dtype=np.int64)
+    else:
+        rows = np.arange(len(ids), dtype=np.int64)
+    logger.info("Scoring %d of %d users (%d follow edges, %d hashtags)",
+                len(rows), len(ids), follows.nnz, hashtags.shape[1])
+
+    chunks = [rows[i:i + CHUNK_ROWS] for i in range(0, len(rows), CHUNK_ROWS)]
+    if workers > 1 and len(chunks) > 1:
+        loop = asyncio.get_running_loop()
+        with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(follows, hashtags)) as pool:
+            pending = [loop.run_in_executor(pool, _score_chunk, chunk) for chunk in chunks]
+            for chunk, future in zip(chunks, pending):
+                await _write(db, ids, chunk, await future, started)
+    else:
+        for chunk in chunks:
+            await _write(db, ids, chunk, score_rows(follows, hashtags, chunk), started)
+    return len(rows)
+
+
+if __name__ == '__main__':
+    from indexes import ensure_indexes
+    from server import db
+
+    parser = argparse.ArgumentParser(description="Recompute 'people you may know' suggestions.")
+    parser.add_argument("--incremental", action="store_true", help="only users whose follows changed")
+    parser.add_argument("--workers", type=int, default=1, help="processes used for scoring")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    async def main():
+        await ensure_indexes(db)
+        count = await refresh(db, args.incremental, args.workers)
+        logger.info("Stored suggestions for %d users", count)
+
+    asyncio.run(main())
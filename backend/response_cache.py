@@ -0,0 +1,204 @@
+"""Cached responses for the public read endpoints, with ETags and request coalescing.
+
+``ResponseCache.serve`` keeps the serialized body of a page as an anonymous
+caller sees it. Concurrent misses for the same key share one build, so a
+popular page that expires under load costs one round of queries, not one per
+request. Signed-in callers get the cached page with their own state
+(``my_reaction``, ``bookmarked``, ``is_following``) layered on by a
+``personalize`` callback.
+
+Every entry carries tags (``post:<id>``, ``author:<id>``, ``posts:all``...) and
+write paths call ``invalidate`` with the tags they touch; an entry built before
+one of its tags was invalidated is treated as a miss. Reactions and views are
+not invalidated, so counts on a cached page can lag by up to the TTL.
+
+Responses carry a strong ETag over the body; a matching ``If-None-Match``
+gets a 304. With ``RESPONSE_CACHE_BACKEND=mongo`` entries are also stored in
+``db.response_cache``, so every API process shares them and invalidations
+reach all of them (each process's local copy still lives out its short TTL).
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict, FrozenSet, Iterable, Optional, Tuple
+
+import orjson
+from fastapi import Request, Response
+from pymongo.errors import PyMongoError
+
+from cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+SHARED_TTL = float(os.environ.get('RESPONSE_CACHE_SHARED_TTL_SECONDS', '30'))
+# Invalidation times are kept this long; anything older than every TTL is moot.
+INVALIDATION_HORIZON = max(SHARED_TTL, 300)
+
+Build = Callable[[], Awaitable[Tuple[dict, Dict[str, str], Iterable[str]]]]
+Personalize = Callable[[dict], Awaitable[None]]
+
+
+@dataclass(frozen=True)
+class CachedResponse:
+    body: bytes
+    etag: str
+    headers: Dict[str, str]
+    tags: FrozenSet[str]
+    built_at: float
+
+
+def dumps(content) -> bytes:
+    # Same options as ORJSONResponse
+    return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+
+
+def make_etag(body: bytes) -> str:
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+class MongoCacheBackend:
+    """Entries in ``db.response_cache`` shared by every API process; a TTL index expires them."""
+
+    def __init__(self, db, ttl: float = SHARED_TTL):
+        self.db = db
+        self.ttl = ttl
+
+    async def get(self, key: str) -> Optional[CachedResponse]:
+        doc = await self.db.response_cache.find_one(
+            {"_id": key, "expires_at": {"$gt": datetime.now(timezone.utc)}}
+        )
+        if doc is None:
+            return None
+        return CachedResponse(doc['body'], doc['etag'], doc['headers'], frozenset(doc['tags']), doc['built_at'])
+
+    async def set(self, key: str, entry: CachedResponse):
+        await self.db.response_cache.replace_one({"_id": key}, {
+            "body": entry.body,
+            "etag": entry.etag,
+            "headers": entry.headers,
+            "tags": list(entry.tags),
+            "built_at": entry.built_at,
+            "expires_at": datetime.now(timezone.utc) + timedelta(seconds=self.ttl),
+        }, upsert=True)
+
+    async def invalidate(self, tags: Iterable[str]):
+        await self.db.response_cache.delete_many({"tags": {"$in": list(tags)}})
+
+
+class ResponseCache:
+    def __init__(self, local: TTLCache, shared: Optional[MongoCacheBackend] = None):
+        self.local = local
+        self.shared = shared
+        self._invalidated: Dict[str, float] = {}
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.not_modified = 0
+        self.invalidations = 0
+
+    def _fresh(self, entry: CachedResponse) -> bool:
+        return all(self._invalidated.get(tag, 0) < entry.built_at for tag in entry.tags)
+
+    async def get(self, key: str, build: Build) -> CachedResponse:
+        entry = self.local.get(key)
+        if entry is not None and self._fresh(entry):
+            self.hits += 1
+            return entry
+        task = self._inflight.get(key)
+        if task is None:
+            task = self._inflight[key] = asyncio.ensure_future(self._load(key, build))
+            task.add_done_callback(lambda t: self._inflight.pop(key) if self._inflight.get(key) is t else None)
+        else:
+            self.coalesced += 1
+        # Shielded so one caller disconnecting doesn't cancel the build the others wait on.
+        return await asyncio.shield(task)
+
+    async def _load(self, key: str, build: Build) -> CachedResponse:
+        if self.shared is not None:
+            try:
+                entry = await self.shared.get(key)
+            except PyMongoError:
+                logger.warning("Shared response cache read failed", exc_info=True)
+                entry = None
+            if entry is not None and self._fresh(entry):
+                self.shared_hits += 1
+                self.local.set(key, entry)
+                return entry
+        self.misses += 1
+        started = time.time()
+        content, headers, tags = await build()
+        body = dumps(content)
+        entry = CachedResponse(body, make_etag(body), headers, frozenset(tags), started)
+        # A write that landed while this was building leaves it stale; serve it once, don't keep it.
+        if self._fresh(entry):
+            self.local.set(key, entry)
+            if self.shared is not None:
+                try:
+                    await self.shared.set(key, entry)
+                except PyMongoError:
+                    logger.warning("Shared response cache write failed", exc_info=True)
+        return entry
+
+    async def invalidate(self, *tags: str):
+        now = time.time()
+        for tag in tags:
+            self._invalidated[tag] = now
+        self.invalidations += len(tags)
+        if len(self._invalidated) > 10 * self.local.maxsize:
+            horizon = now - INVALIDATION_HORIZON
+            self._invalidated = {t: at for t, at in self._invalidated.items() if at > horizon}
+        if self.shared is not None:
+            try:
+                await self.shared.invalidate(tags)
+            except PyMongoError:
+                logger.warning("Shared response cache invalidation failed", exc_info=True)
+
+    def respond(self, request: Request, body: bytes, etag: str, headers: Dict[str, str], private: bool) -> Response:
+        headers = {
+            **headers,
+            "ETag": etag,
+            # Browsers and proxies may keep the body but must revalidate it every time.
+            "Cache-Control": "private, no-cache" if private else "public, no-cache",
+            "Vary": "Authorization",
+        }
+        if etag in request.headers.get("if-none-match", ""):
+            self.not_modified += 1
+            return Response(status_code=304, headers=headers)
+        return Response(body, media_type="application/json", headers=headers)
+
+    async def serve(self, request: Request, key: str, build: Build, personalize: Optional[Personalize] = None) -> Response:
+        """Respond from the cache, building the anonymous page with ``build`` on a miss.
+
+        ``build`` returns ``(content, headers, tags)``; ``personalize``, when
+        given, adds the caller's own state to a copy of the cached content.
+        """
+        entry = await self.get(key, build)
+        if personalize is None:
+            return self.respond(request, entry.body, entry.etag, entry.headers, private=False)
+        content = orjson.loads(entry.body)
+        await personalize(content)
+        body = dumps(content)
+        return self.respond(request, body, make_etag(body), entry.headers, private=True)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.shared_hits + self.misses
+        return {
+            "size": len(self.local),
+            "maxsize": self.local.maxsize,
+            "ttl": self.local.ttl,
+            "shared": self.shared is not None,
+            "hits": self.hits,
+            "shared_hits": self.shared_hits,
+            "misses": self.misses,
+            "hit_ratio": round((self.hits + self.shared_hits) / lookups, 4) if lookups else None,
+            "coalesced": self.coalesced,
+            "not_modified": self.not_modified,
+            "invalidations": self.invalidations,
+            "inflight": len(self._inflight),
+        }
@@ -0,0 +1,158 @@
+"""Notification retention: read expiry, per-user inbox caps and archival export.
+
+* Marking notifications read stamps ``read_at``; a TTL index on it removes them
+  ``NOTIFICATION_READ_TTL_DAYS`` later. Unread notifications never expire, so
+  ``users.unread_notifications`` stays in step with what is stored.
+* Every inbox keeps only its newest ``NOTIFICATION_INBOX_MAX`` notifications.
+  The pipeline stamps ``users.inbox_dirty_at`` when it writes to an inbox and
+  the ``trim_inboxes`` job (every ``NOTIFICATION_TRIM_SECONDS``) cuts each
+  flagged inbox back to the cap in throttled batches, subtracting the unread
+  ones it removed from the user's counter.
+* ``python retention.py export`` writes notifications older than a cutoff to
+  gzipped JSON lines and, with ``--delete``, removes them, for installs that
+  must keep history outside the working set.
+"""
+import argparse
+import asyncio
+import gzip
+import logging
+import os
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import Dict
+
+import orjson
+from pymongo import ASCENDING, UpdateOne
+from pymongo.errors import OperationFailure
+
+from jobs import BATCH_PAUSE, BATCH_SIZE, JobRunner
+from pagination import keyset_query, keyset_sort
+
+logger = logging.getLogger(__name__)
+
+READ_TTL_SECONDS = int(float(os.environ.get('NOTIFICATION_READ_TTL_DAYS', '30')) * 86400)
+INBOX_MAX = int(os.environ.get('NOTIFICATION_INBOX_MAX', '500'))
+TRIM_SECONDS = float(os.environ.get('NOTIFICATION_TRIM_SECONDS', '300'))
+TTL_INDEX = "read_at_ttl"
+INDEX_OPTIONS_CONFLICT = 85
+
+
+async def ensure_ttl_index(db):
+    """Create the ``read_at`` TTL index, or apply a changed ``NOTIFICATION_READ_TTL_DAYS`` to it.
+
+    Kept out of ``indexes.INDEXES``: a changed expiry makes ``create_indexes``
+    fail with IndexOptionsConflict, which would fail the whole notifications batch.
+    """
+    try:
+        await db.notifications.create_index(
+            [("read_at", ASCENDING)], name=TTL_INDEX, expireAfterSeconds=READ_TTL_SECONDS
+        )
+        return
+    except OperationFailure as e:
+        if e.code != INDEX_OPTIONS_CONFLICT:
+            logger.error("Could not create the notification TTL index: %s", e)
+            return
+    try:
+        await db.command({
+            "collMod": "notifications",
+            "index": {"name": TTL_INDEX, "expireAfterSeconds": READ_TTL_SECONDS},
+        })
+    except OperationFailure as e:
+        logger.error("Could not update the notification TTL: %s", e)
+
+
+async def subtract_unread(db, counts: Dict[str, int]):
+    """Take ``counts`` deleted unread notifications off each user's ``unread_notifications``, never below 0."""
+    if counts:
+        await db.users.bulk_write([
+            UpdateOne({"id": user_id}, [{"$set": {"unread_notifications": {
+                "$max": [0, {"$subtract": [{"$ifNull": ["$unread_notifications", 0]}, n]}],
+            }}}])
+            for user_id, n in counts.items()
+        ], ordered=False)
+
+
+async def trim_inbox(runner: JobRunner, job: dict, user_id: str) -> int:
+    """Delete everything past the user's newest ``INBOX_MAX`` notifications; returns the number deleted."""
+    db = runner.db
+    last_kept = await db.notifications.find(
+        {"user_id": user_id}, {"_id": 0, "created_at": 1, "id": 1}
+    ).sort(keyset_sort()).skip(INBOX_MAX - 1).limit(1).to_list(1)
+    if not last_kept:
+        return 0
+    older = keyset_query({"user_id": user_id}, (last_kept[0]['created_at'], last_kept[0]['id']))
+    unread = await db.notifications.count_documents({**older, "read": False})
+    deleted = await runner.delete_in_batches(job, "notifications", older)
+    await subtract_unread(db, {user_id: unread})
+    return deleted
+
+
+async def trim_inboxes(runner: JobRunner, job: dict):
+    db = runner.db
+    started = datetime.now(timezone.utc)
+    # Only inboxes written before this run; later writes are left for the next one.
+    flagged = {"inbox_dirty_at": {"$lte": started}}
+    trimmed = 0
+    while True:
+        users = await db.users.find(flagged, {"_id": 0, "id": 1}).limit(BATCH_SIZE).to_list(BATCH_SIZE)
+        if not users:
+            break
+        ids = [u['id'] for u in users]
+        # Cleared before trimming, so a write that lands meanwhile flags the inbox again.
+        await db.users.update_many({"id": {"$in": ids}, **flagged}, {"$unset": {"inbox_dirty_at": ""}})
+        for user_id in ids:
+            trimmed += await trim_inbox(runner, job, user_id)
+        await runner.renew(job)
+        await asyncio.sleep(BATCH_PAUSE)
+    if trimmed:
+        logger.info("Trimmed %d notifications from inboxes over %d", trimmed, INBOX_MAX)
+
+
+def register(runner: JobRunner):
+    runner.register("trim_inboxes", trim_inboxes, every=TRIM_SECONDS)
+
+
+async def export(db, out: str, before: datetime, delete: bool = False) -> int:
+    """Write notifications created before ``before`` to ``out`` (gzipped JSON lines); returns the count."""
+    exported = 0
+    with gzip.open(out, "wb") as f:
+        batch, unread = [], Counter()
+
+        async def flush():
+            # Written (and flushed) before anything is deleted
+            f.flush()
+            if delete:
+                await db.notifications.delete_many({"_id": {"$in": batch}})
+                await subtract_unread(db, unread)
+            batch.clear()
+            unread.clear()
+
+        async for doc in db.notifications.find({"created_at": {"$lt": before}}):
+            batch.append(doc.pop('_id'))
+            if not doc.get('read'):
+                unread[doc['user_id']] += 1
+            f.write(orjson.dumps(doc, default=str) + b"\n")
+            exported += 1
+            if len(batch) >= BATCH_SIZE:
+                await flush()
+        await flush()
+    return exported
+
+
+if __name__ == '__main__':
+    # python retention.py export --out notifications.jsonl.gz --older-than-days 180 [--delete]
+    from server import db
+
+    parser = argparse.ArgumentParser(description="Archive old notifications.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    export_parser = sub.add_parser("export", help="write notifications older than a cutoff to a .jsonl.gz file")
+    export_parser.add_argument("--out", required=True)
+    export_parser.add_argument("--older-than-days", type=float, required=True)
+    export_parser.add_argument("--delete", action="store_true", help="remove exported notifications")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    cutoff = datetime.now(timezone.utc) - timedelta(days=args.older_than_days)
+    count = asyncio.run(export(db, args.out, cutoff, args.delete))
+    logger.info("Exported %d notifications created before %s to %s%s",
+                count, cutoff.isoformat(), args.out, " and deleted them" if args.delete else "")
@@ -0,0 +1,163 @@
+"""Inverted-index search over posts and users.
+
+Documents are tokenized into normalized terms and stored as postings in
+``db.search_postings`` (``{kind, term, doc_id, weight, created_at}``). A query
+looks up each of its terms with an indexed equality match (the last term as an
+anchored prefix range, so results update while typing), intersects the posting
+lists and ranks by term weight plus recency. Cost scales with the number of
+matching postings, not with the size of ``posts`` or ``users``.
+
+``python search.py`` rebuilds the whole index.
+"""
+import asyncio
+import logging
+import math
+import re
+import unicodedata
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+from typing import Dict, List
+
+from pymongo import DESCENDING, InsertOne
+
+logger = logging.getLogger(__name__)
+
+POST = "post"
+USER = "user"
+
+# Field weights: a hit in a hashtag or a name counts more than one in body text.
+POST_FIELDS = {"content": 1, "hashtags": 3}
+USER_FIELDS = {"name": 3, "headline": 1}
+
+MAX_QUERY_TERMS = 8
+MAX_POSTINGS_PER_TERM = 1000
+MAX_TERM_LENGTH = 40
+RECENCY_HALF_LIFE_DAYS = 7
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def normalize(text: str) -> str:
+    text = unicodedata.normalize("NFKD", text or "")
+    return "".join(c for c in text if not unicodedata.combining(c)).casefold()
+
+
+def tokenize(text: str) -> List[str]:
+    return [t[:MAX_TERM_LENGTH] for t in _TOKEN_RE.findall(normalize(text))]
+
+
+def _field_text(value) -> str:
+    return " ".join(value) if isinstance(value, list) else (value or "")
+
+
+def _term_weights(doc: dict, fields: Dict[str, int]) -> Counter:
+    weights = Counter()
+    for field, weight in fields.items():
+        for term in tokenize(_field_text(doc.get(field))):
+            weights[term] += weight
+    return weights
+
+
+def _as_datetime(value) -> datetime:
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value
+
+
+def _rank(weight: int, created_at, now: datetime) -> float:
+    age_days = max((now - _as_datetime(created_at)).total_seconds(), 0) / 86400
+    recency = 0.5 ** (age_days / RECENCY_HALF_LIFE_DAYS)
+    return (1 + math.log(weight)) * (1 + recency)
+
+
+class SearchIndex:
+    def __init__(self, db):
+        self.db = db
+
+    async def _index(self, kind: str, doc: dict, fields: Dict[str, int]):
+        await self.remove(kind, doc['id'])
+        postings = [
+            InsertOne({"kind": kind, "term": term, "doc_id": doc['id'], "weight": weight,
+                       "created_at": doc['created_at']})
+            for term, weight in _term_weights(doc, fields).items()
+        ]
+        if postings:
+            await self.db.search_postings.bulk_write(postings, ordered=False)
+
+    async def index_post(self, post: dict):
+        await self._index(POST, post, POST_FIELDS)
+
+    async def index_user(self, user: dict):
+        await self._index(USER, user, USER_FIELDS)
+
+    async def remove(self, kind: str, doc_id: str):
+        await self.db.search_postings.delete_many({"kind": kind, "doc_id": doc_id})
+
+    async def _postings(self, kind: str, term: str, prefix: bool) -> List[dict]:
+        match = {"$gte": term, "$lt": term + "\uffff"} if prefix else term
+        return await self.db.search_postings.find(
+            {"kind": kind, "term": match}, {"_id": 0, "doc_id": 1, "weight": 1, "created_at": 1}
+        ).sort("created_at", DESCENDING).limit(MAX_POSTINGS_PER_TERM).to_list(MAX_POSTINGS_PER_TERM)
+
+    async def query(self, kind: str, q: str, limit: int) -> List[str]:
+        """Return ids of the best ``limit`` documents matching every term of ``q``."""
+        terms = list(dict.fromkeys(tokenize(q)))[:MAX_QUERY_TERMS]
+        if not terms:
+            return []
+        # The last term is still being typed unless the query ends in a separator.
+        prefix_last = not q[-1:].isspace()
+
+        weights: Dict[str, int] = defaultdict(int)
+        created: Dict[str, object] = {}
+        matched: Dict[str, int] = defaultdict(int)
+        for i, term in enumerate(terms):
+            hits = {}
+            for p in await self._postings(kind, term, prefix_last and i == len(terms) - 1):
+                hits[p['doc_id']] = max(hits.get(p['doc_id'], 0), p['weight'])
+                created[p['doc_id']] = p['created_at']
+            for doc_id, weight in hits.items():
+                weights[doc_id] += weight
+                matched[doc_id] += 1
+
+        now = datetime.now(timezone.utc)
+        ranked = sorted(
+            (doc_id for doc_id, n in matched.items() if n == len(terms)),
+            key=lambda doc_id: _rank(weights[doc_id], created[doc_id], now),
+            reverse=True,
+        )
+        return ranked[:limit]
+
+    async def search(self, kind: str, q: str, limit: int, projection: dict) -> List[dict]:
+        ids = await self.query(kind, q, limit)
+        if not ids:
+            return []
+        collection = self.db.posts if kind == POST else self.db.users
+        docs = await collection.find({"id": {"$in": ids}}, projection).to_list(len(ids))
+        by_id = {d['id']: d for d in docs}
+        return [by_id[i] for i in ids if i in by_id]
+
+    async def rebuild(self):
+        await self.db.search_postings.delete_many({})
+        counts = Counter()
+        async for post in self.db.posts.find({}, {"_id": 0, "id": 1, "content": 1, "hashtags": 1, "created_at": 1}):
+            await self.index_post(post)
+            counts[POST] += 1
+        async for user in self.db.users.find({}, {"_id": 0, "id": 1, "name": 1, "headline": 1, "created_at": 1}):
+            await self.index_user(user)
+            counts[USER] += 1
+        logger.info("Indexed %d posts and %d users", counts[POST], counts[USER])
+        return counts
+
+
+if __name__ == '__main__':
+    # python search.py  -- rebuild the search index from posts and users
+    from indexes import ensure_indexes
+    from server import db
+
+    logging.basicConfig(level=logging.INFO)
+
+    async def main():
+        await ensure_indexes(db)
+        await SearchIndex(db).rebuild()
+
+    asyncio.run(main())
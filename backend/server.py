@@ -1,19 +1,47 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, UploadFile, File, Query
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, UploadFile, File, Query, Request, Response
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument
 import os
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field, ConfigDict, EmailStr
-from typing import List, Optional
+from typing import Dict, Generic, List, Optional, TypeVar
 import uuid
 from datetime import datetime, timezone, timedelta
 import jwt
-from passlib.context import CryptContext
-import base64
+import asyncio
 import re
+from timeline import TimelineStore
+from indexes import ensure_indexes
+from search import POST, USER, SearchIndex
+from trending import (
+    COMMENT_WEIGHT, NEW_POST_HASHTAG_WEIGHT, REACTION_WEIGHT, VIEW_WEIGHT, TrendingEngine,
+)
+from view_counter import ViewCounter
+from reactions import REACTION_TYPES, ReactionStore
+from comments import MAX_PREVIEW as MAX_COMMENT_PREVIEW, CommentStore
+from bookmarks import BookmarkStore
+from jobs import JobRunner
+import cleanup
+import retention
+from notifications import NotificationHub, NotificationPipeline, format_event
+from cache import TTLCache
+from response_cache import MongoCacheBackend, ResponseCache
+from passwords import PasswordHasher
+from admission import CHEAP, EXEMPT, EXPENSIVE, STATIC, AdmissionControl, AdmissionMiddleware
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, REGISTRY, CommandMetrics, MetricsMiddleware
+from authors import AuthorLoader, ProfileCache
+from graph import FollowGraph
+from recommendations import SuggestionStore
+from media import CACHE_CONTROL as MEDIA_CACHE_CONTROL, ORIGINAL, MediaStore, iter_file, parse_range
+from pagination import (
+    DEFAULT_PAGE_SIZE, NEXT_CURSOR_HEADER, clamp_limit, cursor_headers, decode_cursor, fetch_page, finish_page,
+    page_response,
+)
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -23,16 +51,53 @@ mongo_url = os.environ.get('MONGO_URL', os.environ.get('MONGO_URL'))
 if not mongo_url:
     raise Exception("MONGO_URL environment variable is not set!")
 
-client = AsyncIOMotorClient(mongo_url)
+client = AsyncIOMotorClient(mongo_url, tz_aware=True, event_listeners=[CommandMetrics()])
 db_name = os.environ.get('DB_NAME', 'careerpulse_db')
 db = client[db_name]
+timeline_store = TimelineStore(db)
+search_index = SearchIndex(db)
+trending_engine = TrendingEngine(db)
+view_counter = ViewCounter(db)
+reaction_store = ReactionStore(db)
+comment_store = CommentStore(db)
+bookmark_store = BookmarkStore(db)
+job_runner = JobRunner(db)
+cleanup.register(job_runner)
+retention.register(job_runner)
+follow_graph = FollowGraph(db)
+suggestion_store = SuggestionStore(db)
+notification_hub = NotificationHub()
+# Resolved principals, invalidated on profile/follow writes in this process;
+# the TTL bounds staleness when another worker made the change.
+AUTH_CACHE_TTL = float(os.environ.get('AUTH_CACHE_TTL_SECONDS', '30'))
+AUTH_CACHE_SIZE = int(os.environ.get('AUTH_CACHE_SIZE', '10000'))
+user_cache = TTLCache(AUTH_CACHE_SIZE, AUTH_CACHE_TTL)
+principal_cache = TTLCache(AUTH_CACHE_SIZE, AUTH_CACHE_TTL)
+# Author profiles shown next to posts, comments and notifications
+PROFILE_CACHE_TTL = float(os.environ.get('PROFILE_CACHE_TTL_SECONDS', '10'))
+profile_cache = ProfileCache(db, TTLCache(AUTH_CACHE_SIZE, PROFILE_CACHE_TTL))
+notification_pipeline = NotificationPipeline(db, notification_hub, profile_cache)
+# Anonymous renderings of the public read endpoints, shared by every caller
+RESPONSE_CACHE_TTL = float(os.environ.get('RESPONSE_CACHE_TTL_SECONDS', '5'))
+RESPONSE_CACHE_SIZE = int(os.environ.get('RESPONSE_CACHE_SIZE', '2000'))
+response_cache = ResponseCache(
+    TTLCache(RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL),
+    MongoCacheBackend(db) if os.environ.get('RESPONSE_CACHE_BACKEND') == 'mongo' else None,
+)
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+password_hasher = PasswordHasher()
+media_store = MediaStore(db)
 security = HTTPBearer()
+optional_security = HTTPBearer(auto_error=False)
 SECRET_KEY = os.environ.get('JWT_SECRET', 'your-secret-key-change-in-production')
 ALGORITHM = "HS256"
+STREAM_KEEPALIVE_SECONDS = 25
+# EventSource can't send headers, so the stream is opened with a short-lived token in the URL instead of the session JWT
+STREAM_TOKEN_SECONDS = int(os.environ.get('NOTIFICATION_STREAM_TOKEN_SECONDS', '60'))
+STREAM_TOKEN_SCOPE = "notifications:stream"
+SUGGESTED_USERS_LIMIT = 5
 
-app = FastAPI()
+app = FastAPI(default_response_class=ORJSONResponse)
 api_router = APIRouter(prefix="/api")
 
 # Models
@@ -65,11 +130,38 @@ class User(BaseModel):
     cover_image: Optional[str] = ""
     location: Optional[str] = ""
     website: Optional[str] = ""
-    followers: List[str] = Field(default_factory=list)
-    following: List[str] = Field(default_factory=list)
-    bookmarks: List[str] = Field(default_factory=list)
+    followers_count: int = 0
+    following_count: int = 0
+    unread_notifications: int = 0
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
+class UserProfile(BaseModel):
+    # What anyone may see of another user; never the email or bookkeeping fields like unread_notifications
+    model_config = ConfigDict(extra="ignore")
+    id: str
+    name: str
+    headline: Optional[str] = ""
+    bio: Optional[str] = ""
+    avatar: Optional[str] = ""
+    cover_image: Optional[str] = ""
+    location: Optional[str] = ""
+    website: Optional[str] = ""
+    followers_count: int = 0
+    following_count: int = 0
+    created_at: datetime
+    # Whether the requesting user follows this one (None when anonymous)
+    is_following: Optional[bool] = None
+
+class Principal(BaseModel):
+    model_config = ConfigDict(extra="ignore", frozen=True)
+    id: str
+    name: str
+    headline: Optional[str] = ""
+    avatar: Optional[str] = ""
+
+PRINCIPAL_PROJECTION = {"_id": 0, "id": 1, "name": 1, "headline": 1, "avatar": 1}
+PUBLIC_PROFILE_PROJECTION = {"_id": 0, **{field: 1 for field in UserProfile.model_fields if field != "is_following"}}
+
 class PostCreate(BaseModel):
     content: str
     image: Optional[str] = None
@@ -78,6 +170,9 @@ class PostCreate(BaseModel):
 class PostUpdate(BaseModel):
     content: Optional[str] = None
 
+class ViewBatch(BaseModel):
+    post_ids: List[str] = Field(..., max_length=100)
+
 class Reaction(BaseModel):
     user_id: str
     type: str  # like, celebrate, support, love, insightful
@@ -86,14 +181,16 @@ class Post(BaseModel):
     model_config = ConfigDict(extra="ignore")
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     user_id: str
-    user_name: str
-    user_headline: Optional[str] = ""
-    user_avatar: Optional[str] = ""
     content: str
     image: Optional[str] = None
     hashtags: List[str] = Field(default_factory=list)
-    reactions: List[dict] = Field(default_factory=list)
+    reaction_counts: Dict[str, int] = Field(default_factory=dict)
+    my_reaction: Optional[str] = None
+    bookmarked: bool = False
     views: int = 0
+    comment_count: int = 0
+    # Newest comments first, only when the feed is requested with ?comments=N
+    latest_comments: Optional[List["Comment"]] = None
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 class Comment(BaseModel):
@@ -101,12 +198,17 @@ class Comment(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     post_id: str
     user_id: str
-    user_name: str
-    user_headline: Optional[str] = ""
-    user_avatar: Optional[str] = ""
     content: str
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
+Post.model_rebuild()
+
+T = TypeVar("T")
+
+class Page(BaseModel, Generic[T]):
+    items: List[T]
+    authors: Dict[str, Principal] = Field(default_factory=dict)
+
 class CommentCreate(BaseModel):
     content: str
 
@@ -116,18 +218,14 @@ class NotificationModel(BaseModel):
     user_id: str
     type: str  # follow, reaction, comment
     actor_id: str
-    actor_name: str
-    actor_avatar: Optional[str] = ""
     post_id: Optional[str] = None
     message: str
+    actor_count: int = 1
     read: bool = False
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
-def hash_password(password: str) -> str:
-    return pwd_context.hash(password)
-
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+# page_response skips response_model filtering, so pages are projected to the model's fields
+NOTIFICATION_PROJECTION = {"_id": 0, **{field: 1 for field in NotificationModel.model_fields}}
 
 def create_access_token(data: dict):
     to_encode = data.copy()
@@ -136,37 +234,87 @@ def create_access_token(data: dict):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+def create_stream_token(user_id: str) -> str:
+    expire = datetime.now(timezone.utc) + timedelta(seconds=STREAM_TOKEN_SECONDS)
+    return jwt.encode({"sub": user_id, "scope": STREAM_TOKEN_SCOPE, "exp": expire}, SECRET_KEY, algorithm=ALGORITHM)
+
+def get_token_user_id(credentials: HTTPAuthorizationCredentials = Depends(security)) -> str:
     try:
-        token = credentials.credentials
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id: str = payload.get("sub")
-        if user_id is None:
-            raise HTTPException(status_code=401, detail="Invalid authentication")
-        user = await db.users.find_one({"id": user_id}, {"_id": 0})
-        if user is None:
-            raise HTTPException(status_code=401, detail="User not found")
-        if isinstance(user['created_at'], str):
-            user['created_at'] = datetime.fromisoformat(user['created_at'])
-        return User(**user)
+        payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM])
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token expired")
-    except Exception:
+    except jwt.PyJWTError:
+        raise HTTPException(status_code=401, detail="Invalid authentication")
+    user_id = payload.get("sub")
+    # Scoped tokens (e.g. stream tokens) are not sessions
+    if user_id is None or "scope" in payload:
         raise HTTPException(status_code=401, detail="Invalid authentication")
+    return user_id
+
+async def get_current_user(user_id: str = Depends(get_token_user_id)) -> User:
+    user = user_cache.get(user_id)
+    if user is None:
+        user_doc = await db.users.find_one({"id": user_id}, {"_id": 0, "password": 0})
+        if user_doc is None:
+            raise HTTPException(status_code=401, detail="User not found")
+        user = User(**user_doc)
+        user_cache.set(user_id, user)
+    # Handlers may mutate their copy; the cached instance stays untouched
+    return user.model_copy(deep=True)
+
+async def get_current_principal(user_id: str = Depends(get_token_user_id)) -> Principal:
+    # For routes that only need who is calling: no profile details
+    principal = principal_cache.get(user_id)
+    if principal is None:
+        user = user_cache.get(user_id)
+        if user is None:
+            user = await db.users.find_one({"id": user_id}, PRINCIPAL_PROJECTION)
+            if user is None:
+                raise HTTPException(status_code=401, detail="User not found")
+        principal = Principal.model_validate(user, from_attributes=True)
+        principal_cache.set(user_id, principal)
+    return principal
+
+async def invalidate_user(*user_ids: str):
+    user_cache.invalidate(*user_ids)
+    principal_cache.invalidate(*user_ids)
+    profile_cache.invalidate(*user_ids)
+    await response_cache.invalidate(*(f"profile:{i}" for i in user_ids))
+
+def get_author_loader() -> AuthorLoader:
+    # One per request, so batching and memoization never leak between requests
+    return AuthorLoader(profile_cache)
+
+def user_id_from_token(token: str, scope: Optional[str] = None) -> Optional[str]:
+    """The user a valid token was issued to; a session token unless ``scope`` is given."""
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except jwt.PyJWTError:
+        return None
+    if payload.get("scope") != scope:
+        return None
+    return payload.get("sub")
+
+def get_optional_user_id(credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security)) -> Optional[str]:
+    # Token-only identity for public routes; no database lookup.
+    if credentials is None:
+        return None
+    return user_id_from_token(credentials.credentials)
 
-async def create_notification(user_id: str, type: str, actor_id: str, actor_name: str, actor_avatar: str, message: str, post_id: Optional[str] = None):
+def build_notification(user_id: str, type: str, actor_id: str, message: str, post_id: Optional[str] = None) -> dict:
     notification = NotificationModel(
         user_id=user_id,
         type=type,
         actor_id=actor_id,
-        actor_name=actor_name,
-        actor_avatar=actor_avatar,
         post_id=post_id,
         message=message
     )
     notif_dict = notification.model_dump()
-    notif_dict['created_at'] = notif_dict['created_at'].isoformat()
-    await db.notifications.insert_one(notif_dict)
+    return notif_dict
+
+async def create_notification(user_id: str, type: str, actor: Principal, message: str, post_id: Optional[str] = None):
+    # Queued; written in batches by the notification pipeline workers
+    await notification_pipeline.notify(build_notification(user_id, type, actor.id, message, post_id), actor.name)
 
 # Auth Routes
 @api_router.post("/auth/signup")
@@ -185,10 +333,10 @@ async def signup(user_data: UserCreate):
     )
     
     user_dict = user.model_dump()
-    user_dict['password'] = hash_password(user_data.password)
-    user_dict['created_at'] = user_dict['created_at'].isoformat()
+    user_dict['password'] = await password_hasher.hash(user_data.password)
     
     await db.users.insert_one(user_dict)
+    await search_index.index_user(user_dict)
     
     token = create_access_token({"sub": user.id})
     return {"token": token, "user": user}
@@ -196,11 +344,13 @@ async def signup(user_data: UserCreate):
 @api_router.post("/auth/login")
 async def login(credentials: UserLogin):
     user = await db.users.find_one({"email": credentials.email}, {"_id": 0})
-    if not user or not verify_password(credentials.password, user['password']):
+    if not user:
         raise HTTPException(status_code=401, detail="Invalid email or password")
-    
-    if isinstance(user['created_at'], str):
-        user['created_at'] = datetime.fromisoformat(user['created_at'])
+    valid, new_hash = await password_hasher.verify_and_update(credentials.password, user['password'])
+    if not valid:
+        raise HTTPException(status_code=401, detail="Invalid email or password")
+    if new_hash:
+        await db.users.update_one({"id": user['id']}, {"$set": {"password": new_hash}})
     
     user_obj = User(**user)
     token = create_access_token({"sub": user_obj.id})
@@ -222,107 +372,161 @@ async def update_profile(
         if value is not None:
             update_data[field] = value
     
+    await media_store.check(update_data.get('avatar'), update_data.get('cover_image'))
     if update_data:
         await db.users.update_one({"id": current_user.id}, {"$set": update_data})
+        await invalidate_user(current_user.id)
+        # Pages showing this user as an author
+        await response_cache.invalidate(f"author:{current_user.id}")
         for key, value in update_data.items():
             setattr(current_user, key, value)
+        if update_data.keys() & {"name", "headline"}:
+            await search_index.index_user(current_user.model_dump())
     
     return current_user
 
 # Post Routes
 @api_router.post("/posts", response_model=Post)
 async def create_post(post_data: PostCreate, current_user: User = Depends(get_current_user)):
+    await media_store.check(post_data.image)
     hashtags = re.findall(r'#\w+', post_data.content)
     hashtags = [tag.lower() for tag in hashtags]
     
     post = Post(
         user_id=current_user.id,
-        user_name=current_user.name,
-        user_headline=current_user.headline or "",
-        user_avatar=current_user.avatar or "",
         content=post_data.content,
         image=post_data.image,
         hashtags=hashtags
     )
     
-    post_dict = post.model_dump()
-    post_dict['created_at'] = post_dict['created_at'].isoformat()
+    post_dict = post.model_dump(exclude={"my_reaction", "bookmarked", "latest_comments"})
     
     await db.posts.insert_one(post_dict)
+    await timeline_store.fan_out(post_dict, current_user.followers_count)
+    await search_index.index_post(post_dict)
+    trending_engine.record_hashtags(hashtags, NEW_POST_HASHTAG_WEIGHT)
+    await response_cache.invalidate("posts:all", f"posts:user:{current_user.id}")
     
-    # Notify followers
-    followers = current_user.followers
-    for follower_id in followers[:20]:  # Limit to 20 notifications
-        await create_notification(
-            follower_id, "post", current_user.id, current_user.name, 
-            current_user.avatar or "", f"{current_user.name} created a new post", post.id
-        )
+    # Notify all followers in the background
+    await notification_pipeline.fan_out(current_user.id, build_notification(
+        "", "post", current_user.id, f"{current_user.name} created a new post", post.id
+    ))
     
     return post
 
-@api_router.get("/posts", response_model=List[Post])
-async def get_posts(skip: int = 0, limit: int = 20, current_user: User = Depends(get_current_user)):
-    # Get posts from followed users + own posts
-    following_ids = current_user.following + [current_user.id]
-    posts = await db.posts.find(
-        {"user_id": {"$in": following_ids}}, 
-        {"_id": 0}
-    ).sort("created_at", -1).skip(skip).limit(limit).to_list(limit)
-    
-    for post in posts:
-        if isinstance(post['created_at'], str):
-            post['created_at'] = datetime.fromisoformat(post['created_at'])
-    
-    return posts
+async def _attach_viewer(posts: List[dict], viewer_id: Optional[str]):
+    await reaction_store.attach_mine(posts, viewer_id)
+    await bookmark_store.attach_mine(posts, viewer_id)
 
-@api_router.get("/posts/all", response_model=List[Post])
-async def get_all_posts(skip: int = 0, limit: int = 20):
-    posts = await db.posts.find({}, {"_id": 0}).sort("created_at", -1).skip(skip).limit(limit).to_list(limit)
-    
-    for post in posts:
-        if isinstance(post['created_at'], str):
-            post['created_at'] = datetime.fromisoformat(post['created_at'])
-    
-    return posts
+async def _build_post_page(posts: List[dict], viewer_id: Optional[str], authors: AuthorLoader, comments: int = 0) -> dict:
+    """Attach the viewer's reactions, bookmarks and comment previews, then wrap the page with its authors."""
+    await _attach_viewer(posts, viewer_id)
+    previews = await comment_store.attach_latest(posts, comments)
+    page = await authors.page(posts)
+    page['authors'].update(await authors.load_many(c['user_id'] for c in previews))
+    return page
 
-@api_router.get("/posts/trending", response_model=List[Post])
-async def get_trending_posts():
-    posts = await db.posts.find({}, {"_id": 0}).sort("views", -1).limit(5).to_list(5)
-    
-    for post in posts:
-        if isinstance(post['created_at'], str):
-            post['created_at'] = datetime.fromisoformat(post['created_at'])
-    
-    return posts
+async def _post_page(
+    posts: List[dict], viewer_id: Optional[str], authors: AuthorLoader,
+    comments: int = 0, response: Optional[Response] = None
+):
+    return page_response(await _build_post_page(posts, viewer_id, authors, comments), response)
 
-@api_router.get("/posts/search")
-async def search_posts(q: str = Query(..., min_length=1)):
-    posts = await db.posts.find(
-        {"$or": [
-            {"content": {"$regex": q, "$options": "i"}},
-            {"hashtags": {"$regex": q.lower()}}
-        ]},
-        {"_id": 0}
-    ).sort("created_at", -1).limit(20).to_list(20)
-    
-    for post in posts:
-        if isinstance(post['created_at'], str):
-            post['created_at'] = datetime.fromisoformat(post['created_at'])
-    
-    return posts
+def _author_tags(page: dict) -> List[str]:
+    return [f"author:{user_id}" for user_id in page['authors']]
 
-@api_router.get("/posts/user/{user_id}", response_model=List[Post])
-async def get_user_posts(user_id: str):
-    posts = await db.posts.find({"user_id": user_id}, {"_id": 0}).sort("created_at", -1).to_list(1000)
-    
-    for post in posts:
-        if isinstance(post['created_at'], str):
-            post['created_at'] = datetime.fromisoformat(post['created_at'])
-    
-    return posts
+async def _cached_post_page(
+    request: Request, key: str, tag: str, load, viewer_id: Optional[str], authors: AuthorLoader, comments: int = 0
+):
+    """Serve a public post list from the response cache; ``load(response)`` fetches and finishes the page."""
+    async def build():
+        response = Response()
+        page = await _build_post_page(await load(response), None, authors, comments)
+        return page, cursor_headers(response), [tag, *(f"post:{p['id']}" for p in page['items']), *_author_tags(page)]
+
+    async def personalize(page: dict):
+        await _attach_viewer(page['items'], viewer_id)
+
+    return await response_cache.serve(request, key, build, personalize if viewer_id else None)
+
+@api_router.get("/posts", response_model=Page[Post])
+async def get_posts(
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+    comments: int = Query(0, ge=0, le=MAX_COMMENT_PREVIEW),
+    current_user: User = Depends(get_current_user),
+    authors: AuthorLoader = Depends(get_author_loader)
+):
+    # Posts from followed users + own posts, read from the materialized timeline
+    limit = clamp_limit(limit)
+    posts = await timeline_store.read(current_user.id, decode_cursor(cursor), limit)
+    posts = finish_page(response, posts, limit)
+    return await _post_page(posts, current_user.id, authors, comments, response)
+
+@api_router.get("/posts/all", response_model=Page[Post])
+async def get_all_posts(
+    request: Request,
+    cursor: Optional[str] = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+    comments: int = Query(0, ge=0, le=MAX_COMMENT_PREVIEW),
+    user_id: Optional[str] = Depends(get_optional_user_id),
+    authors: AuthorLoader = Depends(get_author_loader)
+):
+    limit = clamp_limit(limit)
+    after = decode_cursor(cursor)
+
+    async def load(response: Response):
+        return finish_page(response, await fetch_page(db.posts, {}, after, limit), limit)
+
+    return await _cached_post_page(
+        request, f"posts:all:{cursor}:{limit}:{comments}", "posts:all", load, user_id, authors, comments,
+    )
+
+@api_router.get("/posts/trending", response_model=Page[Post])
+async def get_trending_posts(
+    request: Request,
+    user_id: Optional[str] = Depends(get_optional_user_id),
+    authors: AuthorLoader = Depends(get_author_loader)
+):
+    async def load(response: Response):
+        return [dict(p) for p in trending_engine.posts[:5]]
+
+    # Trending is recomputed every TRENDING_REFRESH_SECONDS; the TTL alone keeps it current.
+    return await _cached_post_page(request, "posts:trending", "posts:trending", load, user_id, authors)
+
+@api_router.get("/posts/search", response_model=Page[Post])
+async def search_posts(
+    q: str = Query(..., min_length=1),
+    user_id: Optional[str] = Depends(get_optional_user_id),
+    authors: AuthorLoader = Depends(get_author_loader)
+):
+    posts = await search_index.search(POST, q, 20, {"_id": 0})
+    return await _post_page(posts, user_id, authors)
+
+@api_router.get("/posts/user/{user_id}", response_model=Page[Post])
+async def get_user_posts(
+    user_id: str,
+    request: Request,
+    cursor: Optional[str] = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+    comments: int = Query(0, ge=0, le=MAX_COMMENT_PREVIEW),
+    viewer_id: Optional[str] = Depends(get_optional_user_id),
+    authors: AuthorLoader = Depends(get_author_loader)
+):
+    limit = clamp_limit(limit)
+    after = decode_cursor(cursor)
+
+    async def load(response: Response):
+        return finish_page(response, await fetch_page(db.posts, {"user_id": user_id}, after, limit), limit)
+
+    return await _cached_post_page(
+        request, f"posts:user:{user_id}:{cursor}:{limit}:{comments}", f"posts:user:{user_id}",
+        load, viewer_id, authors, comments,
+    )
 
 @api_router.put("/posts/{post_id}", response_model=Post)
-async def update_post(post_id: str, post_update: PostUpdate, current_user: User = Depends(get_current_user)):
+async def update_post(post_id: str, post_update: PostUpdate, current_user: Principal = Depends(get_current_principal)):
     post = await db.posts.find_one({"id": post_id}, {"_id": 0})
     if not post:
         raise HTTPException(status_code=404, detail="Post not found")
@@ -339,14 +543,13 @@ async def update_post(post_id: str, post_update: PostUpdate, current_user: User
     if update_data:
         await db.posts.update_one({"id": post_id}, {"$set": update_data})
         post.update(update_data)
-    
-    if isinstance(post['created_at'], str):
-        post['created_at'] = datetime.fromisoformat(post['created_at'])
+        await search_index.index_post(post)
+        await response_cache.invalidate(f"post:{post_id}")
     
     return Post(**post)
 
 @api_router.delete("/posts/{post_id}")
-async def delete_post(post_id: str, current_user: User = Depends(get_current_user)):
+async def delete_post(post_id: str, current_user: Principal = Depends(get_current_principal)):
     post = await db.posts.find_one({"id": post_id}, {"_id": 0})
     if not post:
         raise HTTPException(status_code=404, detail="Post not found")
@@ -355,224 +558,357 @@ async def delete_post(post_id: str, current_user: User = Depends(get_current_use
         raise HTTPException(status_code=403, detail="Not authorized to delete this post")
     
     await db.posts.delete_one({"id": post_id})
-    await db.comments.delete_many({"post_id": post_id})
+    await trending_engine.remove_post(post_id)
+    await response_cache.invalidate(f"post:{post_id}", f"comments:{post_id}")
+    # Comments, reactions, bookmarks, notifications, timeline entries and search postings
+    await job_runner.enqueue("delete_post", post_id=post_id)
     return {"message": "Post deleted successfully"}
 
 @api_router.post("/posts/{post_id}/react")
-async def toggle_reaction(post_id: str, reaction_type: str, current_user: User = Depends(get_current_user)):
-    post = await db.posts.find_one({"id": post_id}, {"_id": 0})
+async def toggle_reaction(post_id: str, reaction_type: str, current_user: Principal = Depends(get_current_principal)):
+    if reaction_type not in REACTION_TYPES:
+        raise HTTPException(status_code=400, detail="Invalid reaction type")
+    
+    post = await db.posts.find_one({"id": post_id}, {"_id": 0, "user_id": 1})
     if not post:
         raise HTTPException(status_code=404, detail="Post not found")
     
-    reactions = post.get('reactions', [])
-    user_reaction = next((r for r in reactions if r['user_id'] == current_user.id), None)
-    
-    if user_reaction:
-        if user_reaction['type'] == reaction_type:
-            reactions = [r for r in reactions if r['user_id'] != current_user.id]
-            action = "removed"
-        else:
-            for r in reactions:
-                if r['user_id'] == current_user.id:
-                    r['type'] = reaction_type
-            action = "changed"
-    else:
-        reactions.append({"user_id": current_user.id, "type": reaction_type})
-        action = "added"
+    action, reaction_counts = await reaction_store.toggle(post_id, current_user.id, reaction_type)
+    
+    if action == "added":
+        trending_engine.record_post_event(post_id, REACTION_WEIGHT)
         
         # Notify post owner
         if post['user_id'] != current_user.id:
             await create_notification(
-                post['user_id'], "reaction", current_user.id, current_user.name,
-                current_user.avatar or "", f"{current_user.name} reacted to your post", post_id
+                post['user_id'], "reaction", current_user, f"{current_user.name} reacted to your post", post_id
             )
     
-    await db.posts.update_one({"id": post_id}, {"$set": {"reactions": reactions}})
-    return {"message": f"Reaction {action}", "reactions": reactions}
+    return {
+        "message": f"Reaction {action}",
+        "reaction_counts": reaction_counts,
+        "my_reaction": None if action == "removed" else reaction_type,
+    }
 
 @api_router.post("/posts/{post_id}/view")
 async def increment_view(post_id: str):
-    await db.posts.update_one({"id": post_id}, {"$inc": {"views": 1}})
+    view_counter.add([post_id])
+    trending_engine.record_post_event(post_id, VIEW_WEIGHT)
     return {"message": "View counted"}
 
+@api_router.post("/posts/views")
+async def increment_views(batch: ViewBatch):
+    view_counter.add(batch.post_ids)
+    for post_id in batch.post_ids:
+        trending_engine.record_post_event(post_id, VIEW_WEIGHT)
+    return {"message": f"{len(batch.post_ids)} views counted"}
+
 @api_router.post("/posts/{post_id}/bookmark")
-async def toggle_bookmark(post_id: str, current_user: User = Depends(get_current_user)):
-    bookmarks = current_user.bookmarks or []
-    
-    if post_id in bookmarks:
-        bookmarks.remove(post_id)
-        action = "removed"
-    else:
-        bookmarks.append(post_id)
-        action = "added"
+async def toggle_bookmark(post_id: str, current_user: Principal = Depends(get_current_principal)):
+    post = await db.posts.find_one({"id": post_id}, {"_id": 1})
+    if not post:
+        raise HTTPException(status_code=404, detail="Post not found")
     
-    await db.users.update_one({"id": current_user.id}, {"$set": {"bookmarks": bookmarks}})
-    return {"message": f"Bookmark {action}", "bookmarks": bookmarks}
+    bookmarked = await bookmark_store.toggle(current_user.id, post_id)
+    return {"message": f"Bookmark {'added' if bookmarked else 'removed'}", "bookmarked": bookmarked}
 
-@api_router.get("/posts/bookmarked/me", response_model=List[Post])
-async def get_bookmarked_posts(current_user: User = Depends(get_current_user)):
-    bookmarks = current_user.bookmarks or []
-    if not bookmarks:
-        return []
-    
-    posts = await db.posts.find({"id": {"$in": bookmarks}}, {"_id": 0}).to_list(1000)
-    
-    for post in posts:
-        if isinstance(post['created_at'], str):
-            post['created_at'] = datetime.fromisoformat(post['created_at'])
-    
-    return posts
+@api_router.get("/posts/bookmarked/me", response_model=Page[Post])
+async def get_bookmarked_posts(
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+    comments: int = Query(0, ge=0, le=MAX_COMMENT_PREVIEW),
+    current_user: Principal = Depends(get_current_principal),
+    authors: AuthorLoader = Depends(get_author_loader)
+):
+    # Ordered by when each post was saved; the cursor is the bookmark's position
+    limit = clamp_limit(limit)
+    rows = await bookmark_store.page(current_user.id, decode_cursor(cursor), limit)
+    posts = [row['post'] for row in finish_page(response, rows, limit, id_field="post_id")]
+    return await _post_page(posts, current_user.id, authors, comments, response)
 
 # Comment Routes
 @api_router.post("/posts/{post_id}/comments", response_model=Comment)
-async def create_comment(post_id: str, comment_data: CommentCreate, current_user: User = Depends(get_current_user)):
-    post = await db.posts.find_one({"id": post_id})
+async def create_comment(post_id: str, comment_data: CommentCreate, current_user: Principal = Depends(get_current_principal)):
+    post = await db.posts.find_one({"id": post_id}, {"_id": 0, "user_id": 1})
     if not post:
         raise HTTPException(status_code=404, detail="Post not found")
     
     comment = Comment(
         post_id=post_id,
         user_id=current_user.id,
-        user_name=current_user.name,
-        user_headline=current_user.headline or "",
-        user_avatar=current_user.avatar or "",
         content=comment_data.content
     )
     
-    comment_dict = comment.model_dump()
-    comment_dict['created_at'] = comment_dict['created_at'].isoformat()
-    
-    await db.comments.insert_one(comment_dict)
+    if not await comment_store.add(comment.model_dump()):
+        raise HTTPException(status_code=404, detail="Post not found")
+    trending_engine.record_post_event(post_id, COMMENT_WEIGHT)
+    # The post's comment_count and previews change along with the thread
+    await response_cache.invalidate(f"post:{post_id}", f"comments:{post_id}")
     
     # Notify post owner
     if post['user_id'] != current_user.id:
         await create_notification(
-            post['user_id'], "comment", current_user.id, current_user.name,
-            current_user.avatar or "", f"{current_user.name} commented on your post", post_id
+            post['user_id'], "comment", current_user, f"{current_user.name} commented on your post", post_id
         )
     
     return comment
 
-@api_router.get("/posts/{post_id}/comments", response_model=List[Comment])
-async def get_comments(post_id: str):
-    comments = await db.comments.find({"post_id": post_id}, {"_id": 0}).sort("created_at", 1).to_list(1000)
-    
-    for comment in comments:
-        if isinstance(comment['created_at'], str):
-            comment['created_at'] = datetime.fromisoformat(comment['created_at'])
-    
-    return comments
+@api_router.get("/posts/{post_id}/comments", response_model=Page[Comment])
+async def get_comments(
+    post_id: str,
+    request: Request,
+    cursor: Optional[str] = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+    latest: bool = False,
+    authors: AuthorLoader = Depends(get_author_loader)
+):
+    # Oldest first reads a thread top-down; ?latest=true pages back from the newest comment.
+    limit = clamp_limit(limit)
+    after = decode_cursor(cursor)
+
+    async def build():
+        response = Response()
+        comments = finish_page(response, await comment_store.page(post_id, after, limit, latest), limit)
+        page = await authors.page(comments)
+        return page, cursor_headers(response), [f"comments:{post_id}", *_author_tags(page)]
+
+    return await response_cache.serve(request, f"comments:{post_id}:{cursor}:{limit}:{latest}", build)
 
 @api_router.delete("/comments/{comment_id}")
-async def delete_comment(comment_id: str, current_user: User = Depends(get_current_user)):
+async def delete_comment(comment_id: str, current_user: Principal = Depends(get_current_principal)):
     comment = await db.comments.find_one({"id": comment_id}, {"_id": 0})
     if not comment:
         raise HTTPException(status_code=404, detail="Comment not found")
     
     if comment['user_id'] != current_user.id:
-        raise HTTPException(status_code=403, detail="Not authorized to delete this comment")
+        # Post owners can moderate comments on their own posts
+        post = await db.posts.find_one({"id": comment['post_id']}, {"_id": 0, "user_id": 1})
+        if not post or post['user_id'] != current_user.id:
+            raise HTTPException(status_code=403, detail="Not authorized to delete this comment")
     
-    await db.comments.delete_one({"id": comment_id})
+    if not await comment_store.remove(comment):
+        raise HTTPException(status_code=404, detail="Comment not found")
+    await response_cache.invalidate(f"post:{comment['post_id']}", f"comments:{comment['post_id']}")
     return {"message": "Comment deleted successfully"}
 
+# Hashtag Routes
+@api_router.get("/hashtags/trending")
+async def get_trending_hashtags(limit: int = Query(10, ge=1, le=20)):
+    return trending_engine.hashtags[:limit]
+
 # User Routes
-@api_router.get("/users/{user_id}", response_model=User)
-async def get_user(user_id: str):
-    user = await db.users.find_one({"id": user_id}, {"_id": 0, "password": 0})
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-    
-    if isinstance(user['created_at'], str):
-        user['created_at'] = datetime.fromisoformat(user['created_at'])
-    
-    return User(**user)
+@api_router.get("/users/{user_id}", response_model=UserProfile)
+async def get_user(user_id: str, request: Request, viewer_id: Optional[str] = Depends(get_optional_user_id)):
+    async def build():
+        user = await db.users.find_one({"id": user_id}, PUBLIC_PROFILE_PROJECTION)
+        if not user:
+            raise HTTPException(status_code=404, detail="User not found")
+        return UserProfile(**user).model_dump(), {}, [f"profile:{user_id}", f"author:{user_id}"]
+
+    async def personalize(profile: dict):
+        profile['is_following'] = await follow_graph.is_following(viewer_id, user_id)
+
+    personal = viewer_id and viewer_id != user_id
+    return await response_cache.serve(request, f"user:{user_id}", build, personalize if personal else None)
+
+async def _follow_list(direction: str, user_id: str, response: Response, cursor: Optional[str], limit: int):
+    limit = clamp_limit(limit)
+    listed = "follower_id" if direction == "followers" else "followee_id"
+    edges = await follow_graph.page(direction, user_id, decode_cursor(cursor), limit)
+    edges = finish_page(response, edges, limit, id_field=listed)
+    profiles = await profile_cache.get_many(e[listed] for e in edges)
+    return page_response({"items": [profiles[e[listed]] for e in edges if e[listed] in profiles], "authors": {}}, response)
+
+@api_router.get("/users/{user_id}/followers", response_model=Page[Principal])
+async def get_followers(user_id: str, response: Response, cursor: Optional[str] = None, limit: int = DEFAULT_PAGE_SIZE):
+    return await _follow_list("followers", user_id, response, cursor, limit)
+
+@api_router.get("/users/{user_id}/following", response_model=Page[Principal])
+async def get_following(user_id: str, response: Response, cursor: Optional[str] = None, limit: int = DEFAULT_PAGE_SIZE):
+    return await _follow_list("following", user_id, response, cursor, limit)
 
 @api_router.get("/users/search/query")
 async def search_users(q: str = Query(..., min_length=1)):
-    users = await db.users.find(
-        {"$or": [
-            {"name": {"$regex": q, "$options": "i"}},
-            {"headline": {"$regex": q, "$options": "i"}}
-        ]},
-        {"_id": 0, "password": 0}
-    ).limit(10).to_list(10)
+    users = await search_index.search(USER, q, 10, PUBLIC_PROFILE_PROJECTION)
     
     return users
 
 @api_router.get("/users/suggested/me")
-async def get_suggested_users(current_user: User = Depends(get_current_user)):
-    users = await db.users.find(
-        {"id": {"$nin": [current_user.id] + current_user.following}},
-        {"_id": 0, "password": 0}
-    ).limit(5).to_list(5)
+async def get_suggested_users(current_user: Principal = Depends(get_current_principal)):
+    # Precomputed by `python recommendations.py`; most-followed accounts until a user has been scored
+    candidate_ids = await suggestion_store.candidates(current_user.id)
+    if not candidate_ids:
+        popular = await db.users.find({"id": {"$ne": current_user.id}}, {"_id": 0, "id": 1}).sort(
+            "followers_count", -1
+        ).limit(SUGGESTED_USERS_LIMIT * 4).to_list(SUGGESTED_USERS_LIMIT * 4)
+        candidate_ids = [u['id'] for u in popular]
+    # Follows made since the last scoring run are filtered here
+    followed = set(await follow_graph.following_ids(current_user.id, among=candidate_ids))
+    candidate_ids = [i for i in candidate_ids if i not in followed][:SUGGESTED_USERS_LIMIT]
     
-    return users
+    profiles = await profile_cache.get_many(candidate_ids)
+    return [profiles[i] for i in candidate_ids if i in profiles]
 
-@api_router.post("/users/{user_id}/follow")
-async def toggle_follow(user_id: str, current_user: User = Depends(get_current_user)):
+async def _follow_target(user_id: str, current_user: Principal):
     if user_id == current_user.id:
         raise HTTPException(status_code=400, detail="Cannot follow yourself")
-    
-    target_user = await db.users.find_one({"id": user_id}, {"_id": 0})
-    if not target_user:
+    if not await db.users.find_one({"id": user_id}, {"_id": 0, "id": 1}):
         raise HTTPException(status_code=404, detail="User not found")
-    
-    following = current_user.following or []
-    followers = target_user.get('followers', [])
-    
-    if user_id in following:
-        following.remove(user_id)
-        followers.remove(current_user.id)
-        action = "unfollowed"
-    else:
-        following.append(user_id)
-        followers.append(current_user.id)
-        action = "followed"
-        
-        # Notify the user being followed
-        await create_notification(
-            user_id, "follow", current_user.id, current_user.name,
-            current_user.avatar or "", f"{current_user.name} started following you"
-        )
-    
-    await db.users.update_one({"id": current_user.id}, {"$set": {"following": following}})
-    await db.users.update_one({"id": user_id}, {"$set": {"followers": followers}})
-    
-    return {"message": f"User {action}", "following": following}
+
+async def _follow(user_id: str, current_user: Principal) -> bool:
+    if not await follow_graph.follow(current_user.id, user_id):
+        return False
+    await invalidate_user(current_user.id, user_id)
+    await suggestion_store.mark_stale(current_user.id)
+    await timeline_store.follow(current_user.id, user_id)
+    # Notify the user being followed
+    await create_notification(user_id, "follow", current_user, f"{current_user.name} started following you")
+    return True
+
+async def _unfollow(user_id: str, current_user: Principal) -> bool:
+    if not await follow_graph.unfollow(current_user.id, user_id):
+        return False
+    await invalidate_user(current_user.id, user_id)
+    await suggestion_store.mark_stale(current_user.id)
+    await timeline_store.unfollow(current_user.id, user_id)
+    return True
+
+@api_router.post("/users/{user_id}/follow")
+async def toggle_follow(user_id: str, current_user: Principal = Depends(get_current_principal)):
+    await _follow_target(user_id, current_user)
+    if await _unfollow(user_id, current_user):
+        return {"message": "User unfollowed", "following": False}
+    await _follow(user_id, current_user)
+    return {"message": "User followed", "following": True}
+
+# Idempotent variants: repeating a request leaves the graph and counters unchanged
+@api_router.put("/users/{user_id}/follow")
+async def follow_user(user_id: str, current_user: Principal = Depends(get_current_principal)):
+    await _follow_target(user_id, current_user)
+    changed = await _follow(user_id, current_user)
+    return {"message": "User followed", "following": True, "changed": changed}
+
+@api_router.delete("/users/{user_id}/follow")
+async def unfollow_user(user_id: str, current_user: Principal = Depends(get_current_principal)):
+    await _follow_target(user_id, current_user)
+    changed = await _unfollow(user_id, current_user)
+    return {"message": "User unfollowed", "following": False, "changed": changed}
 
 # Notification Routes
-@api_router.get("/notifications", response_model=List[NotificationModel])
-async def get_notifications(current_user: User = Depends(get_current_user)):
-    notifications = await db.notifications.find(
-        {"user_id": current_user.id}, 
-        {"_id": 0}
-    ).sort("created_at", -1).limit(20).to_list(20)
-    
-    for notif in notifications:
-        if isinstance(notif['created_at'], str):
-            notif['created_at'] = datetime.fromisoformat(notif['created_at'])
+@api_router.get("/notifications", response_model=Page[NotificationModel])
+async def get_notifications(
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+    current_user: Principal = Depends(get_current_principal),
+    authors: AuthorLoader = Depends(get_author_loader)
+):
+    limit = clamp_limit(limit)
+    notifications = await fetch_page(
+        db.notifications, {"user_id": current_user.id}, decode_cursor(cursor), limit,
+        projection=NOTIFICATION_PROJECTION,
+    )
+    notifications = finish_page(response, notifications, limit)
     
-    return notifications
+    return page_response(await authors.page(notifications, "actor_id"), response)
 
 @api_router.put("/notifications/read")
-async def mark_notifications_read(current_user: User = Depends(get_current_user)):
-    await db.notifications.update_many(
+async def mark_notifications_read(current_user: Principal = Depends(get_current_principal)):
+    result = await db.notifications.update_many(
         {"user_id": current_user.id, "read": False},
-        {"$set": {"read": True}}
+        # read_at starts the retention TTL
+        {"$set": {"read": True, "read_at": datetime.now(timezone.utc)}}
     )
+    # Subtract what was marked rather than zeroing, so a notification written meanwhile still counts
+    user = await db.users.find_one_and_update(
+        {"id": current_user.id},
+        [{"$set": {"unread_notifications": {"$max": [0, {"$subtract": [
+            {"$ifNull": ["$unread_notifications", 0]}, result.modified_count,
+        ]}]}}}],
+        projection={"_id": 0, "unread_notifications": 1},
+        return_document=ReturnDocument.AFTER,
+    )
+    notification_hub.publish(current_user.id, "unread_count", {"count": (user or {}).get('unread_notifications', 0)})
     return {"message": "Notifications marked as read"}
 
 @api_router.get("/notifications/unread/count")
-async def get_unread_count(current_user: User = Depends(get_current_user)):
-    count = await db.notifications.count_documents({"user_id": current_user.id, "read": False})
-    return {"count": count}
+async def get_unread_count(current_user: Principal = Depends(get_current_principal)):
+    # The counter changes too often to serve from the principal cache
+    user = await db.users.find_one({"id": current_user.id}, {"_id": 0, "unread_notifications": 1})
+    return {"count": max((user or {}).get('unread_notifications', 0), 0)}
+
+@api_router.post("/notifications/stream-token")
+async def get_stream_token(current_user: Principal = Depends(get_current_principal)):
+    return {"token": create_stream_token(current_user.id), "expires_in": STREAM_TOKEN_SECONDS}
+
+@api_router.get("/notifications/stream")
+async def stream_notifications(token: str):
+    # Server-Sent Events; opened with a token from POST /notifications/stream-token, checked only on connect
+    user_id = user_id_from_token(token, STREAM_TOKEN_SCOPE)
+    if user_id is None:
+        raise HTTPException(status_code=401, detail="Invalid authentication")
+    user = await db.users.find_one({"id": user_id}, {"_id": 0, "unread_notifications": 1})
+    if user is None:
+        raise HTTPException(status_code=401, detail="User not found")
+    
+    queue = notification_hub.subscribe(user_id)
+    
+    async def events():
+        try:
+            yield format_event("unread_count", {"count": max(user.get('unread_notifications', 0), 0)})
+            while True:
+                try:
+                    event, data = await asyncio.wait_for(queue.get(), STREAM_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield format_event(event, data)
+        finally:
+            notification_hub.unsubscribe(user_id, queue)
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 @api_router.post("/upload")
-async def upload_image(file: UploadFile = File(...), current_user: User = Depends(get_current_user)):
-    contents = await file.read()
-    base64_image = base64.b64encode(contents).decode('utf-8')
-    mime_type = file.content_type or 'image/jpeg'
-    return {"image": f"data:{mime_type};base64,{base64_image}"}
+async def upload_image(file: UploadFile = File(...), current_user: Principal = Depends(get_current_principal)):
+    media = await media_store.save_upload(file, current_user.id)
+    # "image" is the value to store in posts.image / users.avatar / users.cover_image
+    return {
+        "image": media['id'],
+        "url": f"/api/media/{media['id']}",
+        **{k: media[k] for k in ("id", "content_type", "size", "width", "height")},
+        "variants": list(media['variants']),
+    }
+
+@api_router.get("/media/{media_id}")
+async def get_media(media_id: str, request: Request, variant: str = ORIGINAL):
+    path, info = await media_store.locate(media_id, variant)
+    headers = {
+        "ETag": f'"{media_id}-{variant}"',
+        "Cache-Control": MEDIA_CACHE_CONTROL,
+        "Accept-Ranges": "bytes",
+        "X-Content-Type-Options": "nosniff",
+    }
+    if headers["ETag"] in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+
+    size = info['size']
+    byte_range = None
+    if request.headers.get("if-range", headers["ETag"]) == headers["ETag"]:
+        byte_range = parse_range(request.headers.get("range"), size)
+    if byte_range is None:
+        start, end, status_code = 0, size - 1, 200
+    else:
+        (start, end), status_code = byte_range, 206
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(
+        iter_file(path, start, end), status_code=status_code, media_type=info['content_type'], headers=headers,
+    )
 
 # Debug endpoint to check environment
 @app.get("/debug/env")
@@ -584,14 +920,71 @@ async def debug_env():
         "cors_origins": os.environ.get('CORS_ORIGINS', 'not_set'),
     }
 
+@app.get("/debug/notifications")
+async def debug_notifications():
+    return notification_pipeline.stats()
+
+@app.get("/debug/auth-cache")
+async def debug_auth_cache():
+    return {"users": user_cache.stats(), "principals": principal_cache.stats(), "profiles": profile_cache.cache.stats()}
+
+@app.get("/debug/jobs")
+async def debug_jobs():
+    return await job_runner.stats()
+
+@app.get("/debug/response-cache")
+async def debug_response_cache():
+    return response_cache.stats()
+
+@app.get("/debug/admission")
+async def debug_admission():
+    return admission.stats()
+
+@app.get("/debug/password-hasher")
+async def debug_password_hasher():
+    return password_hasher.stats()
+
+REGISTRY.collect("notifications", notification_pipeline.stats)
+REGISTRY.collect("password_hasher", password_hasher.stats)
+REGISTRY.collect("user_cache", user_cache.stats)
+REGISTRY.collect("principal_cache", principal_cache.stats)
+REGISTRY.collect("profile_cache", profile_cache.cache.stats)
+REGISTRY.collect("response_cache", response_cache.stats)
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return Response(REGISTRY.render(), media_type=METRICS_CONTENT_TYPE)
+
 app.include_router(api_router)
 
+# Everything else is admission.DEFAULT
+ROUTE_PRIORITIES = {
+    "/api/posts/{post_id}/view": CHEAP,
+    "/api/posts/views": CHEAP,
+    "/api/notifications/unread/count": CHEAP,
+    "/api/auth/login": EXPENSIVE,
+    "/api/auth/signup": EXPENSIVE,
+    "/api/posts/search": EXPENSIVE,
+    "/api/users/search/query": EXPENSIVE,
+    "/api/upload": EXPENSIVE,
+    "/api/media/{media_id}": STATIC,
+    # Held open for the life of the tab; bounded by the notification hub instead
+    "/api/notifications/stream": EXEMPT,
+    "/metrics": EXEMPT,
+    **{route.path: EXEMPT for route in app.routes if route.path.startswith("/debug/")},
+}
+admission = AdmissionControl(app.routes, ROUTE_PRIORITIES, user_id_from_token)
+REGISTRY.collect("admission", admission.stats)
+
+app.add_middleware(AdmissionMiddleware, control=admission)
+app.add_middleware(MetricsMiddleware, routes=app.routes)
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER],
 )
 
 logging.basicConfig(
@@ -600,6 +993,32 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@app.on_event("startup")
+async def create_indexes():
+    await ensure_indexes(db)
+
+@app.on_event("startup")
+async def start_trending_engine():
+    trending_engine.start()
+
+@app.on_event("startup")
+async def start_view_counter():
+    view_counter.start()
+
+@app.on_event("startup")
+async def start_notification_pipeline():
+    notification_pipeline.start()
+
+@app.on_event("startup")
+async def start_job_runner():
+    job_runner.start()
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    await job_runner.stop()
+    await timeline_store.stop()
+    await notification_pipeline.stop()
+    await view_counter.stop()
+    await trending_engine.stop()
+    password_hasher.shutdown()
     client.close()
\ No newline at end of file
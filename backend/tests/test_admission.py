@@ -0,0 +1,148 @@
+import asyncio
+import dataclasses
+import math
+
+import pytest
+
+import admission
+from admission import CHEAP, DEFAULT, EXEMPT, EXPENSIVE, MAX_IN_FLIGHT, STATIC, AdmissionControl, TokenBuckets
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(admission.time, "monotonic", lambda: now[0])
+    monkeypatch.setattr("cache.time.monotonic", lambda: now[0])
+    return now
+
+
+def test_bucket_allows_burst_then_reports_wait(clock):
+    buckets = TokenBuckets(EXPENSIVE)
+    assert all(buckets.take("c") == 0 for _ in range(int(EXPENSIVE.burst)))
+    assert buckets.take("c") == pytest.approx(1 / EXPENSIVE.rate)
+    assert buckets.take("other") == 0
+
+
+def test_bucket_refills_at_its_rate(clock):
+    buckets = TokenBuckets(EXPENSIVE)
+    for _ in range(int(EXPENSIVE.burst)):
+        buckets.take("c")
+    clock[0] += 1 / EXPENSIVE.rate
+    assert buckets.take("c") == 0
+    assert buckets.take("c") > 0
+
+
+def _scope(route, headers=(), client=("203.0.113.9", 1234)):
+    return {"type": "http", "route_template": route, "headers": list(headers), "client": client}
+
+
+async def _call(control, scope, app=None):
+    sent = []
+
+    async def ok(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+
+    async def send(message):
+        sent.append(message)
+
+    await control(app or ok, scope, None, send)
+    start = sent[0]
+    return start["status"], dict(start["headers"])
+
+
+def _control(priorities):
+    return AdmissionControl([], priorities, identify=lambda token: "u1" if token == "good" else None)
+
+
+def test_rate_limited_request_gets_429_with_retry_after(clock):
+    control = _control({"/login": EXPENSIVE})
+    statuses = [asyncio.run(_call(control, _scope("/login")))[0] for _ in range(int(EXPENSIVE.burst) + 1)]
+    assert statuses[:-1] == [200] * int(EXPENSIVE.burst)
+    status, headers = asyncio.run(_call(control, _scope("/login")))
+    assert status == 429 and int(headers[b"retry-after"]) >= 1
+    assert control.shed["rate_limited"] == 2
+
+
+def test_buckets_are_per_user_when_authenticated(clock):
+    control = _control({"/login": EXPENSIVE})
+    for _ in range(int(EXPENSIVE.burst)):
+        asyncio.run(_call(control, _scope("/login")))
+    signed_in = _scope("/login", [(b"authorization", b"Bearer good")])
+    assert asyncio.run(_call(control, signed_in))[0] == 200
+
+
+def test_expensive_work_is_shed_first(clock):
+    control = _control({"/search": EXPENSIVE, "/view": CHEAP})
+    control.in_flight = math.ceil(MAX_IN_FLIGHT * EXPENSIVE.shed_at)
+    assert asyncio.run(_call(control, _scope("/search")))[0] == 503
+    assert asyncio.run(_call(control, _scope("/feed")))[0] == 200  # DEFAULT
+    assert asyncio.run(_call(control, _scope("/view")))[0] == 200
+    control.in_flight = math.ceil(MAX_IN_FLIGHT * DEFAULT.shed_at)
+    assert asyncio.run(_call(control, _scope("/feed")))[0] == 503
+    assert asyncio.run(_call(control, _scope("/view")))[0] == 200
+    assert control.shed["overloaded"] == 2
+
+
+def test_exempt_routes_bypass_admission(clock):
+    control = _control({"/metrics": EXEMPT})
+    control.in_flight = MAX_IN_FLIGHT
+    assert asyncio.run(_call(control, _scope("/metrics")))[0] == 200
+    assert control.admitted == 0
+
+
+def test_request_waiting_past_its_deadline_gets_503():
+    narrow = dataclasses.replace(CHEAP, concurrency=1, queue_seconds=0.05)
+    control = _control({"/slow": narrow})
+
+    async def run():
+        release = asyncio.Event()
+
+        async def slow(scope, receive, send):
+            await release.wait()
+            await send({"type": "http.response.start", "status": 200, "headers": []})
+
+        first = asyncio.create_task(_call(control, _scope("/slow"), slow))
+        await asyncio.sleep(0)
+        second = await _call(control, _scope("/slow"))
+        release.set()
+        return (await first)[0], second[0]
+
+    assert asyncio.run(run()) == (200, 503)
+    assert control.shed["timeout"] == 1
+    assert control.in_flight == 0
+
+
+def test_forwarded_client_is_the_right_most_untrusted_hop(monkeypatch):
+    monkeypatch.setattr(admission, "TRUST_FORWARDED", True)
+    monkeypatch.setattr(admission, "PROXY_HOPS", 1)
+    control = _control({})
+    spoofed = _scope("/", [(b"x-forwarded-for", b"6.6.6.6, 198.51.100.7")])
+    assert control._client(spoofed) == "198.51.100.7"
+    monkeypatch.setattr(admission, "PROXY_HOPS", 2)
+    assert control._client(spoofed) == "6.6.6.6"
+    monkeypatch.setattr(admission, "TRUST_FORWARDED", False)
+    assert control._client(spoofed) == "203.0.113.9"
+
+
+def test_slot_is_freed_once_the_response_starts():
+    narrow = dataclasses.replace(STATIC, concurrency=1, queue_seconds=0.05)
+    control = _control({"/media": narrow})
+
+    async def run():
+        finish = asyncio.Event()
+
+        async def streaming(scope, receive, send):
+            await send({"type": "http.response.start", "status": 200, "headers": []})
+            await finish.wait()  # a slow client still reading the body
+            await send({"type": "http.response.body", "body": b""})
+
+        download = asyncio.create_task(_call(control, _scope("/media"), streaming))
+        await asyncio.sleep(0.01)
+        in_flight = control.in_flight
+        second = await _call(control, _scope("/media"))
+        finish.set()
+        await download
+        return in_flight, second[0]
+
+    assert asyncio.run(run()) == (0, 200)
+    assert control.in_flight == 0
@@ -0,0 +1,54 @@
+import pytest
+
+import cache
+from cache import TTLCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_get_returns_value_until_expiry(clock):
+    c = TTLCache(10, ttl=5)
+    c.set("a", 1)
+    clock[0] += 4.9
+    assert c.get("a") == 1
+    clock[0] += 0.2
+    assert c.get("a") is None
+    assert len(c) == 0
+    assert (c.hits, c.misses) == (1, 1)
+
+
+def test_per_entry_ttl(clock):
+    c = TTLCache(10, ttl=5)
+    c.set("short", 1, ttl=1)
+    c.set("long", 2)
+    clock[0] += 2
+    assert c.get("short") is None
+    assert c.get("long") == 2
+
+
+def test_evicts_least_recently_used(clock):
+    c = TTLCache(2, ttl=60)
+    c.set("a", 1)
+    c.set("b", 2)
+    c.get("a")
+    c.set("c", 3)
+    assert c.get("b") is None
+    assert c.get("a") == 1
+    assert c.get("c") == 3
+    assert c.evictions == 1
+
+
+def test_invalidate_and_stats(clock):
+    c = TTLCache(10, ttl=60)
+    c.set("a", 1)
+    c.invalidate("a", "missing")
+    assert c.get("a") is None
+    stats = c.stats()
+    assert stats["invalidations"] == 1
+    assert stats["hit_ratio"] == 0
+    assert TTLCache(1, 1).stats()["hit_ratio"] is None
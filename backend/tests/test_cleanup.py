@@ -0,0 +1,78 @@
+import asyncio
+from types import SimpleNamespace
+
+import cleanup
+
+
+class _Notifications:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def aggregate(self, pipeline):
+        match = pipeline[0]["$match"]
+        counts = {}
+        for doc in self.docs:
+            if all(doc.get(k) == v for k, v in match.items()):
+                counts[doc["user_id"]] = counts.get(doc["user_id"], 0) + 1
+
+        async def rows():
+            for user_id, n in counts.items():
+                yield {"_id": user_id, "n": n}
+
+        return rows()
+
+
+class _Users:
+    def __init__(self):
+        self.ops = []
+
+    async def bulk_write(self, ops, ordered=True):
+        self.ops.extend(ops)
+
+
+class _Runner:
+    def __init__(self, db):
+        self.db = db
+        self.deleted = []
+
+    async def delete_in_batches(self, job, collection, query):
+        self.deleted.append((collection, query))
+        if collection == "notifications":
+            before = len(self.db.notifications.docs)
+            self.db.notifications.docs = [
+                d for d in self.db.notifications.docs if d.get("post_id") != query["post_id"]
+            ]
+            return before - len(self.db.notifications.docs)
+        return 0
+
+
+def _decrement(op):
+    # users.unread_notifications = max(0, unread_notifications - n)
+    subtract = op._doc[0]["$set"]["unread_notifications"]["$max"][1]["$subtract"]
+    return op._filter["id"], subtract[1]
+
+
+def test_delete_post_takes_unread_notifications_off_the_counters():
+    db = SimpleNamespace(
+        notifications=_Notifications([
+            {"user_id": "ana", "post_id": "p1", "read": False},
+            {"user_id": "ana", "post_id": "p1", "read": False},
+            {"user_id": "ana", "post_id": "p1", "read": True},
+            {"user_id": "ben", "post_id": "p1", "read": False},
+            {"user_id": "ben", "post_id": "p2", "read": False},
+        ]),
+        users=_Users(),
+    )
+    runner = _Runner(db)
+    asyncio.run(cleanup.delete_post(runner, {}, "p1"))
+
+    assert sorted(_decrement(op) for op in db.users.ops) == [("ana", 2), ("ben", 1)]
+    assert [d["post_id"] for d in db.notifications.docs] == ["p2"]
+    assert {c for c, _ in runner.deleted} == set(cleanup.POST_REFERENCES)
+
+
+def test_delete_post_without_unread_notifications_leaves_counters_alone():
+    db = SimpleNamespace(notifications=_Notifications([{"user_id": "ana", "post_id": "p1", "read": True}]),
+                         users=_Users())
+    asyncio.run(cleanup.delete_post(_Runner(db), {}, "p1"))
+    assert db.users.ops == []
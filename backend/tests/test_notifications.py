@@ -0,0 +1,97 @@
+import asyncio
+from types import SimpleNamespace
+
+from pymongo import InsertOne, UpdateOne
+
+import notifications
+from notifications import MAX_COALESCED_ACTORS, NotificationHub, NotificationPipeline, _coalesce, format_event
+
+
+def _doc(actor_id="a1", **extra):
+    return {
+        "id": "n1", "user_id": "owner", "type": "reaction", "post_id": "p1", "actor_id": actor_id,
+        "message": "Ana reacted to your post", "read": False, "created_at": "2025-01-01T00:00:00+00:00",
+        **extra,
+    }
+
+
+def test_coalesce_targets_the_unread_notification_for_the_post():
+    op = _coalesce(_doc(), "Ana")
+    assert isinstance(op, UpdateOne)
+    doc = op._doc
+    assert op._filter == {"user_id": "owner", "type": "reaction", "post_id": "p1", "read": False}
+    assert op._upsert is True
+    assert isinstance(doc, list)  # pipeline update
+
+
+def test_coalesce_wraps_user_strings_in_literal():
+    stage = _coalesce(_doc(), "$where")._doc[0]["$set"]
+    assert stage["actor_id"] == {"$literal": "a1"}
+    message = _coalesce(_doc(), "$where")._doc[1]["$set"]["message"]["$cond"][1]["$concat"]
+    assert message[0] == {"$literal": "$where"}
+
+
+def test_coalesce_keeps_actor_order_and_caps_it():
+    actor_ids = _coalesce(_doc(), "Ana")._doc[0]["$set"]["actor_ids"]
+    concat, cap = actor_ids["$slice"]
+    assert cap == -MAX_COALESCED_ACTORS
+    existing, new = concat["$concatArrays"]
+    # The actor is removed from where it was and appended last, so the slice drops the oldest
+    assert existing["$filter"]["cond"] == {"$ne": ["$$this", {"$literal": "a1"}]}
+    assert new == {"$literal": ["a1"]}
+
+
+def test_format_event():
+    assert format_event("unread_count", {"count": 2}) == 'event: unread_count\ndata: {"count":2}\n\n'
+
+
+def test_hub_publishes_to_subscribers_only():
+    hub = NotificationHub(max_buffered=1)
+    queue = hub.subscribe("u1")
+    assert hub.is_listening("u1") and not hub.is_listening("u2")
+    hub.publish("u1", "notification", 1)
+    hub.publish("u1", "notification", 2)  # full; dropped rather than blocking
+    hub.publish("u2", "notification", 3)
+    assert queue.get_nowait() == ("notification", 1)
+    assert queue.empty()
+    hub.unsubscribe("u1", queue)
+    assert hub.connections == 0 and not hub.is_listening("u1")
+
+
+def test_ops_coalesces_reactions_and_inserts_the_rest():
+    async def collect():
+        pipeline = NotificationPipeline(db=None, hub=NotificationHub(), profiles=None)
+        jobs = [("one", _doc(), "Ana"), ("one", _doc(type="follow", post_id=None), "Ana")]
+        return [op async for op in pipeline._ops(jobs)]
+
+    (coalesced, _, is_coalesced), (insert, doc, inserted) = asyncio.run(collect())
+    assert isinstance(coalesced, UpdateOne) and is_coalesced
+    assert isinstance(insert, InsertOne) and not inserted and doc["type"] == "follow"
+
+
+class _Collection:
+    def __init__(self, fail=False):
+        self.fail = fail
+
+    async def bulk_write(self, ops, ordered=True):
+        if self.fail:
+            raise RuntimeError("connection reset")
+        return SimpleNamespace(upserted_ids={})
+
+
+def test_worker_survives_a_failed_batch(monkeypatch):
+    monkeypatch.setattr(notifications, "WORKERS", 1)
+    db = SimpleNamespace(notifications=_Collection(), users=_Collection(fail=True))
+
+    async def run():
+        pipeline = NotificationPipeline(db, NotificationHub(), profiles=None)
+        pipeline.start()
+        await pipeline.notify(_doc(type="follow", post_id=None), "Ana")
+        await asyncio.wait_for(pipeline._queue.join(), 1)
+        alive = not pipeline._workers[0].done()
+        await pipeline.stop(timeout=1)
+        return pipeline, alive
+
+    pipeline, alive = asyncio.run(run())
+    assert alive
+    assert pipeline.failed == 1
@@ -0,0 +1,78 @@
+from datetime import datetime, timezone
+
+import pytest
+from fastapi import HTTPException, Response
+
+from pagination import (
+    MAX_PAGE_SIZE, NEXT_CURSOR_HEADER, clamp_limit, cursor_headers, decode_cursor, encode_cursor, finish_page,
+    keyset_query, keyset_sort,
+)
+
+T = datetime(2025, 3, 1, 12, 30, 15, 123000, tzinfo=timezone.utc)
+
+
+def test_cursor_round_trip():
+    cursor = encode_cursor(T, "post-1")
+    assert "=" not in cursor
+    assert decode_cursor(cursor) == (T, "post-1")
+
+
+def test_decode_empty_cursor():
+    assert decode_cursor(None) is None
+    assert decode_cursor("") is None
+
+
+@pytest.mark.parametrize("cursor", ["not-base64!", encode_cursor("yesterday", "x"), "WzEsMl0"])
+def test_decode_invalid_cursor(cursor):
+    with pytest.raises(HTTPException) as e:
+        decode_cursor(cursor)
+    assert e.value.status_code == 400
+
+
+def test_clamp_limit():
+    assert clamp_limit(0) == 1
+    assert clamp_limit(10) == 10
+    assert clamp_limit(10_000) == MAX_PAGE_SIZE
+
+
+def test_keyset_query_first_page_is_unchanged():
+    assert keyset_query({"user_id": "u"}, None) == {"user_id": "u"}
+
+
+def test_keyset_query_descending():
+    assert keyset_query({"user_id": "u"}, (T, "p"), id_field="post_id") == {
+        "user_id": "u",
+        "$or": [{"created_at": {"$lt": T}}, {"created_at": T, "post_id": {"$lt": "p"}}],
+    }
+
+
+def test_keyset_query_ascending():
+    query = keyset_query({}, (T, "c"), ascending=True)
+    assert query["$or"] == [{"created_at": {"$gt": T}}, {"created_at": T, "id": {"$gt": "c"}}]
+    assert keyset_sort(ascending=True) == [("created_at", 1), ("id", 1)]
+
+
+def _docs(n):
+    return [{"id": f"p{i}", "created_at": T} for i in range(n)]
+
+
+def test_finish_page_trims_and_sets_cursor():
+    response = Response()
+    page = finish_page(response, _docs(3), 2)
+    assert [d["id"] for d in page] == ["p0", "p1"]
+    assert decode_cursor(response.headers[NEXT_CURSOR_HEADER]) == (T, "p1")
+    assert cursor_headers(response) == {NEXT_CURSOR_HEADER: response.headers[NEXT_CURSOR_HEADER]}
+
+
+def test_finish_page_last_page_has_no_cursor():
+    response = Response()
+    assert len(finish_page(response, _docs(2), 2)) == 2
+    assert NEXT_CURSOR_HEADER not in response.headers
+    assert cursor_headers(response) == {}
+
+
+def test_finish_page_custom_id_field():
+    response = Response()
+    finish_page(response, [{"follower_id": "a", "created_at": T}, {"follower_id": "b", "created_at": T}], 1,
+                id_field="follower_id")
+    assert decode_cursor(response.headers[NEXT_CURSOR_HEADER]) == (T, "a")
@@ -0,0 +1,112 @@
+import asyncio
+
+import orjson
+from fastapi import Request
+
+from cache import TTLCache
+from response_cache import ResponseCache, make_etag
+
+
+def _request(if_none_match=None):
+    headers = [(b"if-none-match", if_none_match.encode())] if if_none_match else []
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": headers})
+
+
+def _builder(tags=("post:p1",)):
+    calls = []
+
+    async def build():
+        calls.append(1)
+        await asyncio.sleep(0)
+        return {"items": [{"id": "p1", "n": len(calls)}]}, {"X-Next-Cursor": "abc"}, tags
+
+    return build, calls
+
+
+def _cache():
+    return ResponseCache(TTLCache(100, ttl=60))
+
+
+def test_serve_sets_etag_and_answers_304():
+    async def run():
+        cache = _cache()
+        build, calls = _builder()
+        first = await cache.serve(_request(), "k", build)
+        again = await cache.serve(_request(first.headers["etag"]), "k", build)
+        return cache, first, again, calls
+
+    cache, first, again, calls = asyncio.run(run())
+    assert first.status_code == 200
+    assert first.headers["etag"] == make_etag(first.body)
+    assert first.headers["cache-control"] == "public, no-cache"
+    assert first.headers["x-next-cursor"] == "abc"
+    assert again.status_code == 304 and again.body == b""
+    assert len(calls) == 1
+    assert cache.stats()["not_modified"] == 1
+
+
+def test_concurrent_misses_share_one_build():
+    async def run():
+        cache = _cache()
+        build, calls = _builder()
+        entries = await asyncio.gather(*(cache.get("k", build) for _ in range(20)))
+        return cache, entries, calls
+
+    cache, entries, calls = asyncio.run(run())
+    assert len(calls) == 1
+    assert len({e.etag for e in entries}) == 1
+    assert cache.coalesced == 19
+
+
+def test_invalidating_a_tag_rebuilds_only_tagged_entries():
+    async def run():
+        cache = _cache()
+        tagged, tagged_calls = _builder(("post:p1",))
+        other, other_calls = _builder(("post:p2",))
+        await cache.get("a", tagged)
+        await cache.get("b", other)
+        await asyncio.sleep(0.01)
+        await cache.invalidate("post:p1")
+        await cache.get("a", tagged)
+        await cache.get("b", other)
+        return tagged_calls, other_calls
+
+    tagged_calls, other_calls = asyncio.run(run())
+    assert len(tagged_calls) == 2
+    assert len(other_calls) == 1
+
+
+def test_page_built_across_an_invalidation_is_not_kept():
+    async def run():
+        cache = _cache()
+        calls = []
+
+        async def build():
+            calls.append(1)
+            await cache.invalidate("post:p1")  # a write lands mid-build
+            return {"n": len(calls)}, {}, ["post:p1"]
+
+        await cache.get("k", build)
+        await cache.get("k", build)
+        return calls
+
+    assert len(asyncio.run(run())) == 2
+
+
+def test_personalized_response_is_private_with_its_own_etag():
+    async def run():
+        cache = _cache()
+        build, _ = _builder()
+
+        async def personalize(content):
+            content["items"][0]["bookmarked"] = True
+
+        public = await cache.serve(_request(), "k", build)
+        private = await cache.serve(_request(public.headers["etag"]), "k", build, personalize)
+        return public, private
+
+    public, private = asyncio.run(run())
+    assert private.status_code == 200
+    assert private.headers["cache-control"] == "private, no-cache"
+    assert private.headers["etag"] != public.headers["etag"]
+    assert orjson.loads(private.body)["items"][0]["bookmarked"] is True
@@ -0,0 +1,106 @@
+import asyncio
+import math
+from datetime import timedelta
+from types import SimpleNamespace
+
+import pytest
+
+import trending
+from trending import EPOCH, HALF_LIFE_HOURS, _log_add, _log_value, current_score
+
+HALF_LIFE = timedelta(hours=HALF_LIFE_HOURS)
+
+
+def test_log_value_at_epoch_is_log_weight():
+    assert _log_value(8, EPOCH) == pytest.approx(3)
+
+
+def test_one_half_life_later_doubles_the_value():
+    assert _log_value(1, EPOCH + HALF_LIFE) == pytest.approx(_log_value(2, EPOCH))
+
+
+def test_log_add_matches_linear_sum():
+    a, b = _log_value(3, EPOCH), _log_value(5, EPOCH)
+    assert 2 ** _log_add(a, b) == pytest.approx(8)
+    assert _log_add(None, b) == b
+
+
+def test_log_add_does_not_overflow_far_from_epoch():
+    # Two years of half-lives is far past what a float can hold outside log space
+    late = EPOCH + HALF_LIFE * 3000
+    total = _log_add(_log_value(1, late), _log_value(1, late))
+    assert math.isfinite(total)
+    assert total == pytest.approx(_log_value(2, late))
+
+
+def test_current_score_decays_by_half_per_half_life():
+    log_score = _log_value(10, EPOCH)
+    assert current_score(log_score, EPOCH) == pytest.approx(10)
+    assert current_score(log_score, EPOCH + HALF_LIFE) == pytest.approx(5)
+    assert current_score(log_score, EPOCH + 2 * HALF_LIFE) == pytest.approx(2.5)
+
+
+def test_recent_event_outranks_older_heavier_one():
+    old = _log_value(3, EPOCH)
+    recent = _log_value(1, EPOCH + 2 * HALF_LIFE)
+    assert recent > old
+    # ... and the order holds whenever it is read
+    later = EPOCH + 50 * HALF_LIFE
+    assert current_score(recent, later) > current_score(old, later)
+
+
+def test_record_hashtags_counts_each_tag_once_per_call():
+    engine = trending.TrendingEngine(db=None)
+    engine.record_hashtags(["#a", "#a", "#b"], 4, EPOCH)
+    assert set(engine._pending) == {(trending.HASHTAG, "#a"), (trending.HASHTAG, "#b")}
+    assert 2 ** engine._pending[(trending.HASHTAG, "#a")] == pytest.approx(4)
+
+    engine.record_hashtags(["#a"], 4, EPOCH)
+    assert 2 ** engine._pending[(trending.HASHTAG, "#a")] == pytest.approx(8)
+
+
+class _Cursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def __aiter__(self):
+        async def rows():
+            for doc in self.docs:
+                yield doc
+        return rows()
+
+
+class _Posts:
+    def __init__(self):
+        self.lookups = []
+
+    def find(self, query, projection):
+        ids = query["id"]["$in"]
+        self.lookups.append(len(ids))
+        return _Cursor([{"id": i, "hashtags": []} for i in ids])
+
+
+class _Scores:
+    def __init__(self):
+        self.writes = []
+
+    async def bulk_write(self, ops, ordered=True):
+        self.writes.append(len(ops))
+
+
+def test_pending_cap_triggers_a_chunked_flush(monkeypatch):
+    monkeypatch.setattr(trending, "FLUSH_MAX_KEYS", 1200)
+    monkeypatch.setattr(trending, "FLUSH_BATCH_SIZE", 500)
+    db = SimpleNamespace(posts=_Posts(), trending_scores=_Scores())
+
+    async def run():
+        engine = trending.TrendingEngine(db)
+        for i in range(1200):
+            engine.record_post_event(f"p{i}", 1, EPOCH)
+        await engine._flush_task
+        return engine
+
+    engine = asyncio.run(run())
+    assert engine._pending_post_events == {}
+    assert db.posts.lookups == [500, 500, 200]
+    assert db.trending_scores.writes == [500, 500, 200]
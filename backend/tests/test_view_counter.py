@@ -0,0 +1,33 @@
+import asyncio
+from types import SimpleNamespace
+
+import view_counter
+from view_counter import ViewCounter
+
+
+class _Posts:
+    def __init__(self):
+        self.writes = []
+
+    async def bulk_write(self, ops, ordered=True):
+        await asyncio.sleep(0)
+        self.writes.append(len(ops))
+
+
+def test_one_early_flush_at_a_time(monkeypatch):
+    monkeypatch.setattr(view_counter, "FLUSH_MAX_POSTS", 2)
+    db = SimpleNamespace(posts=_Posts())
+
+    async def run():
+        counter = ViewCounter(db)
+        counter.add(["a", "b"])
+        first = counter._flush_task
+        counter.add(["c", "d"])  # before the first flush has taken the lock
+        assert counter._flush_task is first
+        await counter.stop()
+        return counter
+
+    counter = asyncio.run(run())
+    assert counter.pending == 0
+    assert counter.views_written == 4
+    assert sum(db.posts.writes) == 4
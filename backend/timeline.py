@@ -0,0 +1,189 @@
+"""Materialized home timelines (fan-out on write with a pull path for big authors).
+
+Each entry in ``db.timelines`` is ``{user_id, post_id, author_id, created_at}``.
+``create_post`` writes the author's own entry and a background task pages
+through the author's followers pushing one into each of their timelines, so
+reading a feed is one indexed range scan on ``(user_id, created_at)``. Authors
+with more than ``TIMELINE_FANOUT_THRESHOLD`` followers (by their stored
+``followers_count``) are flagged ``timeline_pull`` and their posts are merged in
+at read time instead of being copied to every follower.
+"""
+import asyncio
+import logging
+import os
+import time
+from typing import List, Optional, Set
+
+from pymongo import DESCENDING, InsertOne
+from pymongo.errors import BulkWriteError
+
+from graph import follower_id_batches
+from pagination import Cursor, keyset_query, keyset_sort
+
+logger = logging.getLogger(__name__)
+
+FANOUT_THRESHOLD = int(os.environ.get('TIMELINE_FANOUT_THRESHOLD', '5000'))
+BACKFILL_LIMIT = int(os.environ.get('TIMELINE_BACKFILL_LIMIT', '50'))
+FANOUT_CHUNK_SIZE = 1000
+PULL_AUTHORS_TTL = 60  # seconds
+
+
+def _entry(user_id: str, post: dict) -> dict:
+    return {
+        "user_id": user_id,
+        "post_id": post['id'],
+        "author_id": post['user_id'],
+        "created_at": post['created_at'],
+    }
+
+
+class TimelineStore:
+    def __init__(self, db):
+        self.db = db
+        self._pull_authors: Set[str] = set()
+        self._pull_authors_loaded_at = 0.0
+        self._fan_outs: Set[asyncio.Task] = set()
+
+    async def _insert_entries(self, entries: List[dict]):
+        for i in range(0, len(entries), FANOUT_CHUNK_SIZE):
+            chunk = entries[i:i + FANOUT_CHUNK_SIZE]
+            try:
+                await self.db.timelines.bulk_write([InsertOne(e) for e in chunk], ordered=False)
+            except BulkWriteError as e:
+                # Duplicate (user_id, post_id) pairs are expected on re-delivery and backfill.
+                if any(err.get('code') != 11000 for err in e.details.get('writeErrors', [])):
+                    raise
+
+    async def fan_out(self, post: dict, followers_count: int):
+        """Add ``post`` to its author's timeline now and to their followers' in the background."""
+        await self._insert_entries([_entry(post['user_id'], post)])
+        if followers_count > FANOUT_THRESHOLD:
+            await self.mark_pull_author(post['user_id'])
+            return
+        task = asyncio.create_task(self._push(post))
+        self._fan_outs.add(task)
+        task.add_done_callback(self._fan_outs.discard)
+
+    async def _push(self, post: dict):
+        try:
+            async for follower_ids in follower_id_batches(self.db, post['user_id'], FANOUT_CHUNK_SIZE):
+                await self._insert_entries([_entry(follower_id, post) for follower_id in follower_ids])
+        except Exception:
+            # Followers' feeds miss the post until a rebuild; the post itself is stored.
+            logger.exception("Timeline fan-out failed for post %s", post['id'])
+
+    async def stop(self, timeout: float = 10):
+        if self._fan_outs:
+            _, pending = await asyncio.wait(self._fan_outs, timeout=timeout)
+            if pending:
+                logger.warning("Shutting down with %d timeline fan-outs unfinished", len(pending))
+
+    async def mark_pull_author(self, author_id: str):
+        if author_id in self._pull_authors:
+            return
+        await self.db.users.update_one({"id": author_id}, {"$set": {"timeline_pull": True}})
+        self._pull_authors.add(author_id)
+
+    async def pull_authors(self) -> Set[str]:
+        if time.monotonic() - self._pull_authors_loaded_at > PULL_AUTHORS_TTL:
+            docs = await self.db.users.find({"timeline_pull": True}, {"_id": 0, "id": 1}).to_list(None)
+            self._pull_authors = {d['id'] for d in docs}
+            self._pull_authors_loaded_at = time.monotonic()
+        return self._pull_authors
+
+    async def _backfill(self, user_id: str, author_id: str):
+        posts = await self.db.posts.find(
+            {"user_id": author_id}, {"_id": 0, "id": 1, "user_id": 1, "created_at": 1}
+        ).sort("created_at", DESCENDING).limit(BACKFILL_LIMIT).to_list(BACKFILL_LIMIT)
+        await self._insert_entries([_entry(user_id, p) for p in posts])
+
+    async def follow(self, user_id: str, author_id: str):
+        if author_id not in await self.pull_authors():
+            await self._backfill(user_id, author_id)
+
+    async def unfollow(self, user_id: str, author_id: str):
+        await self.db.timelines.delete_many({"user_id": user_id, "author_id": author_id})
+
+    async def _followed_among(self, user_id: str, author_ids: Set[str]) -> List[str]:
+        if not author_ids:
+            return []
+        edges = await self.db.follows.find(
+            {"follower_id": user_id, "followee_id": {"$in": list(author_ids)}}, {"_id": 0, "followee_id": 1}
+        ).to_list(len(author_ids))
+        return [e['followee_id'] for e in edges]
+
+    async def read(self, user_id: str, after: Optional[Cursor], limit: int) -> List[dict]:
+        """Return up to ``limit + 1`` feed posts older than ``after`` (see ``pagination.finish_page``).
+
+        Entries whose post is gone (until the delete cascade removes them) are
+        skipped and the scan continues past them, so a page is only short at the
+        end of the feed.
+        """
+        window = limit + 1
+        pull_ids = await self._followed_among(user_id, await self.pull_authors())
+        page: List[dict] = []
+        while len(page) < window:
+            need = window - len(page)
+            entries = await self.db.timelines.find(
+                keyset_query({"user_id": user_id}, after, id_field="post_id"),
+                {"_id": 0, "post_id": 1, "created_at": 1}
+            ).sort(keyset_sort(id_field="post_id")).limit(need).to_list(need)
+            if pull_ids:
+                pulled = await self.db.posts.find(
+                    keyset_query({"user_id": {"$in": pull_ids}}, after), {"_id": 0, "id": 1, "created_at": 1}
+                ).sort(keyset_sort()).limit(need).to_list(need)
+                entries.extend({"post_id": p['id'], "created_at": p['created_at']} for p in pulled)
+
+            seen = set()
+            scanned = []
+            for e in sorted(entries, key=lambda e: (e['created_at'], e['post_id']), reverse=True):
+                if e['post_id'] not in seen:
+                    seen.add(e['post_id'])
+                    scanned.append(e)
+            scanned = scanned[:need]
+            if not scanned:
+                break
+
+            ids = [e['post_id'] for e in scanned]
+            posts = await self.db.posts.find({"id": {"$in": ids}}, {"_id": 0}).to_list(len(ids))
+            by_id = {p['id']: p for p in posts}
+            page.extend(by_id[pid] for pid in ids if pid in by_id)
+            if len(scanned) < need:
+                break
+            after = (scanned[-1]['created_at'], scanned[-1]['post_id'])
+        return page
+
+    async def rebuild(self, user: dict):
+        """Recompute one user's timeline from the authors they follow."""
+        await self.db.timelines.delete_many({"user_id": user['id']})
+        await self._backfill(user['id'], user['id'])
+        pull = await self.pull_authors()
+        async for edge in self.db.follows.find({"follower_id": user['id']}, {"_id": 0, "followee_id": 1}):
+            if edge['followee_id'] not in pull:
+                await self._backfill(user['id'], edge['followee_id'])
+
+    async def rebuild_all(self):
+        async for user in self.db.users.find({"followers_count": {"$gt": FANOUT_THRESHOLD}}, {"_id": 0, "id": 1}):
+            await self.mark_pull_author(user['id'])
+        self._pull_authors_loaded_at = 0.0
+        count = 0
+        async for user in self.db.users.find({}, {"_id": 0, "id": 1}):
+            await self.rebuild(user)
+            count += 1
+        logger.info("Rebuilt %d timelines", count)
+        return count
+
+
+if __name__ == '__main__':
+    # python timeline.py  -- rebuild every user's timeline from the follow graph
+    from indexes import ensure_indexes
+    from server import db
+
+    logging.basicConfig(level=logging.INFO)
+    store = TimelineStore(db)
+
+    async def main():
+        await ensure_indexes(db)
+        await store.rebuild_all()
+
+    asyncio.run(main())
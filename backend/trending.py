@@ -0,0 +1,195 @@
+"""Time-decayed trending leaderboards for posts and hashtags.
+
+Scores use forward decay: an event of weight ``w`` at time ``t`` adds
+``w * 2 ** ((t - EPOCH) / HALF_LIFE)``. Relative order never changes as time
+passes, so nothing has to be rewritten to decay old scores and the ranking can
+be served straight off an index. Scores are kept in log2 space
+(``trending_scores.log_score``) so they don't overflow.
+
+Views, reactions and comments are buffered in memory and flushed every
+``TRENDING_REFRESH_SECONDS`` as atomic upserts, or as soon as
+``TRENDING_FLUSH_MAX_KEYS`` distinct posts/hashtags are pending; the periodic
+loop also reloads the small leaderboards that the endpoints serve from memory.
+Flushes look up posts and write scores ``FLUSH_BATCH_SIZE`` keys at a time.
+
+``python trending.py`` reseeds scores from existing posts.
+"""
+import asyncio
+import logging
+import math
+import os
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+from pymongo import DESCENDING, UpdateOne
+
+logger = logging.getLogger(__name__)
+
+POST = "post"
+HASHTAG = "hashtag"
+
+HALF_LIFE_HOURS = float(os.environ.get('TRENDING_HALF_LIFE_HOURS', '6'))
+REFRESH_SECONDS = float(os.environ.get('TRENDING_REFRESH_SECONDS', '30'))
+FLUSH_MAX_KEYS = int(os.environ.get('TRENDING_FLUSH_MAX_KEYS', '5000'))
+FLUSH_BATCH_SIZE = 500
+LEADERBOARD_SIZE = 20
+EPOCH = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+VIEW_WEIGHT = 1
+REACTION_WEIGHT = 3
+COMMENT_WEIGHT = 5
+NEW_POST_HASHTAG_WEIGHT = 5
+
+
+def _log_value(weight: float, at: datetime) -> float:
+    return math.log2(weight) + (at - EPOCH).total_seconds() / 3600 / HALF_LIFE_HOURS
+
+
+def _log_add(a: Optional[float], b: float) -> float:
+    if a is None:
+        return b
+    m = max(a, b)
+    return m + math.log2(2 ** (a - m) + 2 ** (b - m))
+
+
+def current_score(log_score: float, now: Optional[datetime] = None) -> float:
+    """Decayed score as of ``now`` (events happening now count at full weight)."""
+    now = now or datetime.now(timezone.utc)
+    return 2 ** (log_score - _log_value(1, now))
+
+
+def _upsert(kind: str, key: str, value: float) -> UpdateOne:
+    # log_score = log2(2**log_score + 2**value), computed server-side so concurrent
+    # workers can flush into the same document without losing increments.
+    current = {"$ifNull": ["$log_score", value - 64]}
+    return UpdateOne(
+        {"kind": kind, "key": key},
+        [{"$set": {"log_score": {"$let": {
+            "vars": {"m": {"$max": [current, value]}},
+            "in": {"$add": ["$$m", {"$log": [{"$add": [
+                {"$pow": [2, {"$subtract": [current, "$$m"]}]},
+                {"$pow": [2, {"$subtract": [value, "$$m"]}]},
+            ]}, 2]}]},
+        }}}}],
+        upsert=True,
+    )
+
+
+class TrendingEngine:
+    def __init__(self, db):
+        self.db = db
+        self._pending: Dict[Tuple[str, str], float] = {}
+        self._pending_post_events: Dict[str, float] = {}
+        self.posts: List[dict] = []
+        self.hashtags: List[dict] = []
+        self._task: Optional[asyncio.Task] = None
+        self._flush_task: Optional[asyncio.Task] = None
+
+    def _add(self, pending: dict, key, weight: float, at: Optional[datetime]):
+        value = _log_value(weight, at or datetime.now(timezone.utc))
+        pending[key] = _log_add(pending.get(key), value)
+        if (len(self._pending) + len(self._pending_post_events) >= FLUSH_MAX_KEYS
+                and (self._flush_task is None or self._flush_task.done())):
+            self._flush_task = asyncio.create_task(self._try_flush())
+
+    async def _try_flush(self):
+        try:
+            await self.flush()
+        except Exception:
+            logger.exception("Trending flush failed")
+
+    def record_post_event(self, post_id: str, weight: float, at: Optional[datetime] = None):
+        """Credit a view/reaction/comment to a post; its hashtags are credited at flush time."""
+        self._add(self._pending_post_events, post_id, weight, at)
+
+    def record_hashtags(self, hashtags: List[str], weight: float, at: Optional[datetime] = None):
+        for tag in set(hashtags):
+            self._add(self._pending, (HASHTAG, tag), weight, at)
+
+    async def flush(self):
+        post_events, self._pending_post_events = self._pending_post_events, {}
+        pending, self._pending = self._pending, {}
+        post_ids = list(post_events)
+        for i in range(0, len(post_ids), FLUSH_BATCH_SIZE):
+            chunk = post_ids[i:i + FLUSH_BATCH_SIZE]
+            async for post in self.db.posts.find({"id": {"$in": chunk}}, {"_id": 0, "id": 1, "hashtags": 1}):
+                value = post_events[post['id']]
+                pending[(POST, post['id'])] = _log_add(pending.get((POST, post['id'])), value)
+                for tag in set(post.get('hashtags', [])):
+                    pending[(HASHTAG, tag)] = _log_add(pending.get((HASHTAG, tag)), value)
+        ops = [_upsert(kind, key, value) for (kind, key), value in pending.items()]
+        for i in range(0, len(ops), FLUSH_BATCH_SIZE):
+            await self.db.trending_scores.bulk_write(ops[i:i + FLUSH_BATCH_SIZE], ordered=False)
+
+    async def _top(self, kind: str, limit: int) -> List[dict]:
+        return await self.db.trending_scores.find(
+            {"kind": kind}, {"_id": 0, "key": 1, "log_score": 1}
+        ).sort("log_score", DESCENDING).limit(limit).to_list(limit)
+
+    async def refresh(self):
+        await self.flush()
+        now = datetime.now(timezone.utc)
+        top_posts = await self._top(POST, LEADERBOARD_SIZE)
+        ids = [t['key'] for t in top_posts]
+        docs = await self.db.posts.find({"id": {"$in": ids}}, {"_id": 0}).to_list(len(ids)) if ids else []
+        by_id = {d['id']: d for d in docs}
+        self.posts = [by_id[i] for i in ids if i in by_id]
+        self.hashtags = [
+            {"hashtag": t['key'], "score": round(current_score(t['log_score'], now), 3)}
+            for t in await self._top(HASHTAG, LEADERBOARD_SIZE)
+        ]
+
+    async def remove_post(self, post_id: str):
+        self._pending_post_events.pop(post_id, None)
+        self.posts = [p for p in self.posts if p['id'] != post_id]
+        await self.db.trending_scores.delete_one({"kind": POST, "key": post_id})
+
+    async def _run(self):
+        while True:
+            try:
+                await self.refresh()
+            except Exception:
+                logger.exception("Trending refresh failed")
+            await asyncio.sleep(REFRESH_SECONDS)
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+
+    async def rebuild(self):
+        """Reseed scores from each post's views, reactions and comments at its creation time."""
+        await self.db.trending_scores.delete_many({})
+        count = 0
+        async for post in self.db.posts.find({}, {"_id": 0, "id": 1, "hashtags": 1, "views": 1,
+                                                  "reaction_counts": 1, "comment_count": 1, "created_at": 1}):
+            at = post['created_at']
+            weight = (VIEW_WEIGHT * post.get('views', 0)
+                      + REACTION_WEIGHT * sum(post.get('reaction_counts', {}).values())
+                      + COMMENT_WEIGHT * post.get('comment_count', 0))
+            self.record_hashtags(post.get('hashtags', []), NEW_POST_HASHTAG_WEIGHT, at)
+            if weight:
+                self.record_post_event(post['id'], weight, at)
+            count += 1
+            if count % 1000 == 0:
+                await self.flush()
+        await self.refresh()
+        logger.info("Reseeded trending scores from %d posts", count)
+        return count
+
+
+if __name__ == '__main__':
+    from indexes import ensure_indexes
+    from server import db
+
+    logging.basicConfig(level=logging.INFO)
+
+    async def main():
+        await ensure_indexes(db)
+        await TrendingEngine(db).rebuild()
+
+    asyncio.run(main())
@@ -0,0 +1,79 @@
+"""Write-coalescing view counter.
+
+``POST /posts/{id}/view`` only bumps an in-memory counter. Pending counts are
+written with a single ``bulk_write`` of ``$inc`` updates every
+``VIEW_FLUSH_SECONDS``, as soon as ``VIEW_FLUSH_MAX_POSTS`` distinct posts are
+pending, and once more on shutdown.
+"""
+import asyncio
+import logging
+import os
+from collections import Counter
+from typing import Iterable, Optional
+
+from pymongo import UpdateOne
+
+logger = logging.getLogger(__name__)
+
+FLUSH_SECONDS = float(os.environ.get('VIEW_FLUSH_SECONDS', '5'))
+FLUSH_MAX_POSTS = int(os.environ.get('VIEW_FLUSH_MAX_POSTS', '1000'))
+
+
+class ViewCounter:
+    def __init__(self, db):
+        self.db = db
+        self._pending: Counter = Counter()
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._flush_task: Optional[asyncio.Task] = None
+        self.flushes = 0
+        self.views_written = 0
+
+    @property
+    def pending(self) -> int:
+        return sum(self._pending.values())
+
+    def add(self, post_ids: Iterable[str]):
+        self._pending.update(post_ids)
+        # One early flush at a time, held so the task isn't garbage-collected mid-flush
+        if len(self._pending) >= FLUSH_MAX_POSTS and (self._flush_task is None or self._flush_task.done()):
+            self._flush_task = asyncio.create_task(self._try_flush())
+
+    async def flush(self):
+        async with self._lock:
+            if not self._pending:
+                return
+            batch, self._pending = self._pending, Counter()
+            try:
+                await self.db.posts.bulk_write(
+                    [UpdateOne({"id": post_id}, {"$inc": {"views": n}}) for post_id, n in batch.items()],
+                    ordered=False,
+                )
+            except Exception:
+                # Put the counts back so the next flush retries them.
+                self._pending.update(batch)
+                raise
+            self.flushes += 1
+            self.views_written += sum(batch.values())
+
+    async def _try_flush(self):
+        try:
+            await self.flush()
+        except Exception:
+            logger.exception("View counter flush failed")
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(FLUSH_SECONDS)
+            await self._try_flush()
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        if self._flush_task:
+            await self._flush_task
+        await self.flush()
@@ -4,7 +4,7 @@ import { toast } from 'sonner';
 import { useNavigate } from 'react-router-dom';
 import { LogOut, Plus, MessageCircle, Edit2, Trash2, Send, Image as ImageIcon, X, ThumbsUp, Award, Lightbulb, Smile, Bookmark, BookmarkCheck, TrendingUp, Users, Search, Bell, Home, Heart } from 'lucide-react';
 import { formatDistanceToNow } from 'date-fns';
-import { REACTIONS, getInitials, renderHashtags } from './FeedHelpers';
+import { REACTIONS, getInitials, getReactionTotal, mediaUrl, renderHashtags, withAuthors } from './FeedHelpers';
 
 const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
 const API = `${BACKEND_URL}/api`;
@@ -13,7 +13,7 @@ export default function Feed({ user, onLogout, token, refreshUser }) {
   const [state, setState] = useState({
     posts: [], trendingPosts: [], suggestedUsers: [], notifications: [],
     unreadCount: 0, comments: {}, newComment: {}, showReactions: null,
-    showNotifications: false, searchQuery: '', feedView: 'all'
+    showNotifications: false, searchQuery: '', feedView: 'all', followed: {}
   });
   
   const [newPost, setNewPost] = useState({ content: '', image: null });
@@ -26,10 +26,38 @@ export default function Feed({ user, onLogout, token, refreshUser }) {
 
   useEffect(() => {
     loadData();
-    const interval = setInterval(() => axios.get(`${API}/notifications/unread/count`, {headers:{Authorization:`Bearer ${token}`}}).then(r=>setState(s=>({...s,unreadCount:r.data.count}))).catch(()=>{}), 30000);
-    return () => clearInterval(interval);
   }, [state.feedView]);
 
+  useEffect(() => {
+    // Pushed notifications and unread count (Server-Sent Events) instead of polling.
+    // Opened with a short-lived stream token, so each (re)connect asks for a fresh one.
+    let source = null, retry = null, closed = false;
+    const connect = async () => {
+      try {
+        const res = await axios.post(`${API}/notifications/stream-token`, null, {headers:{Authorization:`Bearer ${token}`}});
+        if (closed) return;
+        source = new EventSource(`${API}/notifications/stream?token=${encodeURIComponent(res.data.token)}`);
+      } catch(e) {
+        if (!closed) retry = setTimeout(connect, 5000);
+        return;
+      }
+      source.addEventListener('unread_count', (e) => {
+        const { count } = JSON.parse(e.data);
+        setState(s => ({...s, unreadCount: count}));
+      });
+      source.addEventListener('notification', (e) => {
+        const [notif] = withAuthors(JSON.parse(e.data));
+        setState(s => ({...s, notifications: [notif, ...s.notifications.filter(n => n.id !== notif.id)].slice(0, 20)}));
+      });
+      source.onerror = () => {
+        source.close();
+        if (!closed) retry = setTimeout(connect, 3000);
+      };
+    };
+    connect();
+    return () => { closed = true; clearTimeout(retry); if (source) source.close(); };
+  }, [token]);
+
   const loadData = async () => {
     try {
       const [postsRes, trendingRes, suggestedRes, notifsRes, countRes] = await Promise.all([
@@ -39,7 +67,7 @@ export default function Feed({ user, onLogout, token, refreshUser }) {
         axios.get(`${API}/notifications`, {headers:{Authorization:`Bearer ${token}`}}),
         axios.get(`${API}/notifications/unread/count`, {headers:{Authorization:`Bearer ${token}`}})
       ]);
-      setState(s => ({...s, posts:postsRes.data, trendingPosts:trendingRes.data, suggestedUsers:suggestedRes.data, notifications:notifsRes.data, unreadCount:countRes.data.count}));
+      setState(s => ({...s, posts:withAuthors(postsRes.data), trendingPosts:withAuthors(trendingRes.data), suggestedUsers:suggestedRes.data, notifications:withAuthors(notifsRes.data), unreadCount:countRes.data.count}));
     } catch(e) { console.error('Load failed', e); }
   };
 
@@ -62,7 +90,7 @@ export default function Feed({ user, onLogout, token, refreshUser }) {
     try {
       const fd = new FormData(); fd.append('file', file);
       const res = await axios.post(`${API}/upload`, fd, {headers:{Authorization:`Bearer ${token}`}});
-      setNewPost({...newPost, image:res.data.image}); setImagePreview(res.data.image);
+      setNewPost({...newPost, image:res.data.image}); setImagePreview(mediaUrl(res.data.image, 'medium'));
       toast.success('Uploaded');
     } catch(e) { toast.error('Upload failed'); } finally { setLoading(false); }
   };
@@ -78,7 +106,7 @@ export default function Feed({ user, onLogout, token, refreshUser }) {
     if (state.comments[postId]) return setState(s=>({...s,comments:{...s.comments,[postId]:null}}));
     try {
       const res = await axios.get(`${API}/posts/${postId}/comments`, {headers:{Authorization:`Bearer ${token}`}});
-      setState(s=>({...s,comments:{...s.comments,[postId]:res.data}}));
+      setState(s=>({...s,comments:{...s.comments,[postId]:withAuthors(res.data)}}));
     } catch(e) { toast.error('Failed'); }
   };
 
@@ -92,21 +120,14 @@ export default function Feed({ user, onLogout, token, refreshUser }) {
   };
 
   const handleBookmark = async (postId) => {
+    const setBookmarked = (bookmarked) => setState(s => ({...s, posts: s.posts.map(p => p.id === postId ? {...p, bookmarked} : p)}));
     try {
-      const isCurrentlyBookmarked = user?.bookmarks?.includes(postId);
-      
-      if (user) {
-        if (isCurrentlyBookmarked) {
-          user.bookmarks = user.bookmarks.filter(id => id !== postId);
-        } else {
-          user.bookmarks = [...(user.bookmarks || []), postId];
-        }
-      }
-      
-      setState(s => ({...s}));
+      const isCurrentlyBookmarked = state.posts.find(p => p.id === postId)?.bookmarked;
+      setBookmarked(!isCurrentlyBookmarked);
       
-      await axios.post(`${API}/posts/${postId}/bookmark`, {}, {headers:{Authorization:`Bearer ${token}`}});
-      toast.success(isCurrentlyBookmarked ? 'Bookmark removed' : 'Bookmarked');
+      const res = await axios.post(`${API}/posts/${postId}/bookmark`, {}, {headers:{Authorization:`Bearer ${token}`}});
+      setBookmarked(res.data.bookmarked);
+      toast.success(res.data.bookmarked ? 'Bookmarked' : 'Bookmark removed');
     } catch(e) { 
       toast.error('Failed');
       loadData();
@@ -115,17 +136,13 @@ export default function Feed({ user, onLogout, token, refreshUser }) {
 
   const handleFollow = async (userId) => {
     try {
-      const isCurrentlyFollowing = user?.following?.includes(userId);
+      const isCurrentlyFollowing = !!state.followed[userId];
       
       if (user) {
-        if (isCurrentlyFollowing) {
-          user.following = user.following.filter(id => id !== userId);
-        } else {
-          user.following = [...(user.following || []), userId];
-        }
+        user.following_count = (user.following_count || 0) + (isCurrentlyFollowing ? -1 : 1);
       }
       
-      setState(s => ({...s}));
+      setState(s => ({...s, followed: {...s.followed, [userId]: !isCurrentlyFollowing}}));
       
       await axios.post(`${API}/users/${userId}/follow`, {}, {headers:{Authorization:`Bearer ${token}`}});
       
@@ -162,14 +179,14 @@ export default function Feed({ user, onLogout, token, refreshUser }) {
     if (!state.searchQuery.trim()) return loadData();
     try {
       const res = await axios.get(`${API}/posts/search?q=${encodeURIComponent(state.searchQuery)}`);
-      setState(s=>({...s,posts:res.data}));
+      setState(s=>({...s,posts:withAuthors(res.data)}));
     } catch(e) { toast.error('Search failed'); }
   };
 
-  const getUserReaction = (post) => post.reactions?.find(r => r.user_id === user?.id);
+  const getUserReaction = (post) => post.my_reaction ? { type: post.my_reaction } : null;
   const getReactionCounts = (post) => {
     const counts = {};
-    post.reactions?.forEach(r => counts[r.type] = (counts[r.type] || 0) + 1);
+    Object.entries(post.reaction_counts || {}).forEach(([type, n]) => { if (n > 0) counts[type] = n; });
     return counts;
   };
 
@@ -206,7 +223,7 @@ export default function Feed({ user, onLogout, token, refreshUser }) {
                       <div>{state.notifications.map(n=>(
                         <div key={n.id} className="p-4 border-b hover:bg-gray-50 cursor-pointer" style={{borderColor:'var(--border)'}} data-testid={`notification-${n.id}`}>
                           <div className="flex gap-3">
-                            {n.actor_avatar?<img src={n.actor_avatar} alt="" className="avatar-sm"/>:<div className="avatar-sm">{getInitials(n.actor_name)}</div>}
+                            {n.actor_avatar?<img src={mediaUrl(n.actor_avatar, 'thumb')} alt="" className="avatar-sm"/>:<div className="avatar-sm">{getInitials(n.actor_name)}</div>}
                             <div className="flex-1"><p className="text-sm">{n.message}</p><p className="text-xs mt-1" style={{color:'var(--text-tertiary)'}}>{formatDistanceToNow(new Date(n.created_at),{addSuffix:true})}</p></div>
                           </div>
                         </div>
@@ -216,7 +233,7 @@ export default function Feed({ user, onLogout, token, refreshUser }) {
                 )}
               </div>
               <button onClick={()=>navigate(`/profile/${user?.id}`)} className="flex items-center gap-2 hover:bg-gray-100 px-3 py-2 rounded-lg transition-colors" data-testid="nav-profile-button">
-                {user?.avatar?<img src={user.avatar} alt={user.name} className="avatar-sm"/>:<div className="avatar-sm" style={{display:'flex',alignItems:'center',justifyContent:'center'}}>{getInitials(user?.name)}</div>}
+                {user?.avatar?<img src={mediaUrl(user.avatar, 'thumb')} alt={user.name} className="avatar-sm"/>:<div className="avatar-sm" style={{display:'flex',alignItems:'center',justifyContent:'center'}}>{getInitials(user?.name)}</div>}
                 <span className="font-medium text-sm hidden md:inline" style={{color:'var(--text-primary)'}}>Me</span>
               </button>
               <button onClick={onLogout} className="btn-ghost" data-testid="logout-button"><LogOut size={18}/><span className="hidden md:inline">Logout</span></button>
@@ -236,7 +253,7 @@ export default function Feed({ user, onLogout, token, refreshUser }) {
                 style={{
                   ...(user?.cover_image
                     ? {
-                        backgroundImage: `url(${user.cover_image})`,
+                        backgroundImage: `url(${mediaUrl(user.cover_image, 'medium')})`,
                         backgroundSize: 'cover',
                         backgroundPosition: 'center',
                         backgroundRepeat: 'no-repeat'
@@ -249,13 +266,13 @@ export default function Feed({ user, onLogout, token, refreshUser }) {
                 }}
               ></div>
               <div className="text-center" style={{marginTop:'-2.5rem'}}>
-                {user?.avatar?<img src={user.avatar} alt={user.name} className="avatar-lg mx-auto" style={{border:'3px solid white'}}/>:<div className="avatar-lg mx-auto" style={{border:'3px solid white'}}>{getInitials(user?.name)}</div>}
+                {user?.avatar?<img src={mediaUrl(user.avatar, 'thumb')} alt={user.name} className="avatar-lg mx-auto" style={{border:'3px solid white'}}/>:<div className="avatar-lg mx-auto" style={{border:'3px solid white'}}>{getInitials(user?.name)}</div>}
                 <h3 className="font-bold mt-3" style={{fontSize:'1.1rem'}}>{user?.name}</h3>
                 <p className="text-sm mt-1" style={{color:'var(--text-secondary)'}}>{user?.headline||'Professional'}</p>
               </div>
               <div className="mt-4 pt-4 border-t" style={{borderColor:'var(--border)'}}>
-                <div className="flex justify-between text-sm"><span style={{color:'var(--text-secondary)'}}>Followers</span><span className="font-semibold">{user?.followers?.length||0}</span></div>
-                <div className="flex justify-between text-sm mt-2"><span style={{color:'var(--text-secondary)'}}>Following</span><span className="font-semibold">{user?.following?.length||0}</span></div>
+                <div className="flex justify-between text-sm"><span style={{color:'var(--text-secondary)'}}>Followers</span><span className="font-semibold">{user?.followers_count||0}</span></div>
+                <div className="flex justify-between text-sm mt-2"><span style={{color:'var(--text-secondary)'}}>Following</span><span className="font-semibold">{user?.following_count||0}</span></div>
               </div>
               <button onClick={()=>navigate(`/profile/${user?.id}`)} className="btn-secondary w-full mt-4" data-testid="view-profile-button">View Profile</button>
             </div>
@@ -266,7 +283,7 @@ export default function Feed({ user, onLogout, token, refreshUser }) {
             {/* Create Post */}
             <div className="premium-card p-4 fade-in" data-testid="create-post-container">
               <button onClick={()=>setShowCreatePost(!showCreatePost)} className="w-full text-left input-field flex items-center gap-3 cursor-pointer" data-testid="create-post-trigger">
-                {user?.avatar?<img src={user.avatar} alt={user.name} className="avatar-sm"/>:<div className="avatar-sm">{getInitials(user?.name)}</div>}
+                {user?.avatar?<img src={mediaUrl(user.avatar, 'thumb')} alt={user.name} className="avatar-sm"/>:<div className="avatar-sm">{getInitials(user?.name)}</div>}
                 <span style={{color:'var(--text-tertiary)'}}>Start a post...</span>
               </button>
               {showCreatePost && (
@@ -298,7 +315,7 @@ export default function Feed({ user, onLogout, token, refreshUser }) {
                     <div key={post.id} className="post-card p-6 fade-in" data-testid={`post-${post.id}`}>
                       <div className="flex items-start gap-3">
                         <button onClick={()=>navigate(`/profile/${post.user_id}`)} data-testid={`post-${post.id}-avatar`}>
-                          {post.user_avatar?<img src={post.user_avatar} alt={post.user_name} className="avatar"/>:<div className="avatar">{getInitials(post.user_name)}</div>}
+                          {post.user_avatar?<img src={mediaUrl(post.user_avatar, 'thumb')} alt={post.user_name} className="avatar"/>:<div className="avatar">{getInitials(post.user_name)}</div>}
                         </button>
                         <div className="flex-1">
                           <div className="flex items-start justify-between">
@@ -309,7 +326,7 @@ export default function Feed({ user, onLogout, token, refreshUser }) {
                             </div>
                             <div className="flex gap-2">
                               {user?.id===post.user_id&&(<><button onClick={()=>{setEditingPost(post.id);setEditContent(post.content);}} className="text-gray-500 hover:text-blue-600 p-2" data-testid={`post-${post.id}-edit-button`}><Edit2 size={16}/></button><button onClick={()=>handleDelete(post.id)} className="text-gray-500 hover:text-red-600 p-2" data-testid={`post-${post.id}-delete-button`}><Trash2 size={16}/></button></>)}
-                              <button onClick={()=>handleBookmark(post.id)} className="text-gray-500 hover:text-blue-600 p-2" data-testid={`post-${post.id}-bookmark-button`}>{user?.bookmarks?.includes(post.id)?<BookmarkCheck size={16}/>:<Bookmark size={16}/>}</button>
+                              <button onClick={()=>handleBookmark(post.id)} className="text-gray-500 hover:text-blue-600 p-2" data-testid={`post-${post.id}-bookmark-button`}>{post.bookmarked?<BookmarkCheck size={16}/>:<Bookmark size={16}/>}</button>
                             </div>
                           </div>
                           {editingPost===post.id ? (
@@ -320,11 +337,11 @@ export default function Feed({ user, onLogout, token, refreshUser }) {
                           ) : (
                             <>
                               <p className="mt-3 whitespace-pre-wrap" style={{color:'var(--text-primary)',lineHeight:1.6}} data-testid={`post-${post.id}-content`}>{renderHashtags(post.content)}</p>
-                              {post.image&&<img src={post.image} alt="Post" className="mt-4 w-full rounded-lg max-h-96 object-cover" data-testid={`post-${post.id}-image`}/>}
-                              {post.reactions&&post.reactions.length>0&&(
+                              {post.image&&<img src={mediaUrl(post.image, 'medium')} alt="Post" className="mt-4 w-full rounded-lg max-h-96 object-cover" data-testid={`post-${post.id}-image`}/>}
+                              {getReactionTotal(post)>0&&(
                                 <div className="flex items-center gap-2 mt-3 text-sm" style={{color:'var(--text-secondary)'}}>
                                   <div className="flex -space-x-1">{Object.keys(reactionCounts).slice(0,3).map(type=>{const r=REACTIONS.find(x=>x.type===type);if(!r)return null;const Icon=r.icon;return <div key={type} className="w-5 h-5 rounded-full flex items-center justify-center" style={{background:r.color,border:'2px solid white'}}><Icon size={12} color="white"/></div>;})}</div>
-                                  <span>{post.reactions.length}</span>
+                                  <span>{getReactionTotal(post)}</span>
                                 </div>
                               )}
                               <div className="flex items-center gap-1 mt-4 pt-4 border-t" style={{borderColor:'var(--border)'}}>
@@ -345,23 +362,23 @@ export default function Feed({ user, onLogout, token, refreshUser }) {
                                     </div>
                                   )}
                                 </div>
-                                <button onClick={()=>fetchComments(post.id)} className="icon-btn" data-testid={`post-${post.id}-comment-button`}><MessageCircle size={18}/><span>Comment</span></button>
+                                <button onClick={()=>fetchComments(post.id)} className="icon-btn" data-testid={`post-${post.id}-comment-button`}><MessageCircle size={18}/><span>{post.comment_count?`Comment (${post.comment_count})`:'Comment'}</span></button>
                               </div>
                               {state.comments[post.id]&&(
                                 <div className="mt-4 space-y-4" data-testid={`post-${post.id}-comments-section`}>
                                   <div className="flex gap-2">
-                                    {user?.avatar?<img src={user.avatar} alt="" className="avatar-sm"/>:<div className="avatar-sm">{getInitials(user?.name)}</div>}
+                                    {user?.avatar?<img src={mediaUrl(user.avatar, 'thumb')} alt="" className="avatar-sm"/>:<div className="avatar-sm">{getInitials(user?.name)}</div>}
                                     <input type="text" placeholder="Add a comment..." value={state.newComment[post.id]||''} onChange={(e)=>setState(s=>({...s,newComment:{...s.newComment,[post.id]:e.target.value}}))} onKeyPress={(e)=>e.key==='Enter'&&handleComment(post.id)} className="input-field flex-1" style={{padding:'0.5rem 1rem'}} data-testid={`post-${post.id}-comment-input`}/>
                                     <button onClick={()=>handleComment(post.id)} className="btn-primary" style={{padding:'0.5rem 1rem'}} data-testid={`post-${post.id}-comment-submit`}><Send size={18}/></button>
                                   </div>
                                   <div className="space-y-3">
                                     {state.comments[post.id].map(c=>(
                                       <div key={c.id} className="flex gap-3" data-testid={`comment-${c.id}`}>
-                                        {c.user_avatar?<img src={c.user_avatar} alt={c.user_name} className="avatar-sm"/>:<div className="avatar-sm">{getInitials(c.user_name)}</div>}
+                                        {c.user_avatar?<img src={mediaUrl(c.user_avatar, 'thumb')} alt={c.user_name} className="avatar-sm"/>:<div className="avatar-sm">{getInitials(c.user_name)}</div>}
                                         <div className="flex-1 rounded-lg p-3" style={{background:'var(--bg-secondary)'}}>
                                           <div className="flex items-start justify-between">
                                             <div><p className="font-semibold text-sm">{c.user_name}</p>{c.user_headline&&<p className="text-xs" style={{color:'var(--text-secondary)'}}>{c.user_headline}</p>}</div>
-                                            {user?.id===c.user_id&&<button onClick={()=>axios.delete(`${API}/comments/${c.id}`,{headers:{Authorization:`Bearer ${token}`}}).then(()=>{toast.success('Deleted');fetchComments(post.id);}).catch(()=>toast.error('Failed'))} className="text-gray-400 hover:text-red-600" data-testid={`comment-${c.id}-delete-button`}><Trash2 size={14}/></button>}
+                                            {(user?.id===c.user_id||user?.id===post.user_id)&&<button onClick={()=>axios.delete(`${API}/comments/${c.id}`,{headers:{Authorization:`Bearer ${token}`}}).then(()=>{toast.success('Deleted');fetchComments(post.id);}).catch(()=>toast.error('Failed'))} className="text-gray-400 hover:text-red-600" data-testid={`comment-${c.id}-delete-button`}><Trash2 size={14}/></button>}
                                           </div>
                                           <p className="text-sm mt-1">{c.content}</p>
                                           <p className="text-xs mt-1" style={{color:'var(--text-tertiary)'}}>{formatDistanceToNow(new Date(c.created_at),{addSuffix:true})}</p>
@@ -389,7 +406,7 @@ export default function Feed({ user, onLogout, token, refreshUser }) {
               {state.trendingPosts.length===0?<p className="text-sm" style={{color:'var(--text-secondary)'}}>No trending posts</p>:(
                 <div className="space-y-3">{state.trendingPosts.map((p,i)=>(
                   <div key={p.id} className="pb-3 border-b last:border-0 cursor-pointer hover:bg-gray-50 p-2 rounded" style={{borderColor:'var(--border)'}}>
-                    <div className="flex items-start gap-2"><span className="font-bold" style={{color:'var(--text-tertiary)'}}>{i+1}</span><div className="flex-1"><p className="text-sm font-medium line-clamp-2">{p.content}</p><p className="text-xs mt-1" style={{color:'var(--text-secondary)'}}>{p.views} views · {p.reactions?.length||0} reactions</p></div></div>
+                    <div className="flex items-start gap-2"><span className="font-bold" style={{color:'var(--text-tertiary)'}}>{i+1}</span><div className="flex-1"><p className="text-sm font-medium line-clamp-2">{p.content}</p><p className="text-xs mt-1" style={{color:'var(--text-secondary)'}}>{p.views} views · {getReactionTotal(p)} reactions</p></div></div>
                   </div>
                 ))}</div>
               )}
@@ -398,10 +415,10 @@ export default function Feed({ user, onLogout, token, refreshUser }) {
               <h3 className="font-bold mb-4">People you may know</h3>
               {state.suggestedUsers.length===0?<p className="text-sm" style={{color:'var(--text-secondary)'}}>No suggestions</p>:(
                 <div className="space-y-4">{state.suggestedUsers.map(u=>{
-                  const isFollowing = user?.following?.includes(u.id);
+                  const isFollowing = !!state.followed[u.id];
                   return (
                   <div key={u.id} className="flex items-start gap-3">
-                    <button onClick={()=>navigate(`/profile/${u.id}`)}>{u.avatar?<img src={u.avatar} alt={u.name} className="avatar-sm"/>:<div className="avatar-sm">{getInitials(u.name)}</div>}</button>
+                    <button onClick={()=>navigate(`/profile/${u.id}`)}>{u.avatar?<img src={mediaUrl(u.avatar, 'thumb')} alt={u.name} className="avatar-sm"/>:<div className="avatar-sm">{getInitials(u.name)}</div>}</button>
                     <div className="flex-1 min-w-0"><button onClick={()=>navigate(`/profile/${u.id}`)} className="font-semibold text-sm hover:text-blue-600 truncate block">{u.name}</button><p className="text-xs truncate" style={{color:'var(--text-secondary)'}}>{u.headline||'Professional'}</p><button onClick={()=>handleFollow(u.id)} className={isFollowing?"btn-primary mt-2 w-full":"btn-secondary mt-2 w-full"} style={{padding:'0.375rem 0.75rem',fontSize:'0.75rem'}} data-testid={`follow-${u.id}-button`}>{isFollowing?'Following':'Follow'}</button></div>
                   </div>
                 )})}</div>
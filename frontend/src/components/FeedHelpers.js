@@ -8,6 +8,29 @@ export const REACTIONS = [
   { type: 'insightful', icon: Lightbulb, label: 'Insightful', color: '#f09849' }
 ];
 
+export const getReactionTotal = (post) => {
+  return Object.values(post.reaction_counts || {}).reduce((sum, n) => sum + Math.max(n, 0), 0);
+};
+
+const MEDIA_API = `${process.env.REACT_APP_BACKEND_URL}/api/media`;
+const MEDIA_ID = /^[0-9a-f]{64}$/;
+
+// Image fields hold a media id; older documents may still hold a data: or http(s) URL.
+export const mediaUrl = (ref, variant) => {
+  if (!ref || !MEDIA_ID.test(ref)) return ref;
+  return `${MEDIA_API}/${ref}${variant ? `?variant=${variant}` : ''}`;
+};
+
+// List endpoints return {items, authors}; copy each author's profile onto its items for rendering.
+export const withAuthors = ({ items = [], authors = {} }) => items.map(item => {
+  if (item.actor_id) {
+    const actor = authors[item.actor_id] || {};
+    return { ...item, actor_name: actor.name, actor_avatar: actor.avatar };
+  }
+  const author = authors[item.user_id] || {};
+  return { ...item, user_name: author.name, user_headline: author.headline, user_avatar: author.avatar };
+});
+
 export const getInitials = (name) => {
   return name?.split(' ').map(n => n[0]).join('').toUpperCase().slice(0, 2) || 'U';
 };
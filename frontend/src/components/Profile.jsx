@@ -4,7 +4,7 @@ import { toast } from 'sonner';
 import { useParams, useNavigate } from 'react-router-dom';
 import { ArrowLeft, Edit2, Heart, MessageCircle, MapPin, Link as LinkIcon, Calendar, Upload } from 'lucide-react';
 import { formatDistanceToNow, format } from 'date-fns';
-import { getInitials, renderHashtags } from './FeedHelpers';
+import { getInitials, getReactionTotal, mediaUrl, renderHashtags, withAuthors } from './FeedHelpers';
 
 const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
 const API = `${BACKEND_URL}/api`;
@@ -50,7 +50,7 @@ export default function Profile({ user, onLogout, token, refreshUser }) {
   const fetchUserPosts = async () => {
     try {
       const response = await axios.get(`${API}/posts/user/${userId}`);
-      setPosts(response.data);
+      setPosts(withAuthors(response.data));
     } catch (error) {
       toast.error('Failed to load posts');
     }
@@ -90,17 +90,12 @@ export default function Profile({ user, onLogout, token, refreshUser }) {
       const wasFollowing = isFollowing;
       setProfileUser(prev => ({
         ...prev,
-        followers: wasFollowing 
-          ? prev.followers.filter(id => id !== user.id)
-          : [...(prev.followers || []), user.id]
+        is_following: !wasFollowing,
+        followers_count: (prev.followers_count || 0) + (wasFollowing ? -1 : 1)
       }));
       
       if (user) {
-        if (wasFollowing) {
-          user.following = user.following.filter(id => id !== userId);
-        } else {
-          user.following = [...(user.following || []), userId];
-        }
+        user.following_count = (user.following_count || 0) + (wasFollowing ? -1 : 1);
       }
       
       await axios.post(`${API}/users/${userId}/follow`, {}, {
@@ -182,7 +177,7 @@ export default function Profile({ user, onLogout, token, refreshUser }) {
     );
   }
 
-  const isFollowing = user?.following?.includes(userId);
+  const isFollowing = !!profileUser?.is_following;
 
   return (
     <div className="min-h-screen" style={{ background: '#f3f2ef' }}>
@@ -203,7 +198,7 @@ export default function Profile({ user, onLogout, token, refreshUser }) {
       <div className="max-w-4xl mx-auto px-4 py-8">
         <div className="premium-card rounded-xl overflow-hidden fade-in" data-testid="profile-container">
           {/* Cover Image */}
-          <div className="relative h-48" style={{ background: profileUser?.cover_image ? `url(${profileUser.cover_image}) center/cover` : 'linear-gradient(135deg, #667eea 0%, #764ba2 100%)' }}>
+          <div className="relative h-48" style={{ background: profileUser?.cover_image ? `url(${mediaUrl(profileUser.cover_image, 'medium')}) center/cover` : 'linear-gradient(135deg, #667eea 0%, #764ba2 100%)' }}>
             {isOwnProfile && (
               <>
                 <button
@@ -263,7 +258,7 @@ export default function Profile({ user, onLogout, token, refreshUser }) {
               <div className="relative">
                 {profileUser?.avatar ? (
                   <img
-                    src={profileUser.avatar}
+                    src={mediaUrl(profileUser.avatar, 'thumb')}
                     alt={profileUser.name}
                     className="avatar-xl"
                     style={{ border: '4px solid white' }}
@@ -317,13 +312,13 @@ export default function Profile({ user, onLogout, token, refreshUser }) {
             <div className="flex gap-6 mt-6 pt-6 border-t" style={{ borderColor: 'var(--border)' }}>
               <div className="text-center">
                 <p className="text-2xl font-bold" style={{ color: 'var(--text-primary)' }}>
-                  {profileUser?.followers?.length || 0}
+                  {profileUser?.followers_count || 0}
                 </p>
                 <p className="text-sm" style={{ color: 'var(--text-secondary)' }}>Followers</p>
               </div>
               <div className="text-center">
                 <p className="text-2xl font-bold" style={{ color: 'var(--text-primary)' }}>
-                  {profileUser?.following?.length || 0}
+                  {profileUser?.following_count || 0}
                 </p>
                 <p className="text-sm" style={{ color: 'var(--text-secondary)' }}>Following</p>
               </div>
@@ -458,7 +453,7 @@ export default function Profile({ user, onLogout, token, refreshUser }) {
                 <div key={post.id} className="post-card p-6 fade-in" data-testid={`user-post-${post.id}`}>
                   <div className="flex items-start gap-3">
                     {post.user_avatar ? (
-                      <img src={post.user_avatar} alt={post.user_name} className="avatar" />
+                      <img src={mediaUrl(post.user_avatar, 'thumb')} alt={post.user_name} className="avatar" />
                     ) : (
                       <div className="avatar">{getInitials(post.user_name)}</div>
                     )}
@@ -480,7 +475,7 @@ export default function Profile({ user, onLogout, token, refreshUser }) {
 
                       {post.image && (
                         <img
-                          src={post.image}
+                          src={mediaUrl(post.image, 'medium')}
                           alt="Post"
                           className="mt-4 w-full rounded-lg max-h-96 object-cover"
                         />
@@ -489,11 +484,11 @@ export default function Profile({ user, onLogout, token, refreshUser }) {
                       <div className="flex items-center gap-4 mt-4 pt-4 border-t" style={{ borderColor: 'var(--border)' }}>
                         <div className="flex items-center gap-2 text-sm" style={{ color: 'var(--text-secondary)' }}>
                           <Heart size={18} />
-                          <span>{post.reactions?.length || 0}</span>
+                          <span>{getReactionTotal(post)}</span>
                         </div>
                         <div className="flex items-center gap-2 text-sm" style={{ color: 'var(--text-secondary)' }}>
                           <MessageCircle size={18} />
-                          <span>Comments</span>
+                          <span>{post.comment_count || 0}</span>
                         </div>
                       </div>
                     </div>